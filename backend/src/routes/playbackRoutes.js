@@ -4,6 +4,7 @@ const Room = require('../models/room');
 const Message = require('../models/message');
 const { addSongToQueue, playNextSong } = require('../services/roomService');
 const { getCachedAudio } = require('../services/fileCacheService');
+const { publishRoomEvent } = require('../services/messageQueueService');
 
 
 
@@ -61,12 +62,13 @@ playbackRouter.post("/queue", userAuth, async (req, res) => {
                 const nextTrack = playingRoom.currentPlayback;
 
                 // Set Anchor Point in DB
-                await Room.findByIdAndUpdate(room._id, {
+                const startedRoom = await Room.findByIdAndUpdate(room._id, {
                     'currentPlayback.isPlaying': true,
                     'currentPlayback.lastUpdated': serverTime,
                     'currentPlayback.position': 0,
                     'currentPlayback.skipVotes': []
-                });
+                }, { new: true });
+                if (startedRoom) publishRoomEvent('updated', startedRoom);
 
                 // ⚡ Broadcast START to all clients
                 io.to(room._id.toString()).emit('playback_sync', {
@@ -266,6 +268,7 @@ playbackRouter.delete('/queue/:songId', userAuth, async (req, res) => {
 
         room.queue.splice(songIndex, 1);
         await room.save();
+        publishRoomEvent('updated', room);
 
         res.status(200).json({
             message: "Song removed.",
@@ -294,12 +297,13 @@ async function executeSkip(req, res, room) {
         const nextTrack = updatedRoom.currentPlayback;
 
         // Manually update DB to ensure Sync State is correct
-        await Room.findByIdAndUpdate(room._id, {
+        const playingRoom = await Room.findByIdAndUpdate(room._id, {
             'currentPlayback.isPlaying': true, // Auto-play next song
             'currentPlayback.lastUpdated': serverTime,
             'currentPlayback.position': 0,
             'currentPlayback.skipVotes': []
-        });
+        }, { new: true });
+        if (playingRoom) publishRoomEvent('updated', playingRoom);
 
         // 3. Emit Sync Event (Start Playing)
         io.to(roomId).emit('playback_sync', {
@@ -3,6 +3,7 @@ const { userAuth } = require("../middlewares/authMiddleware");
 const { createRoom } = require("../services/roomService")
 const Room = require("../models/room");
 const { handleUserLeaveRoom } = require("../services/roomService");
+const { publishRoomEvent } = require("../services/messageQueueService");
 
 const roomRouter = express.Router();
 
@@ -28,6 +29,7 @@ roomRouter.post("/", userAuth, async (req, res) => {
         }
 
         const newRoom = await createRoom(name, description, isPublic, hostUserId, genres);
+        publishRoomEvent('opened', newRoom);
 
         res.status(201).json({
             message: "Room created successfully",
@@ -146,6 +148,7 @@ roomRouter.put("/:code", userAuth, async (req, res) => {
         if (genres) room.genres = genres;
 
         await room.save();
+        publishRoomEvent('updated', room);
 
         res.status(200).json({
             message: "Room updated successfully",
@@ -176,6 +179,7 @@ roomRouter.delete("/:code", userAuth, async (req, res) => {
         room.activeMembers = [];
 
         await room.save();
+        publishRoomEvent('closed', room);
         res.status(200).json({ message: "Room closed successfully." });
 
     } catch (error) {
@@ -9,6 +9,8 @@ const socialRouter = express.Router();
 
 const SAFE_USER_DATA = "username displayName bio profilePic musicTaste";
 const SERVICE_URL = process.env.RECOMMENDATION_SERVICE_URL || 'http://localhost:8000';
+// Give up on the recommendation service rather than holding the request open during a burst
+const RECOMMENDATION_TIMEOUT_MS = parseInt(process.env.RECOMMENDATION_TIMEOUT_MS, 10) || 6000;
 //console.log(SERVICE_URL);
 
 socialRouter.post("/requests", userAuth, async (req, res) => {
@@ -169,10 +171,12 @@ socialRouter.get("/recommendations", userAuth, async ( req, res) => {
 
 
         let recommendedUserIds = [];
-        const recommendationServiceUrl = `${SERVICE_URL}/recommend/${loggedInUserId}?limit=${limit * 2}`;
+        // The recommendation service drops the user, their friends and anyone they have a
+        // connection request with, and over-fetches internally until it has 'limit' users.
+        const recommendationServiceUrl = `${SERVICE_URL}/recommend/${loggedInUserId}?limit=${limit}&excludeConnections=true`;
 
         try {
-            const response = await axios.get(recommendationServiceUrl);
+            const response = await axios.get(recommendationServiceUrl, { timeout: RECOMMENDATION_TIMEOUT_MS });
             recommendedUserIds = response.data.map(rec => rec.userId);
             // console.log(response)
         } catch (error) {
@@ -184,39 +188,12 @@ socialRouter.get("/recommendations", userAuth, async ( req, res) => {
             return res.status(200).json([]);
         }
 
-        const currentUser = await User.findById(loggedInUserId).select('friends');
-        const friendIds = new Set(currentUser.friends.map(friendId => friendId.toString()));
-
-        // Get IDs of users with whom there is a pending or accepted request
-        const existingRequests = await ConnectionRequest.find({
-            $or: [
-                { fromUserId : loggedInUserId },
-                { toUserId : loggedInUserId }
-            ]
-        }).select('fromUserId toUserId');
-
-        const existingConnectionIds = new Set();
-        existingRequests.forEach(req => {
-            existingConnectionIds.add(req.fromUserId.toString());
-            existingConnectionIds.add(req.toUserId.toString());
-        });
-
-        const finalUserIdsToFetch = recommendedUserIds.filter(id => 
-            id !== loggedInUserId.toString() && // Don't recommend the user to themselves
-            !friendIds.has(id) &&
-            !existingConnectionIds.has(id)
-        );
-
-        if (finalUserIdsToFetch.length === 0) {
-            return res.status(200).json([]);
-        }
-
         const recommendedUsers = await User.find({
-            '_id': { $in: finalUserIdsToFetch }
+            '_id': { $in: recommendedUserIds }
         }).select('username displayName profilePic');
 
         const userMap = new Map(recommendedUsers.map(user => [user._id.toString(), user]));
-        const sortedRecommendedUsers = finalUserIdsToFetch
+        const sortedRecommendedUsers = recommendedUserIds
             .map(id => userMap.get(id))
             .filter(user => user);
 
@@ -2,6 +2,7 @@ const Room = require("../models/room");
 const ShortUniqueId = require("short-unique-id");
 const {resolveToYoutube} = require("./youtubeService");
 const { isSongInCache } = require("./fileCacheService");
+const { publishRoomEvent } = require("./messageQueueService");
 
 
 const uid = new ShortUniqueId({length : 6});
@@ -63,6 +64,7 @@ const addSongToQueue = async (roomId, spotifyTrack, addedByUserId) => {
 
     room.queue.push(queueItem);
     await room.save();
+    publishRoomEvent('updated', room);
 
     return room; // Return updated room for Socket broadcast
 };
@@ -109,6 +111,7 @@ const playNextSong = async (roomId) => {
         // 3. Update Playback State
         room.currentPlayback = {
             trackId: nextSong.spotifyId,
+            spotifyId: nextSong.spotifyId,
             youtubeId: nextSong.youtubeId,
             name: nextSong.name,
             artist: nextSong.artist,
@@ -122,6 +125,7 @@ const playNextSong = async (roomId) => {
     }
 
     await room.save();
+    publishRoomEvent('updated', room);
     return room;
 };
 
@@ -162,6 +166,7 @@ const handleUserLeaveRoom = async (roomId, userId, io) => {
         }
 
         await room.save();
+        if (!room.isActive) publishRoomEvent('closed', room);
 
         // 3. Broadcast Update to Room (Only if room is still active)
         if (io && room.isActive) {
@@ -1,5 +1,6 @@
 const Room = require("../models/room");
 const { addSongToQueue, playNextSong } = require("../services/roomService");
+const { publishRoomEvent } = require("../services/messageQueueService");
 const Message = require("../models/message")
 
 const playbackHandler = (io, socket) => {
@@ -38,12 +39,13 @@ const playbackHandler = (io, socket) => {
                     const nextTrack = room.currentPlayback;
 
                     // B. Set Anchor Point (Start Playing)
-                    await Room.findByIdAndUpdate(roomId, {
+                    const playingRoom = await Room.findByIdAndUpdate(roomId, {
                         'currentPlayback.isPlaying': true,
                         'currentPlayback.isPaused': false, // Ensure it's not paused
                         'currentPlayback.lastUpdated': serverTime,
                         'currentPlayback.position': 0
-                    });
+                    }, { new: true });
+                    if (playingRoom) publishRoomEvent('updated', playingRoom);
 
                     // C. Broadcast PLAY immediately
                     io.to(roomId).emit('playback_sync', {
@@ -89,12 +91,13 @@ const playbackHandler = (io, socket) => {
             console.log(`▶️ Play ${roomId} | Anchor: ${seekTime}s`);
 
             // Update DB State
-            await Room.findByIdAndUpdate(roomId, {
+            const room = await Room.findByIdAndUpdate(roomId, {
                 'currentPlayback.isPlaying': true,
                 'currentPlayback.youtubeId': youtubeId,
                 'currentPlayback.lastUpdated': serverTime, // T0
                 'currentPlayback.position': seekTime || 0  // P0
-            });
+            }, { new: true });
+            if (room) publishRoomEvent('updated', room);
 
             // Broadcast Sync Command
             io.to(roomId).emit('playback_sync', {
@@ -114,11 +117,12 @@ const playbackHandler = (io, socket) => {
         try {
             console.log(`⏸️ Pause ${roomId} | Frozen at: ${seekTime}s`);
 
-            await Room.findByIdAndUpdate(roomId, {
+            const room = await Room.findByIdAndUpdate(roomId, {
                 'currentPlayback.isPlaying': false,
                 'currentPlayback.lastUpdated': Date.now(),
                 'currentPlayback.position': seekTime || 0
-            });
+            }, { new: true });
+            if (room) publishRoomEvent('updated', room);
 
             io.to(roomId).emit('playback_sync', { 
                 action: 'pause', 
@@ -142,12 +146,13 @@ const playbackHandler = (io, socket) => {
                 const serverTime = Date.now(); 
                 console.log(`🚀 Playing Next: ${nextTrack.name}`);
 
-                await Room.findByIdAndUpdate(roomId, {
+                const playingRoom = await Room.findByIdAndUpdate(roomId, {
                     'currentPlayback.isPlaying': true,
                     'currentPlayback.lastUpdated': serverTime,
                     'currentPlayback.position': 0,
                     'currentPlayback.skipVotes': [] 
-                });
+                }, { new: true });
+                if (playingRoom) publishRoomEvent('updated', playingRoom);
 
                 // 1. Play new song
                 io.to(roomId).emit('playback_sync', {
@@ -1,62 +1,153 @@
 import os
-from flask import Flask, jsonify, request
+import time
+from flask import Flask, Response, g, jsonify, request
 from dotenv import load_dotenv
 
 # Import the service that does all the work
-from services.pinecone_service import pinecone_service
+from services.recommender import InvalidRequest, parse_recommend_args, parse_room_args, parse_batch_body, recommend, recommend_batch, recommend_rooms
+from services.recommendation_cache import recommendation_cache, start_invalidation_listener
+from services.room_index import room_index, room_user_vectors, start_room_listener
+from services.lifecycle import readiness, start_background_warm_up
+from services.logging_config import get_logger
+from services.metrics import registry, API_REQUEST_SECONDS, CONTENT_TYPE
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Initialize the Flask app
 app = Flask(__name__)
+logger = get_logger(__name__)
+
+# Drop cached recommendations whenever the worker writes a new vector for a user
+start_invalidation_listener(recommendation_cache)
+# Load the active rooms and keep them up to date from room events
+start_room_listener(room_index, room_user_vectors)
+# Connect and load data in the background; requests that arrive first connect lazily
+start_background_warm_up()
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        API_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            # The route template, not the raw path, so user IDs don't become label values
+            endpoint=request.url_rule.rule if request.url_rule else "unmatched",
+            method=request.method,
+            status=response.status_code,
+        )
+    return response
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """A simple health check endpoint to confirm the service is running."""
+    """
+    Liveness: confirms the process is up and serving. Never touches a dependency,
+    so a slow database can't get a healthy process restarted.
+    """
     return jsonify({"status": "ok"}), 200
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness: 200 once the process is warmed up and its dependencies answer,
+    503 otherwise, so a load balancer only routes traffic to ready processes.
+    """
+    ready, checks = readiness()
+    status_code = 200 if ready else 503
+    return jsonify({"status": "ready" if ready else "not ready", "checks": checks}), status_code
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus metrics for this process: request latency, per-stage index timings
+    and where recommendations were served from.
+    """
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
 @app.route('/recommend/<string:user_id>', methods=['GET'])
 def get_recommendations(user_id):
     """
     The main recommendation endpoint.
     Takes a user_id and returns a list of recommended user IDs and their scores.
-    """
-    # Get the 'limit' query parameter, with a default of 50
-    try:
-        limit = int(request.args.get('limit', 50))
-    except ValueError:
-        return jsonify({"error": "Invalid 'limit' parameter. Must be an integer."}), 400
 
+    Optional query parameters:
+        exclude: Comma-separated user IDs that must not be recommended.
+        excludeConnections: If true, the user's friends and anyone they have a
+            connection request with are excluded as well.
+    """
     if not user_id:
         return jsonify({"error": "user_id parameter is required."}), 400
+    try:
+        limit, explicit_ids, exclude_connections = parse_recommend_args(request.args)
+    except InvalidRequest as e:
+        return jsonify({"error": str(e)}), 400
 
-    print(f"Received recommendation request for user: {user_id} with limit: {limit}")
+    logger.debug("Received recommendation request", extra={"userId": user_id, "limit": limit})
 
     try:
-        # 1. Use our existing Pinecone service to get the recommendations
-        recommendations = pinecone_service.query_similar_users(
-            user_id=user_id,
-            top_k=limit + 1 # Fetch one extra in case the user themselves is in the results
-        )
+        final_recommendations = recommend(user_id, limit, explicit_ids, exclude_connections)
+        # Return the clean list as a JSON response
+        return jsonify(final_recommendations), 200
 
-        # 2. Filter out the user themselves from the recommendation list
-        # The most similar user to 'user_id' will always be 'user_id' with a score of 1.0
-        filtered_recommendations = [rec for rec in recommendations if rec["userId"] != user_id]
+    except Exception as e:
+        logger.exception("Recommendation query failed", extra={"userId": user_id})
+        return jsonify({"error": "An internal server error occurred."}), 500
 
-        # Ensure we only return the number of results requested by the limit
-        final_recommendations = filtered_recommendations[:limit]
+@app.route('/recommend/rooms/<string:user_id>', methods=['GET'])
+def get_room_recommendations(user_id):
+    """
+    The active public rooms that best match a user's taste, for the active-rooms panel.
+    Returns a list of rooms ('roomId', 'code', 'name', 'genres') and their scores.
 
-        # 3. Return the clean list as a JSON response
-        return jsonify(final_recommendations), 200
+    Optional query parameters:
+        limit: The number of rooms to return (default 10).
+    """
+    try:
+        limit = parse_room_args(request.args)
+    except InvalidRequest as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        return jsonify(recommend_rooms(user_id, limit)), 200
+
+    except Exception as e:
+        logger.exception("Room recommendation failed", extra={"userId": user_id})
+        return jsonify({"error": "An internal server error occurred."}), 500
+
+@app.route('/recommend/batch', methods=['POST'])
+def get_batch_recommendations():
+    """
+    Recommendations for many users in one call.
+    Expects a JSON body like {"userIds": ["...", "..."], "limit": 20} and returns
+    a mapping of each user ID to its list of recommended user IDs and scores.
+
+    The body may also contain "exclude" (a mapping of user ID to the IDs that must
+    not be recommended to them) and "excludeConnections" (true to exclude each
+    user's friends and connection requests), as in the single-user endpoint.
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        user_ids, limit, exclude, exclude_connections = parse_batch_body(body)
+    except InvalidRequest as e:
+        return jsonify({"error": str(e)}), 400
+
+    logger.debug("Received batch recommendation request", extra={"users": len(user_ids), "limit": limit})
+
+    try:
+        results = recommend_batch(user_ids, limit, exclude, exclude_connections)
+        return jsonify(results), 200
 
     except Exception as e:
-        print(f"An error occurred during recommendation query for user {user_id}: {e}")
+        logger.exception("Batch recommendation query failed")
         return jsonify({"error": "An internal server error occurred."}), 500
 
 if __name__ == '__main__':
     # Get port from environment variable or default to 8000
     port = int(os.environ.get('PORT', 8000))
-    # Run the app. 'debug=True' is helpful for development.
-    # Use a production-ready server like Gunicorn for deployment.
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    # The Flask development server, for local use only. Deployments run Gunicorn
+    # or the async API (see start.sh). Set FLASK_DEBUG=true for the debugger and reloader.
+    app.run(host='0.0.0.0', port=port, debug=os.environ.get('FLASK_DEBUG', 'false').lower() == 'true')
\ No newline at end of file
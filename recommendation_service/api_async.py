@@ -0,0 +1,185 @@
+"""
+The recommendation API on an async server stack (Quart on Hypercorn).
+
+It serves the same routes and responses as api.py, but every request is a
+coroutine on one event loop: waiting on Pinecone or MongoDB costs no thread,
+so one process keeps hundreds of requests in flight. Past API_MAX_IN_FLIGHT
+it answers 503 at once instead of queueing, and a request that takes longer
+than API_REQUEST_TIMEOUT_SECONDS gets a 504, so tail latency stays bounded
+during bursts.
+
+Run with (start.sh does this when API_SERVER=async):
+    hypercorn api_async:app --bind 0.0.0.0:8000
+"""
+import os
+import time
+import asyncio
+import functools
+
+from quart import Quart, Response, g, jsonify, request
+from dotenv import load_dotenv
+
+from services.recommender import (
+    InvalidRequest, parse_recommend_args, parse_room_args, parse_batch_body, recommend_async, recommend_batch_async, recommend_rooms_async,
+)
+from services.recommendation_cache import recommendation_cache, start_invalidation_listener
+from services.room_index import room_index, room_user_vectors, start_room_listener
+from services.vector_index import vector_index
+from services.lifecycle import readiness, start_background_warm_up
+from services.logging_config import get_logger
+from services.metrics import registry, API_REQUEST_SECONDS, API_IN_FLIGHT, API_REJECTED_REQUESTS, CONTENT_TYPE
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+# Recommendation requests served at once by this process; any more get an immediate 503
+API_MAX_IN_FLIGHT = int(os.getenv("API_MAX_IN_FLIGHT", 256))
+# A request still running after this long is abandoned with a 504
+API_REQUEST_TIMEOUT_SECONDS = float(os.getenv("API_REQUEST_TIMEOUT_SECONDS", 5))
+
+# Initialize the Quart app
+app = Quart(__name__)
+logger = get_logger(__name__)
+
+# Drop cached recommendations whenever the worker writes a new vector for a user
+start_invalidation_listener(recommendation_cache)
+# Load the active rooms and keep them up to date from room events
+start_room_listener(room_index, room_user_vectors)
+# Connect and load data in the background; requests that arrive first connect lazily
+start_background_warm_up()
+
+# Only touched from the event loop, so no lock is needed
+_in_flight = 0
+
+
+def shed_load(view):
+    """
+    Applies the concurrency limit and the timeout to a view. Rejected requests
+    cost almost nothing, so a burst can't build a queue that every later
+    request would have to wait through.
+    """
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        global _in_flight
+        if _in_flight >= API_MAX_IN_FLIGHT:
+            API_REJECTED_REQUESTS.inc(reason="shed")
+            return jsonify({"error": "The service is at capacity. Retry shortly."}), 503, {"Retry-After": "1"}
+
+        _in_flight += 1
+        API_IN_FLIGHT.inc()
+        try:
+            return await asyncio.wait_for(view(*args, **kwargs), API_REQUEST_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            API_REJECTED_REQUESTS.inc(reason="timeout")
+            logger.warning("Request timed out", extra={"path": request.path, "timeoutSeconds": API_REQUEST_TIMEOUT_SECONDS})
+            return jsonify({"error": "The request timed out."}), 504
+        finally:
+            _in_flight -= 1
+            API_IN_FLIGHT.dec()
+    return wrapper
+
+
+@app.before_request
+async def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+async def record_request_latency(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        API_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            # The route template, not the raw path, so user IDs don't become label values
+            endpoint=request.url_rule.rule if request.url_rule else "unmatched",
+            method=request.method,
+            status=response.status_code,
+        )
+    return response
+
+
+@app.after_serving
+async def close_connections():
+    await vector_index.close_async()
+
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """Liveness: confirms the process is up and serving, without touching a dependency."""
+    return jsonify({"status": "ok"}), 200
+
+
+@app.route('/ready', methods=['GET'])
+async def readiness_check():
+    """Readiness: 200 once the process is warmed up and its dependencies answer, 503 otherwise."""
+    # The checks make blocking round trips, so they run off the event loop
+    ready, checks = await asyncio.to_thread(readiness)
+    status_code = 200 if ready else 503
+    return jsonify({"status": "ready" if ready else "not ready", "checks": checks}), status_code
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Prometheus metrics for this process."""
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
+@app.route('/recommend/<string:user_id>', methods=['GET'])
+@shed_load
+async def get_recommendations(user_id):
+    """The main recommendation endpoint; see api.get_recommendations for the parameters."""
+    if not user_id:
+        return jsonify({"error": "user_id parameter is required."}), 400
+    try:
+        limit, explicit_ids, exclude_connections = parse_recommend_args(request.args)
+    except InvalidRequest as e:
+        return jsonify({"error": str(e)}), 400
+
+    logger.debug("Received recommendation request", extra={"userId": user_id, "limit": limit})
+
+    try:
+        final_recommendations = await recommend_async(user_id, limit, explicit_ids, exclude_connections)
+        return jsonify(final_recommendations), 200
+
+    except Exception:
+        logger.exception("Recommendation query failed", extra={"userId": user_id})
+        return jsonify({"error": "An internal server error occurred."}), 500
+
+
+@app.route('/recommend/rooms/<string:user_id>', methods=['GET'])
+@shed_load
+async def get_room_recommendations(user_id):
+    """Rooms matching a user's taste; see api.get_room_recommendations."""
+    try:
+        limit = parse_room_args(request.args)
+    except InvalidRequest as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        return jsonify(await recommend_rooms_async(user_id, limit)), 200
+
+    except Exception:
+        logger.exception("Room recommendation failed", extra={"userId": user_id})
+        return jsonify({"error": "An internal server error occurred."}), 500
+
+
+@app.route('/recommend/batch', methods=['POST'])
+@shed_load
+async def get_batch_recommendations():
+    """Recommendations for many users in one call; see api.get_batch_recommendations for the body."""
+    body = await request.get_json(silent=True) or {}
+    try:
+        user_ids, limit, exclude, exclude_connections = parse_batch_body(body)
+    except InvalidRequest as e:
+        return jsonify({"error": str(e)}), 400
+
+    logger.debug("Received batch recommendation request", extra={"users": len(user_ids), "limit": limit})
+
+    try:
+        results = await recommend_batch_async(user_ids, limit, exclude, exclude_connections)
+        return jsonify(results), 200
+
+    except Exception:
+        logger.exception("Batch recommendation query failed")
+        return jsonify({"error": "An internal server error occurred."}), 500
@@ -0,0 +1,303 @@
+"""
+Benchmarks the recommendation service end to end, with no network: MongoDB
+and RabbitMQ are replaced by in-memory stand-ins and vectors go into a local
+index in a temporary directory. Tastes are synthetic, with Zipf-distributed
+popularity (see benchmarks/synthetic.py), and reproducible from --seed.
+
+Stages, run in this order against the same growing vocabulary and index:
+    create_user_vector       vectorizing one taste
+    process_message_payload  the blocking worker's per-message path
+    consumer_loop            worker.consume_in_batches draining a queue (latency is delivery to ack)
+    resync                   the same, re-sending tastes the worker already has, reordered
+                             as a periodic Spotify re-sync would; --resync-changed of them
+                             also swap one track, the rest should be skipped as unchanged
+    recommend                GET /recommend/<user_id> through the Flask app
+
+Each stage reports throughput and p50/p95/p99 latency from a timed pass,
+and peak traced memory from a second, smaller pass under tracemalloc
+(tracing slows everything down, so it is kept out of the timings).
+
+Results can be saved as a JSON baseline and compared with a previous one;
+any stage that got slower, or uses more memory, by more than --threshold is
+flagged and the exit status is 1.
+
+The service's environment variables (VECTORIZER, EMBEDDING_PATH,
+RECOMMENDATION_CACHE_SIZE, ...) apply as usual and are recorded in the results.
+Without EMBEDDING_PATH, the local index uses a random projection of
+--embedding-dim dimensions.
+
+Usage (from the recommendation_service directory):
+    python -m benchmarks.run --save benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json
+    python -m benchmarks.run --users 5000 --batch-size 64 --mongo-latency-ms 2
+"""
+import os
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks.synthetic import TasteGenerator
+
+# Settings recorded with the results, so a comparison can tell when it isn't like for like
+RECORDED_SETTINGS = (
+    "VECTORIZER", "EMBEDDING_PATH", "RECOMMENDATION_CACHE_SIZE", "WORKER_BATCH_WINDOW_SECONDS", "TASTE_CHANGE_DETECTION",
+    "VOCAB_SNAPSHOT_PATH",
+)
+
+
+def summarize(latencies: list, seconds: float) -> dict:
+    """Throughput and latency percentiles (in milliseconds) for one timed pass."""
+    latencies_ms = np.asarray(latencies) * 1000.0
+    return {
+        "count": len(latencies),
+        "seconds": round(seconds, 4),
+        "throughput_per_second": round(len(latencies) / seconds, 2) if seconds else None,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 4),
+    }
+
+
+def time_each(items: list, fn) -> dict:
+    """Calls fn on every item and summarizes the per-call latencies."""
+    latencies = []
+    started = time.perf_counter()
+    for item in items:
+        call_started = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def peak_memory_mb(fn) -> float:
+    """Runs fn under tracemalloc and returns the peak traced memory in MiB."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / (1 << 20), 3)
+
+
+class Benchmark:
+    """
+    Sets up the stand-ins, imports the service against them and runs the stages.
+    Service modules read their configuration at import time, so they are
+    imported only here, after the environment is prepared.
+    """
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.TemporaryDirectory(prefix="rhythm-bench-")
+        # Recorded as given, before the defaults below are filled in
+        self.settings = {name: os.getenv(name, "") for name in RECORDED_SETTINGS}
+        if not os.getenv("EMBEDDING_PATH"):
+            # The local backend indexes embeddings; a random projection needs no fitting
+            from core.embedding import Projection
+            embedding_path = os.path.join(self.workdir.name, "embedding.npz")
+            Projection.random(args.embedding_dim, seed=args.seed).save(embedding_path)
+            os.environ["EMBEDDING_PATH"] = embedding_path
+        os.environ.update({
+            "VECTOR_INDEX_BACKEND": "local",
+            "LOCAL_INDEX_PATH": os.path.join(self.workdir.name, "user_vectors.npz"),
+            "NEIGHBOR_TABLE_PATH": "",
+            "RABBITMQ_URL": "",
+            "WARM_UP_ON_START": "false",
+            "WORKER_BATCH_SIZE": str(args.batch_size),
+            "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        })
+
+        from benchmarks import standins
+        standins.install_mongo(latency=args.mongo_latency_ms / 1000.0)
+        import api
+        import worker
+        from core.vectorization import create_user_vector
+
+        self.standins = standins
+        self.api = api
+        self.worker = worker
+        self.create_user_vector = create_user_vector
+        self.generator = TasteGenerator(seed=args.seed, exponent=args.zipf_exponent)
+        self.random = random.Random(args.seed)
+        self.next_user = 0
+        self.sent = []
+
+    def payloads(self, n: int, to_worker: bool = True) -> list:
+        """Payloads for n users that haven't been seen yet. 'to_worker' makes them eligible for resync."""
+        payloads = self.generator.payloads(n, first_user=self.next_user)
+        self.next_user += n
+        if to_worker:
+            self.sent.extend(payloads)
+        return payloads
+
+    def resync_payloads(self, n: int) -> list:
+        """Payloads re-sending n known users' tastes with shuffled lists and a new 'updatedAt'."""
+        payloads = []
+        for payload in self.random.sample(self.sent, min(n, len(self.sent))):
+            music_taste = {key: list(values) for key, values in payload["musicTaste"].items()}
+            for values in music_taste.values():
+                self.random.shuffle(values)
+            if music_taste["topTracks"] and self.random.random() < self.args.resync_changed:
+                music_taste["topTracks"][0] = self.generator.taste()["topTracks"][0]
+            music_taste["updatedAt"] = datetime.now(timezone.utc).isoformat()
+            payloads.append({"userId": payload["userId"], "musicTaste": music_taste})
+        return payloads
+
+    # --- Stages ---
+    # Each takes a list of payloads and returns its latency summary.
+
+    def vectorize(self, payloads: list) -> dict:
+        run = self.worker.event_loop.run_until_complete
+        return time_each(payloads, lambda payload: run(self.create_user_vector(payload["musicTaste"])))
+
+    def process_messages(self, payloads: list) -> dict:
+        return time_each(payloads, self.worker.process_message_payload)
+
+    def consume(self, payloads: list) -> dict:
+        channel = self.standins.InMemoryChannel()
+        for payload in payloads:
+            channel.enqueue(json.dumps(payload).encode())
+        started = time.perf_counter()
+        self.worker.consume_in_batches(channel)
+        seconds = time.perf_counter() - started
+        self.worker.flush_all()
+        return summarize(channel.latencies, seconds)
+
+    def recommend(self, user_ids: list) -> dict:
+        client = self.api.app.test_client()
+
+        def get(user_id):
+            response = client.get(f"/recommend/{user_id}?limit={self.args.limit}")
+            if response.status_code != 200:
+                raise RuntimeError(f"/recommend/{user_id} returned {response.status_code}: {response.get_data(as_text=True)}")
+        return time_each(user_ids, get)
+
+    def run(self) -> dict:
+        args = self.args
+        stages = [
+            ("create_user_vector", self.vectorize, lambda n: self.payloads(n, to_worker=False)),
+            ("process_message_payload", self.process_messages, lambda n: self.payloads(n)),
+            ("consumer_loop", self.consume, lambda n: self.payloads(n)),
+            ("resync", self.consume, lambda n: self.resync_payloads(n)),
+            # Requests come from users already in the index, picked uniformly
+            ("recommend", self.recommend, lambda n: [f"{self.random.randrange(self.next_user):024x}" for _ in range(n)]),
+        ]
+        sizes = {"create_user_vector": args.users, "process_message_payload": args.users,
+                 "consumer_loop": args.users, "resync": args.users, "recommend": args.requests}
+
+        results = {}
+        for name, stage, make_items in stages:
+            items = make_items(sizes[name])
+            print(f"Running {name} ({len(items)} items)...", file=sys.stderr)
+            results[name] = stage(items)
+
+        # Memory passes come after every timed pass, so they can't disturb the timings
+        for name, stage, make_items in stages:
+            items = make_items(min(sizes[name], args.memory_items))
+            results[name]["peak_memory_mb"] = peak_memory_mb(lambda: stage(items))
+            results[name]["memory_items"] = len(items)
+
+        self.workdir.cleanup()
+        return {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "config": {
+                "seed": args.seed,
+                "users": args.users,
+                "requests": args.requests,
+                "limit": args.limit,
+                "batch_size": args.batch_size,
+                "resync_changed": args.resync_changed,
+                "zipf_exponent": args.zipf_exponent,
+                "mongo_latency_ms": args.mongo_latency_ms,
+                "settings": self.settings,
+                "embedding": self.worker.vector_index.projection.version,
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+            },
+            "stages": results,
+        }
+
+
+def find_regressions(current: dict, baseline: dict, threshold: float) -> list:
+    """
+    Compares two results and describes every stage metric that got worse by
+    more than 'threshold' (a fraction: 0.2 means 20%).
+    """
+    regressions = []
+    for name, stage in current["stages"].items():
+        before = baseline["stages"].get(name)
+        if before is None:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "peak_memory_mb"):
+            if before.get(metric) and stage.get(metric) is not None and stage[metric] > before[metric] * (1 + threshold):
+                regressions.append(f"{name}: {metric} {before[metric]} -> {stage[metric]} (+{stage[metric] / before[metric] - 1:.0%})")
+        metric = "throughput_per_second"
+        if before.get(metric) and stage.get(metric) is not None and stage[metric] < before[metric] * (1 - threshold):
+            regressions.append(f"{name}: {metric} {before[metric]} -> {stage[metric]} ({stage[metric] / before[metric] - 1:.0%})")
+    return regressions
+
+
+def print_report(results: dict):
+    print(f"{'stage':<24} {'items':>7} {'per sec':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak MiB':>9}")
+    for name, stage in results["stages"].items():
+        print(
+            f"{name:<24} {stage['count']:>7} {stage['throughput_per_second']:>10.1f} {stage['p50_ms']:>9.3f} "
+            f"{stage['p95_ms']:>9.3f} {stage['p99_ms']:>9.3f} {stage['peak_memory_mb']:>9.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vectorization, the worker and the API with in-memory stand-ins.")
+    parser.add_argument("--users", type=int, default=2000, help="Tastes per worker stage (each stage adds new users).")
+    parser.add_argument("--requests", type=int, default=2000, help="Recommendation requests.")
+    parser.add_argument("--limit", type=int, default=10, help="Recommendations per request.")
+    parser.add_argument("--embedding-dim", type=int, default=256, help="Random projection size, unless EMBEDDING_PATH is set.")
+    parser.add_argument("--batch-size", type=int, default=32, help="WORKER_BATCH_SIZE for the consumer loop.")
+    parser.add_argument("--resync-changed", type=float, default=0.1, help="Fraction of re-synced tastes that really changed.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--zipf-exponent", type=float, default=1.1)
+    parser.add_argument("--mongo-latency-ms", type=float, default=0.0, help="Simulated round trip of every async Mongo call.")
+    parser.add_argument("--memory-items", type=int, default=200, help="Items per stage in the tracemalloc pass.")
+    parser.add_argument("--save", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="A previous results file to check for regressions.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative change that counts as a regression.")
+    args = parser.parse_args()
+
+    results = Benchmark(args).run()
+    print_report(results)
+
+    if args.save:
+        directory = os.path.dirname(args.save)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to '{args.save}'.")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["config"] != results["config"]:
+            print("Warning: the baseline was recorded with a different configuration; differences may not be regressions.")
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions against '{args.compare}' (threshold {args.threshold:.0%}):")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions against '{args.compare}' (threshold {args.threshold:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
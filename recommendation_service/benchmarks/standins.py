@@ -0,0 +1,288 @@
+"""
+In-memory stand-ins for MongoDB and RabbitMQ, so benchmarks run on any
+machine with no network. They implement only what the service calls, with
+the same semantics (unique indexes, '$inc' counters, multiple acks).
+
+The vector index needs no stand-in: benchmarks use the local backend.
+"""
+import time
+import asyncio
+from collections import deque
+from types import SimpleNamespace
+from typing import NamedTuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from services import mongo_client, taste_state
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def _matches(doc: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(_matches(doc, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict) and "$in" in condition:
+            if doc.get(field) not in condition["$in"]:
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+def _project(doc: dict, projection: dict) -> dict:
+    if not projection:
+        return dict(doc)
+    fields = [field for field, include in projection.items() if include]
+    projected = {field: doc[field] for field in fields if field in doc}
+    if projection.get("_id", 1) and "_id" in doc:
+        projected["_id"] = doc["_id"]
+    return projected
+
+
+class ReplaceOperation(NamedTuple):
+    """
+    The stand-ins' own bulk_write replacement. pymongo's ReplaceOne keeps its
+    fields private, so install_mongo has the service build these instead.
+    """
+    filter: dict
+    replacement: dict
+    upsert: bool = False
+
+
+class InMemoryCollection:
+    """
+    A MongoDB collection held in a dict. Equality, '$in' and '$or' queries
+    are supported; lookups on a uniquely indexed field are O(1).
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._docs = {}           # _id -> document
+        self._unique = {}         # field -> {value: _id}
+        self._next_id = 0
+
+    def create_index(self, field: str, unique: bool = False):
+        if unique and field not in self._unique:
+            self._unique[field] = {doc[field]: _id for _id, doc in self._docs.items() if field in doc}
+        return f"{field}_1"
+
+    def _candidates(self, query: dict):
+        # Use a unique index when the query is a plain lookup on an indexed field
+        if len(query) == 1:
+            field, condition = next(iter(query.items()))
+            index = self._unique.get(field)
+            if index is not None:
+                values = condition["$in"] if isinstance(condition, dict) and "$in" in condition else [condition]
+                return [self._docs[index[value]] for value in values if value in index]
+            if field == "_id":
+                values = condition["$in"] if isinstance(condition, dict) and "$in" in condition else [condition]
+                return [self._docs[value] for value in values if value in self._docs]
+        return list(self._docs.values())
+
+    def find(self, query: dict = None, projection: dict = None):
+        query = query or {}
+        return [_project(doc, projection) for doc in self._candidates(query) if _matches(doc, query)]
+
+    def find_one(self, query: dict = None, projection: dict = None):
+        found = self.find(query, projection)
+        return found[0] if found else None
+
+    def _insert(self, doc: dict):
+        doc = dict(doc)
+        if "_id" not in doc:
+            doc["_id"] = self._next_id
+            self._next_id += 1
+        for field, index in self._unique.items():
+            if doc.get(field) in index:
+                raise DuplicateKeyError(f"Duplicate {field}: {doc[field]}", code=DUPLICATE_KEY_ERROR)
+        self._docs[doc["_id"]] = doc
+        for field, index in self._unique.items():
+            if field in doc:
+                index[doc[field]] = doc["_id"]
+
+    def insert_many(self, docs: list, ordered: bool = True):
+        write_errors = []
+        for position, doc in enumerate(docs):
+            try:
+                self._insert(doc)
+            except DuplicateKeyError as e:
+                write_errors.append({"index": position, "code": DUPLICATE_KEY_ERROR, "errmsg": str(e)})
+                if ordered:
+                    break
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors, "nInserted": len(docs) - len(write_errors)})
+
+    def bulk_write(self, requests: list, ordered: bool = True):
+        # Only replacements by _id are used by the service
+        for request in requests:
+            if not isinstance(request, ReplaceOperation):
+                raise NotImplementedError(f"Unsupported bulk operation: {request!r}")
+            existing = self.find_one(request.filter)
+            if existing is None and not request.upsert:
+                continue
+            _id = existing["_id"] if existing is not None else request.filter["_id"]
+            self._docs.pop(_id, None)
+            for index in self._unique.values():
+                for value in [value for value, indexed_id in index.items() if indexed_id == _id]:
+                    del index[value]
+            self._insert(dict(request.replacement, _id=_id))
+
+    def find_one_and_update(self, query: dict, update: dict, upsert: bool = False, return_document=ReturnDocument.BEFORE):
+        existing = self.find_one(query)
+        if existing is None:
+            if not upsert:
+                return None
+            self._insert({field: value for field, value in query.items() if not isinstance(value, dict)})
+            existing = self.find_one(query)
+            before = None
+            for field, value in update.get("$setOnInsert", {}).items():
+                self._docs[existing["_id"]][field] = value
+        else:
+            before = existing
+        doc = self._docs[existing["_id"]]
+        for field, amount in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + amount
+        for field, value in update.get("$set", {}).items():
+            doc[field] = value
+        return dict(doc) if return_document == ReturnDocument.AFTER else before
+
+
+class AsyncInMemoryCollection:
+    """
+    The async face of an InMemoryCollection, for the worker's event loop.
+    Every call can be delayed by 'latency' seconds to model a database round trip.
+    """
+    def __init__(self, collection: InMemoryCollection, latency: float = 0.0):
+        self._collection = collection
+        self.latency = latency
+        self.name = collection.name
+
+    async def _round_trip(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def find(self, query: dict = None, projection: dict = None):
+        async def cursor():
+            await self._round_trip()
+            for doc in self._collection.find(query, projection):
+                yield doc
+        return cursor()
+
+    async def find_one(self, query: dict = None, projection: dict = None):
+        await self._round_trip()
+        return self._collection.find_one(query, projection)
+
+    async def insert_many(self, docs: list, ordered: bool = True):
+        await self._round_trip()
+        return self._collection.insert_many(docs, ordered=ordered)
+
+    async def bulk_write(self, requests: list, ordered: bool = True):
+        await self._round_trip()
+        return self._collection.bulk_write(requests, ordered=ordered)
+
+    async def find_one_and_update(self, query: dict, update: dict, upsert: bool = False, return_document=ReturnDocument.BEFORE):
+        await self._round_trip()
+        return self._collection.find_one_and_update(query, update, upsert=upsert, return_document=return_document)
+
+
+class InMemoryDatabase:
+    def __init__(self, collections: dict, asynchronous: bool, latency: float):
+        self._collections = collections
+        self._asynchronous = asynchronous
+        self._latency = latency
+
+    def get_collection(self, name: str):
+        collection = self._collections.setdefault(name, InMemoryCollection(name))
+        return AsyncInMemoryCollection(collection, self._latency) if self._asynchronous else collection
+
+
+class InMemoryMongoClient:
+    """Stands in for MongoClient (or AsyncMongoClient) over collections shared with its sibling client."""
+    def __init__(self, collections: dict, asynchronous: bool = False, latency: float = 0.0):
+        self._database = InMemoryDatabase(collections, asynchronous, latency)
+        self.admin = SimpleNamespace(command=lambda name: {"ok": 1.0})
+
+    def get_database(self, name: str) -> InMemoryDatabase:
+        return self._database
+
+
+def install_mongo(latency: float = 0.0) -> dict:
+    """
+    Points services.mongo_client at in-memory clients, so every get_collection
+    and get_async_collection call in the process uses them, and creates the
+    vocabulary schema. Call before anything has connected.
+
+    Args:
+        latency: Seconds added to every async call, to model a database round trip.
+
+    Returns:
+        The collections by name, shared by the sync and async clients.
+    """
+    collections = {}
+    mongo_client._client = InMemoryMongoClient(collections)
+    mongo_client._async_client = InMemoryMongoClient(collections, asynchronous=True, latency=latency)
+    # The only bulk_write caller; its replacements must be ones this collection can read
+    taste_state.ReplaceOne = ReplaceOperation
+    mongo_client.ensure_schema()
+    return collections
+
+
+class InMemoryChannel:
+    """
+    Stands in for a blocking pika channel bound to a single queue: messages are
+    published into it up front and worker.consume_in_batches drains it.
+    Records when each message was delivered and acknowledged, and which
+    messages were rejected.
+    """
+    def __init__(self):
+        self._queue = deque()
+        self._unacked = {}         # delivery tag -> (delivered at, body, properties)
+        self._next_tag = 1
+        self.prefetch_count = 0
+        self.published = []        # what the worker published (cache invalidations)
+        self.latencies = []        # seconds from delivery to ack, per message
+        self.rejected = []         # bodies of the messages nacked without requeueing
+
+    def enqueue(self, body: bytes, headers: dict = None):
+        self._queue.append((body, SimpleNamespace(headers=headers or {}, timestamp=None)))
+
+    def basic_qos(self, prefetch_count: int = 0):
+        self.prefetch_count = prefetch_count
+
+    def basic_publish(self, exchange: str, routing_key: str, body, properties=None):
+        self.published.append((exchange, routing_key, body))
+
+    def basic_ack(self, delivery_tag: int, multiple: bool = False):
+        acked_at = time.perf_counter()
+        tags = [tag for tag in self._unacked if tag <= delivery_tag] if multiple else [delivery_tag]
+        for tag in tags:
+            self.latencies.append(acked_at - self._unacked.pop(tag)[0])
+
+    def basic_nack(self, delivery_tag: int, multiple: bool = False, requeue: bool = True):
+        tags = [tag for tag in self._unacked if tag <= delivery_tag] if multiple else [delivery_tag]
+        for tag in tags:
+            _, body, properties = self._unacked.pop(tag)
+            if requeue:
+                self._queue.appendleft((body, properties))
+            else:
+                self.rejected.append(body)
+
+    def consume(self, queue: str, inactivity_timeout: float = None):
+        """
+        Yields (method, properties, body) like pika's consume(). Yields
+        (None, None, None) after 'inactivity_timeout' seconds without a message,
+        and stops once the queue is drained and every message is acknowledged.
+        """
+        while self._queue or self._unacked:
+            if self._queue and (not self.prefetch_count or len(self._unacked) < self.prefetch_count):
+                body, properties = self._queue.popleft()
+                tag = self._next_tag
+                self._next_tag += 1
+                self._unacked[tag] = (time.perf_counter(), body, properties)
+                yield SimpleNamespace(delivery_tag=tag), properties, body
+            else:
+                # Nothing more will arrive while the worker holds a partial batch
+                time.sleep(inactivity_timeout or 0)
+                yield None, None, None
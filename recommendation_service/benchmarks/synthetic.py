@@ -0,0 +1,76 @@
+"""
+Generates realistic, reproducible 'musicTaste' payloads for benchmarking.
+
+Popularity follows a Zipf law, as it does on Spotify: a few artists, genres
+and tracks appear in most tastes and the long tail shows up once or twice.
+Tastes are assembled the way the backend builds them on a Spotify sync:
+top tracks, the artists of those tracks plus a few more top artists, and the
+union of those artists' genres.
+"""
+import numpy as np
+
+
+def zipf_weights(n: int, exponent: float) -> np.ndarray:
+    """Selection probabilities for n items ranked by popularity (rank 1 is the most popular)."""
+    weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** exponent
+    return weights / weights.sum()
+
+
+class TasteGenerator:
+    """
+    A synthetic catalog (artists, genres, tracks) and a stream of user tastes
+    drawn from it. The same seed always produces the same catalog and tastes.
+
+    Args:
+        seed: Seed for every random choice.
+        n_artists, n_genres, n_tracks: Catalog sizes.
+        exponent: The Zipf exponent; higher means popularity is more concentrated.
+        tracks_per_user: Average number of top tracks in a taste.
+        extra_artists_per_user: Average number of top artists beyond those of the top tracks.
+    """
+    def __init__(
+        self,
+        seed: int = 0,
+        n_artists: int = 50000,
+        n_genres: int = 1500,
+        n_tracks: int = 400000,
+        exponent: float = 1.1,
+        tracks_per_user: int = 80,
+        extra_artists_per_user: int = 30,
+    ):
+        self.rng = np.random.default_rng(seed)
+        self.tracks_per_user = tracks_per_user
+        self.extra_artists_per_user = extra_artists_per_user
+        self.artist_weights = zipf_weights(n_artists, exponent)
+        self.track_weights = zipf_weights(n_tracks, exponent)
+        genre_weights = zipf_weights(n_genres, exponent)
+
+        # Each artist has one to three genres, and each track is by one artist;
+        # popular genres and artists get proportionally more of both.
+        genre_draws = self.rng.choice(n_genres, size=(n_artists, 3), p=genre_weights)
+        genre_counts = self.rng.integers(1, 4, size=n_artists)
+        self.artist_genres = [set(draws[:count].tolist()) for draws, count in zip(genre_draws, genre_counts)]
+        self.track_artist = self.rng.choice(n_artists, size=n_tracks, p=self.artist_weights)
+
+    def _sample(self, weights: np.ndarray, mean: int) -> np.ndarray:
+        size = min(max(1, int(self.rng.poisson(mean))), len(weights))
+        return self.rng.choice(len(weights), size=size, replace=False, p=weights)
+
+    def taste(self) -> dict:
+        """Returns one user's musicTaste, shaped like the backend's."""
+        tracks = self._sample(self.track_weights, self.tracks_per_user)
+        artists = dict.fromkeys(int(artist) for artist in self.track_artist[tracks])
+        artists.update(dict.fromkeys(int(artist) for artist in self._sample(self.artist_weights, self.extra_artists_per_user)))
+        genres = dict.fromkeys(f"genre {genre}" for artist in artists for genre in self.artist_genres[artist])
+        return {
+            "topTracks": [{"id": f"track{track:08d}", "name": f"Track {track}"} for track in tracks],
+            "topArtists": [{"id": f"artist{artist:07d}", "name": f"Artist {artist}"} for artist in artists],
+            "topGenres": list(genres),
+        }
+
+    def payloads(self, n: int, first_user: int = 0) -> list:
+        """
+        Returns n queue payloads ({'userId', 'musicTaste'}) for consecutive users.
+        User IDs are 24-digit hex strings, like the backend's ObjectIds.
+        """
+        return [{"userId": f"{user:024x}", "musicTaste": self.taste()} for user in range(first_user, first_user + n)]
@@ -0,0 +1,243 @@
+import os
+import hashlib
+
+import numpy as np
+
+# Number of output dimensions each input position is spread over in a random projection
+DEFAULT_PROJECTION_NONZEROS = 4
+# Roughly how many non-zero entries SparseMatrix products handle at a time
+PRODUCT_CHUNK_NNZ = 1 << 18
+
+_GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    """A fast, well-mixed 64-bit integer hash, applied element-wise."""
+    with np.errstate(over="ignore"):
+        x = x + _GOLDEN_GAMMA
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def _unit(rows: np.ndarray) -> np.ndarray:
+    """Scales every row to unit length in place. All-zero rows stay zero."""
+    norms = np.linalg.norm(rows, axis=-1, keepdims=True)
+    np.divide(rows, norms, out=rows, where=norms > 0)
+    return rows
+
+
+class SparseMatrix:
+    """
+    A minimal compressed-sparse-row matrix over a set of SparseVectors, with
+    just the products the offline embedding tools need. Columns are the
+    positions that actually occur, compacted and sorted.
+    """
+    def __init__(self, indptr: np.ndarray, columns: np.ndarray, data: np.ndarray, positions: np.ndarray):
+        self.indptr = indptr          # row -> start offset into columns/data (length rows + 1)
+        self.columns = columns        # int64 column of every non-zero entry
+        self.data = data              # float32 value of every non-zero entry
+        self.positions = positions    # column -> sparse position (uint32, sorted)
+
+    @classmethod
+    def from_vectors(cls, vectors: list, normalize: bool = True) -> "SparseMatrix":
+        """Stacks SparseVectors as rows, normalizing each one to unit length by default."""
+        if normalize:
+            vectors = [vector.normalized() for vector in vectors]
+        lengths = np.fromiter((vector.nnz for vector in vectors), dtype=np.int64, count=len(vectors))
+        indptr = np.zeros(len(vectors) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        if indptr[-1] == 0:
+            return cls(indptr, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.uint32))
+        indices = np.concatenate([vector.indices for vector in vectors])
+        data = np.concatenate([vector.values for vector in vectors]).astype(np.float32)
+        positions, columns = np.unique(indices, return_inverse=True)
+        return cls(indptr, columns.astype(np.int64), data, positions)
+
+    @property
+    def shape(self) -> tuple:
+        return len(self.indptr) - 1, len(self.positions)
+
+    def row_nnz(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def column_nnz(self) -> np.ndarray:
+        return np.bincount(self.columns, minlength=self.shape[1])
+
+    def dense_rows(self, rows: np.ndarray) -> np.ndarray:
+        """Returns the given rows as a dense (columns x len(rows)) matrix, i.e. transposed."""
+        dense = np.zeros((self.shape[1], len(rows)), dtype=np.float32)
+        for i, row in enumerate(rows):
+            start, stop = self.indptr[row], self.indptr[row + 1]
+            dense[self.columns[start:stop], i] = self.data[start:stop]
+        return dense
+
+    def keep_columns(self, keep: np.ndarray) -> "SparseMatrix":
+        """Drops every column not selected by the boolean mask 'keep'."""
+        new_column = np.cumsum(keep) - 1
+        entry_kept = keep[self.columns]
+        rows = np.repeat(np.arange(self.shape[0], dtype=np.int64), self.row_nnz())
+        indptr = np.zeros_like(self.indptr)
+        np.cumsum(np.bincount(rows[entry_kept], minlength=self.shape[0]), out=indptr[1:])
+        return SparseMatrix(indptr, new_column[self.columns[entry_kept]], self.data[entry_kept], self.positions[keep])
+
+    def transpose(self) -> "SparseMatrix":
+        rows = np.repeat(np.arange(self.shape[0], dtype=np.int64), self.row_nnz())
+        order = np.argsort(self.columns, kind="stable")
+        indptr = np.zeros(self.shape[1] + 1, dtype=np.int64)
+        np.cumsum(self.column_nnz(), out=indptr[1:])
+        return SparseMatrix(indptr, rows[order], self.data[order], np.arange(self.shape[0], dtype=np.uint32))
+
+    def dot(self, dense: np.ndarray) -> np.ndarray:
+        """Returns self @ dense for a (columns x r) dense matrix, a chunk of rows at a time."""
+        n_rows = self.shape[0]
+        out = np.zeros((n_rows, dense.shape[1]), dtype=np.float32)
+        nnz = int(self.indptr[-1])
+        if nnz == 0:
+            return out
+        rows_per_chunk = max(1, PRODUCT_CHUNK_NNZ * n_rows // nnz)
+        for start in range(0, n_rows, rows_per_chunk):
+            stop = min(start + rows_per_chunk, n_rows)
+            low, high = self.indptr[start], self.indptr[stop]
+            if low == high:
+                continue
+            products = self.data[low:high, None] * dense[self.columns[low:high]]
+            # reduceat needs strictly non-empty segments, so only sum rows that have entries
+            offsets = self.indptr[start:stop] - low
+            non_empty = np.flatnonzero(np.diff(self.indptr[start:stop + 1]))
+            out[start + non_empty] = np.add.reduceat(products, offsets[non_empty], axis=0)
+        return out
+
+
+class Projection:
+    """
+    A fixed linear map from sparse taste vectors to small dense embeddings.
+
+    Two kinds are supported:
+      - "random": a seeded sparse random projection. Every sparse position is
+        hashed to a few output dimensions with random signs, so it needs no
+        training and handles positions it has never seen.
+      - "svd": the top singular vectors of a sample of the user-item matrix,
+        fitted offline (scripts/fit_embedding.py). Closer to exact cosine, but
+        positions that weren't in the sample are ignored until it is refitted.
+
+    A projection is saved to and loaded from a single .npz file. Its version
+    identifies exactly which map it is, so vectors embedded with different
+    projections are never compared.
+    """
+    def __init__(self, method: str, dim: int, version: str, seed: int = 0,
+                 nonzeros: int = DEFAULT_PROJECTION_NONZEROS, positions: np.ndarray = None,
+                 components: np.ndarray = None):
+        if method not in ("random", "svd"):
+            raise ValueError(f"Unknown projection method '{method}'. Expected 'random' or 'svd'.")
+        self.method = method
+        self.dim = dim
+        self.version = version
+        self.seed = seed
+        self.nonzeros = nonzeros
+        self.positions = positions      # "svd" only: the sorted sparse positions it knows
+        self.components = components    # "svd" only: (len(positions) x dim) float32
+
+    @classmethod
+    def random(cls, dim: int, seed: int = 0, nonzeros: int = DEFAULT_PROJECTION_NONZEROS) -> "Projection":
+        return cls("random", dim, f"random-{dim}-s{seed}-n{nonzeros}", seed=seed, nonzeros=nonzeros)
+
+    @classmethod
+    def fit_svd(cls, matrix: SparseMatrix, dim: int, oversample: int = 10, iterations: int = 2, seed: int = 0) -> "Projection":
+        """
+        Fits a projection onto the top 'dim' right singular vectors of a
+        row-normalized user-item matrix, with randomized SVD (Halko et al.).
+        Only products with the sparse matrix are needed, never a dense copy of it.
+        """
+        n_rows, n_columns = matrix.shape
+        rank = min(dim + oversample, n_rows, n_columns)
+        if rank < dim:
+            raise ValueError(f"Need at least {dim} users and {dim} positions to fit a {dim}-dimension SVD.")
+        rng = np.random.default_rng(seed)
+        transposed = matrix.transpose()
+
+        # Range finder with a few power iterations, re-orthonormalizing each step
+        basis, _ = np.linalg.qr(matrix.dot(rng.standard_normal((n_columns, rank), dtype=np.float32)))
+        for _ in range(iterations):
+            basis, _ = np.linalg.qr(transposed.dot(basis))
+            basis, _ = np.linalg.qr(matrix.dot(basis))
+
+        # The small (rank x columns) matrix basis.T @ matrix has the same top right singular vectors
+        small = transposed.dot(basis).T
+        _, _, right = np.linalg.svd(small, full_matrices=False)
+        components = np.ascontiguousarray(right[:dim].T, dtype=np.float32)
+        positions = matrix.positions.astype(np.uint32)
+
+        digest = hashlib.sha1(positions.tobytes() + components.tobytes()).hexdigest()[:12]
+        return cls("svd", dim, f"svd-{dim}-{digest}", positions=positions, components=components)
+
+    def embed(self, vector) -> np.ndarray:
+        """
+        Projects a SparseVector to a unit-length float32 embedding of 'dim' values.
+        Returns all zeros if none of the vector's positions contribute.
+        """
+        embedding = np.zeros(self.dim, dtype=np.float32)
+        if vector.nnz == 0:
+            return embedding
+        if self.method == "random":
+            positions = vector.indices.astype(np.uint64)
+            for j in range(self.nonzeros):
+                key = _splitmix64(positions ^ np.uint64((self.seed * self.nonzeros + j) & 0xFFFFFFFFFFFFFFFF))
+                dims = (key % np.uint64(self.dim)).astype(np.int64)
+                signs = np.where(key >> np.uint64(63), -1.0, 1.0).astype(np.float32)
+                np.add.at(embedding, dims, signs * vector.values)
+        else:
+            rows = np.searchsorted(self.positions, vector.indices)
+            rows[rows == self.positions.size] = 0
+            known = self.positions[rows] == vector.indices
+            embedding = vector.values[known] @ self.components[rows[known]]
+        return _unit(embedding.astype(np.float32))
+
+    def embed_many(self, vectors: list) -> np.ndarray:
+        """Projects several SparseVectors into a (len(vectors) x dim) float32 matrix."""
+        if self.method == "svd" and vectors:
+            matrix = SparseMatrix.from_vectors(vectors, normalize=False)
+            rows = np.searchsorted(self.positions, matrix.positions)
+            rows[rows == self.positions.size] = 0
+            known = self.positions[rows] == matrix.positions
+            lookup = np.zeros((matrix.shape[1], self.dim), dtype=np.float32)
+            lookup[known] = self.components[rows[known]]
+            return _unit(matrix.dot(lookup))
+        embeddings = np.zeros((len(vectors), self.dim), dtype=np.float32)
+        for row, vector in enumerate(vectors):
+            embeddings[row] = self.embed(vector)
+        return embeddings
+
+    # --- Persistence ---
+
+    def save(self, path: str):
+        """Writes the projection to an .npz file, atomically replacing any previous one."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        arrays = {
+            "method": np.asarray(self.method),
+            "dim": np.asarray(self.dim),
+            "version": np.asarray(self.version),
+            "seed": np.asarray(self.seed),
+            "nonzeros": np.asarray(self.nonzeros),
+        }
+        if self.method == "svd":
+            arrays["positions"] = self.positions
+            arrays["components"] = self.components
+        tmp_path = f"{path}.tmp.{os.getpid()}.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "Projection":
+        with np.load(path) as data:
+            return cls(
+                str(data["method"]),
+                int(data["dim"]),
+                str(data["version"]),
+                seed=int(data["seed"]),
+                nonzeros=int(data["nonzeros"]),
+                positions=data["positions"] if "positions" in data.files else None,
+                components=data["components"] if "components" in data.files else None,
+            )
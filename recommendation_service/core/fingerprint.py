@@ -0,0 +1,47 @@
+import json
+import hashlib
+
+from core import vectorization
+
+
+def vectorizer_version() -> str:
+    """
+    Identifies everything besides the taste itself that decides which vector
+    a taste becomes and where it is stored: the vectorizer, the section
+    weights, for hashing the hash spaces, the embedding, and the vector index
+    backend and index. A change to any of them changes every fingerprint, so
+    every user is vectorized again into the new layout or index.
+    """
+    # Imported here, as in scripts/backfill_vectors.py, so importing this module never builds the index
+    from services.vector_index import vector_index
+
+    weights = f"w{vectorization.ARTIST_WEIGHT}-{vectorization.GENRE_WEIGHT}-{vectorization.TRACK_WEIGHT}"
+    if vectorization.VECTORIZER == "hashing":
+        spaces = f"{vectorization.ARTIST_HASH_SPACE}-{vectorization.GENRE_HASH_SPACE}-{vectorization.TRACK_HASH_SPACE}"
+        layout = f"hashing-{spaces}-{weights}"
+    else:
+        layout = f"vocab-{weights}"
+    embedding = vector_index.projection.version if vector_index.projection is not None else "sparse"
+    return f"{layout}-{embedding}-{vector_index.name}"
+
+
+def taste_items(music_taste: dict) -> tuple:
+    """
+    The parts of a taste that end up in its vector, in canonical form: the
+    sorted artist IDs, genre names and track IDs. Names, images, 'updatedAt'
+    and the order of the lists don't affect the vector and are left out.
+    """
+    return (
+        sorted(artist["id"] for artist in music_taste.get("topArtists", [])),
+        sorted(music_taste.get("topGenres", [])),
+        sorted(track["id"] for track in music_taste.get("topTracks", [])),
+    )
+
+
+def taste_fingerprint(music_taste: dict) -> str:
+    """
+    Returns a short hash of a taste's vector-relevant content. Two tastes with
+    the same fingerprint produce the same vector.
+    """
+    canonical = json.dumps([vectorizer_version(), *taste_items(music_taste)], separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
@@ -0,0 +1,26 @@
+import hashlib
+
+
+def hash_feature(key: str, salt: bytes, space: int) -> tuple:
+    """
+    Maps a feature key to a stable (bucket, sign) pair.
+
+    BLAKE2b is used instead of Python's hash(), which is randomized per process,
+    so every process (worker, API, scripts) agrees on the positions. The salt
+    keeps the artist, genre and track hash functions independent of each other.
+
+    Args:
+        key: The feature to hash, e.g. a Spotify artist ID or a genre name.
+        salt: A short per-section salt (at most 16 bytes).
+        space: The number of buckets.
+
+    Returns:
+        (bucket, sign): the bucket in [0, space) and +1.0 or -1.0. The sign comes
+        from a different bit than the bucket, so colliding features tend to
+        cancel out rather than add up.
+    """
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8, person=salt).digest()
+    value = int.from_bytes(digest, "little")
+    bucket = (value & 0x7FFFFFFFFFFFFFFF) % space
+    sign = -1.0 if value >> 63 else 1.0
+    return bucket, sign
@@ -0,0 +1,279 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Marks an empty slot in a neighbor row (a row with fewer than k neighbors)
+NO_NEIGHBOR = -1
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> tuple:
+    """
+    Row-wise top-k of a score block.
+
+    Returns:
+        (columns, values): two (rows x k) arrays sorted by descending score.
+    """
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def compute_top_k_neighbors(matrix: np.ndarray, k: int, memory_budget_bytes: int = 512 * 1024 * 1024, workers: int = None) -> tuple:
+    """
+    Finds the k most similar rows for every row of a row-normalized matrix.
+
+    The (n x n) similarity matrix is never materialized: rows are processed in
+    blocks whose score matrices fit in the memory budget, and blocks run on a
+    thread pool (the matrix products release the GIL).
+
+    Args:
+        matrix: An (n x d) float32 matrix with unit-length rows.
+        k: The number of neighbors to keep per row.
+        memory_budget_bytes: Roughly how much memory all in-flight score blocks may use.
+        workers: Number of threads. Defaults to the number of CPUs.
+
+    Returns:
+        (neighbors, scores): (n x k) int32 row indices and float32 scores, best first.
+        A row never lists itself; missing slots hold NO_NEIGHBOR and -inf.
+    """
+    n = matrix.shape[0]
+    workers = workers or os.cpu_count() or 1
+    neighbors = np.full((n, k), NO_NEIGHBOR, dtype=np.int32)
+    scores = np.full((n, k), -np.inf, dtype=np.float32)
+    if n < 2 or k <= 0:
+        return neighbors, scores
+
+    # Each in-flight block holds a (block x n) float32 score matrix plus argpartition's
+    # int64 output of the same shape, so budget ~12 bytes per cell.
+    block_size = max(1, memory_budget_bytes // (workers * n * 12))
+
+    def process_block(start: int):
+        stop = min(start + block_size, n)
+        block_scores = matrix[start:stop] @ matrix.T
+        # A user is never their own neighbor
+        block_scores[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        block_neighbors, block_top_scores = top_k_rows(block_scores, k)
+        width = block_neighbors.shape[1]
+        neighbors[start:stop, :width] = block_neighbors
+        scores[start:stop, :width] = block_top_scores
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(process_block, range(0, n, block_size)))
+
+    # Users with nothing in common are not neighbors
+    neighbors[scores <= 0.0] = NO_NEIGHBOR
+    scores[scores <= 0.0] = -np.inf
+    return neighbors, scores
+
+
+class NeighborTable:
+    """
+    A compact table of each user's precomputed top-k most similar users.
+
+    Neighbors are stored as int32 rows into the table's own ID list, next to
+    their float32 scores, so a lookup is a dict access plus a slice. A row can
+    exist without being answerable (e.g. a user that so far only appears as
+    someone else's neighbor); lookups for it fall back to a live query.
+    """
+    def __init__(self, ids: list, neighbors: np.ndarray, scores: np.ndarray, answerable: np.ndarray = None):
+        self.ids = list(ids)
+        self.rows = {user_id: row for row, user_id in enumerate(self.ids)}
+        # Backing arrays with room to grow; neighbors, scores and answerable are views of their used rows
+        self._neighbors = neighbors
+        self._scores = scores
+        self._answerable = answerable if answerable is not None else np.ones(len(self.ids), dtype=bool)
+        self._update_views()
+
+    @property
+    def k(self) -> int:
+        return self.neighbors.shape[1]
+
+    @classmethod
+    def build(cls, ids: list, matrix: np.ndarray, k: int, **kwargs) -> "NeighborTable":
+        """Computes the full table for a row-normalized matrix whose rows belong to 'ids'."""
+        neighbors, scores = compute_top_k_neighbors(matrix, k, **kwargs)
+        return cls(ids, neighbors, scores)
+
+    def get(self, user_id: str, limit: int):
+        """
+        Returns up to 'limit' precomputed neighbors as {'userId', 'score'} dicts,
+        or None if the table can't answer (unknown user or limit above k).
+        """
+        row = self.rows.get(user_id)
+        if row is None or not self.answerable[row] or limit > self.k:
+            return None
+        results = []
+        for neighbor, score in zip(self.neighbors[row, :limit], self.scores[row, :limit]):
+            if neighbor == NO_NEIGHBOR:
+                break
+            results.append({"userId": self.ids[neighbor], "score": float(score)})
+        return results
+
+    # --- Incremental maintenance ---
+
+    def _update_views(self):
+        n = len(self.ids)
+        self.neighbors = self._neighbors[:n]
+        self.scores = self._scores[:n]
+        self.answerable = self._answerable[:n]
+
+    def _grow(self, rows: int):
+        """Reallocates the backing arrays so they can hold at least the given number of rows."""
+        capacity = self._neighbors.shape[0]
+        if rows <= capacity:
+            return
+        capacity = max(capacity, 1)
+        while capacity < rows:
+            capacity *= 2
+        # Rows past the used ones stay empty, so new users start with no neighbors
+        used = self.neighbors.shape[0]
+        neighbors = np.full((capacity, self.k), NO_NEIGHBOR, dtype=np.int32)
+        scores = np.full((capacity, self.k), -np.inf, dtype=np.float32)
+        answerable = np.zeros(capacity, dtype=bool)
+        neighbors[:used] = self.neighbors
+        scores[:used] = self.scores
+        answerable[:used] = self.answerable
+        self._neighbors, self._scores, self._answerable = neighbors, scores, answerable
+
+    def _ensure_rows(self, user_ids) -> np.ndarray:
+        """Returns the table rows of the given users, appending empty rows for new ones."""
+        new_ids = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in self.rows]
+        if new_ids:
+            self._grow(len(self.ids) + len(new_ids))
+            for user_id in new_ids:
+                self.rows[user_id] = len(self.ids)
+                self.ids.append(user_id)
+            self._update_views()
+        return np.fromiter((self.rows[user_id] for user_id in user_ids), dtype=np.int64, count=len(user_ids))
+
+    def _recompute_rows(self, table_rows: np.ndarray, matrix: np.ndarray, matrix_ids: list, matrix_rows: np.ndarray):
+        """Fully recomputes the given table rows against every user in the matrix."""
+        if table_rows.size == 0:
+            return
+        block_scores = matrix[matrix_rows] @ matrix.T
+        block_scores[np.arange(table_rows.size), matrix_rows] = -np.inf
+        top, top_scores = top_k_rows(block_scores, self.k)
+        neighbor_rows = self._ensure_rows([matrix_ids[i] for i in top.ravel()]).reshape(top.shape)
+        neighbor_rows[top_scores <= 0.0] = NO_NEIGHBOR
+        top_scores[top_scores <= 0.0] = -np.inf
+        width = top.shape[1]
+        self.neighbors[table_rows] = NO_NEIGHBOR
+        self.scores[table_rows] = -np.inf
+        self.neighbors[table_rows, :width] = neighbor_rows
+        self.scores[table_rows, :width] = top_scores
+        self.answerable[table_rows] = True
+
+    def update_user(self, user_id: str, matrix: np.ndarray, matrix_ids: list, matrix_row_of: dict = None) -> int:
+        """
+        Refreshes the table after one user's vector changed.
+
+        The user's own row is recomputed, and so is every row the user enters or
+        leaves; rows where the user stays in the top-k only get its new score.
+
+        Args:
+            user_id: The user whose vector changed.
+            matrix: The current row-normalized matrix of every user.
+            matrix_ids: The user ID of each matrix row.
+            matrix_row_of: The reverse of matrix_ids, if the caller already has it.
+
+        Returns:
+            The number of rows that were touched.
+        """
+        if matrix_row_of is None:
+            matrix_row_of = {other_id: row for row, other_id in enumerate(matrix_ids)}
+        if user_id not in matrix_row_of:
+            return 0
+        user_matrix_row = matrix_row_of[user_id]
+        user_table_row = self._ensure_rows([user_id])[0]
+
+        # 1. The user's own neighbors
+        self._recompute_rows(np.array([user_table_row]), matrix, matrix_ids, np.array([user_matrix_row]))
+
+        # 2. Everyone else's similarity to the user, aligned with the table rows
+        user_scores = matrix @ matrix[user_matrix_row]
+        table_matrix_rows = np.fromiter(
+            (matrix_row_of.get(other_id, -1) for other_id in self.ids), dtype=np.int64, count=len(self.ids)
+        )
+        present = table_matrix_rows >= 0
+        present[user_table_row] = False
+        new_scores = np.full(len(self.ids), -np.inf, dtype=np.float32)
+        new_scores[present] = user_scores[table_matrix_rows[present]]
+
+        holds_user = self.neighbors == user_table_row
+        was_in = holds_user.any(axis=1)
+        # Rows are sorted best first and empty slots sort last, so the last slot is the k-th best.
+        # Anyone outside a full row scores at most that much, which makes it a safe threshold.
+        kth_score = self.scores[:, -1]
+        full = self.neighbors[:, -1] != NO_NEIGHBOR
+        candidate = present & self.answerable & (new_scores > 0.0)
+
+        enters = candidate & ~was_in & (~full | (new_scores > kth_score))
+        stays = candidate & was_in & (~full | (new_scores >= kth_score))
+        leaves = self.answerable & was_in & ~stays
+        leaves[user_table_row] = False
+
+        # 3. Rows the user enters: replace the weakest slot, then re-sort
+        enter_rows = np.flatnonzero(enters)
+        if enter_rows.size:
+            self.neighbors[enter_rows, -1] = user_table_row
+            self.scores[enter_rows, -1] = new_scores[enter_rows]
+
+        # 4. Rows the user stays in: just update the score, then re-sort
+        stay_rows = np.flatnonzero(stays)
+        if stay_rows.size:
+            self.scores[stay_rows] = np.where(holds_user[stay_rows], new_scores[stay_rows, None], self.scores[stay_rows])
+
+        touched = np.concatenate([enter_rows, stay_rows])
+        if touched.size:
+            order = np.argsort(-self.scores[touched], axis=1, kind="stable")
+            self.scores[touched] = np.take_along_axis(self.scores[touched], order, axis=1)
+            self.neighbors[touched] = np.take_along_axis(self.neighbors[touched], order, axis=1)
+
+        # 5. Rows the user leaves: someone else moves up, which needs a full recompute.
+        # Rows whose own user is gone from the matrix can't be recomputed and stop answering.
+        leave_rows = np.flatnonzero(leaves)
+        orphaned = leave_rows[table_matrix_rows[leave_rows] < 0]
+        self.answerable[orphaned] = False
+        leave_rows = leave_rows[table_matrix_rows[leave_rows] >= 0]
+        self._recompute_rows(leave_rows, matrix, matrix_ids, table_matrix_rows[leave_rows])
+
+        return 1 + touched.size + leave_rows.size
+
+    def drop_users(self, user_ids: list):
+        """
+        Stops answering for users whose vectors changed when their rows can't be
+        refreshed locally, and for every user whose row lists one of them, since
+        those scores are stale too. Lookups for all of them then fall back to a
+        live query. Rows that one of the users would now enter can't be found
+        without the matrix; they keep answering until the next full rebuild.
+        """
+        rows = [self.rows[user_id] for user_id in user_ids if user_id in self.rows]
+        if not rows:
+            return
+        self.answerable[rows] = False
+        self.answerable[np.isin(self.neighbors, rows).any(axis=1)] = False
+
+    # --- Persistence ---
+
+    def save(self, path: str):
+        """Writes the table to an .npz file, atomically replacing any previous one."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp.{os.getpid()}.npz"
+        np.savez(
+            tmp_path,
+            ids=np.asarray(self.ids, dtype=str),
+            answerable=self.answerable,
+            neighbors=self.neighbors,
+            scores=self.scores,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "NeighborTable":
+        with np.load(path) as data:
+            return cls(data["ids"].tolist(), data["neighbors"], data["scores"], data["answerable"])
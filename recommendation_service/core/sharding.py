@@ -0,0 +1,38 @@
+import bisect
+import hashlib
+
+
+def _ring_position(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class ConsistentHashRing:
+    """
+    Assigns keys (user IDs) to shards with consistent hashing.
+
+    Every shard owns 'replicas' points on a 64-bit ring and a key belongs to
+    the shard that owns the first point at or after the key's hash. The same
+    key always maps to the same shard, in every process, and changing the
+    number of shards moves only about 1/N of the keys.
+
+    Args:
+        n_shards: The number of shards.
+        replicas: Points per shard; more points spread keys more evenly.
+    """
+    def __init__(self, n_shards: int, replicas: int = 128):
+        if n_shards < 1:
+            raise ValueError("A hash ring needs at least one shard.")
+        self.n_shards = n_shards
+        points = sorted(
+            (_ring_position(f"shard-{shard}-{replica}"), shard)
+            for shard in range(n_shards)
+            for replica in range(replicas)
+        )
+        self._positions = [position for position, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, key: str) -> int:
+        """Returns the shard (0 to n_shards - 1) that owns the key."""
+        slot = bisect.bisect_left(self._positions, _ring_position(key))
+        # Past the last point, the ring wraps around to the first
+        return self._shards[slot % len(self._shards)]
@@ -0,0 +1,23 @@
+import numpy as np
+
+
+def densify(vectors: dict) -> tuple:
+    """
+    Packs sparse vectors into a dense, row-normalized matrix whose columns are
+    only the positions that actually occur.
+
+    Args:
+        vectors: A dict mapping an ID to its SparseVector.
+
+    Returns:
+        (ids, matrix): the IDs in row order and the (len(ids) x columns) float32 matrix.
+    """
+    ids = list(vectors)
+    if not ids:
+        return ids, np.zeros((0, 0), dtype=np.float32)
+    all_positions = np.unique(np.concatenate([vectors[vector_id].indices for vector_id in ids]))
+    matrix = np.zeros((len(ids), all_positions.size), dtype=np.float32)
+    for row, vector_id in enumerate(ids):
+        vector = vectors[vector_id].normalized()
+        matrix[row, np.searchsorted(all_positions, vector.indices)] = vector.values
+    return ids, matrix
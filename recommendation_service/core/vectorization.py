@@ -1,62 +1,217 @@
+import os
+from typing import NamedTuple
+
 import numpy as np
 from services import vocabulary_service
+from services.metrics import VECTORIZE_SECONDS
+from core.hashing import hash_feature
 
 # --- Updated Configuration ---
-ARTIST_VOCAB_SIZE = 9000
-GENRE_VOCAB_SIZE = 1000
-TRACK_VOCAB_SIZE = 10000
-TOTAL_VECTOR_DIMENSION = ARTIST_VOCAB_SIZE + GENRE_VOCAB_SIZE + TRACK_VOCAB_SIZE
+# Each section of the vector lives in its own slice of the sparse index space.
+# The sections are far apart so a vocabulary can keep growing without ever
+# spilling into the next section (sparse indices are 32-bit unsigned ints).
+SECTION_SIZE = 1 << 30
+ARTIST_SECTION_START = 0
+GENRE_SECTION_START = ARTIST_SECTION_START + SECTION_SIZE
+TRACK_SECTION_START = GENRE_SECTION_START + SECTION_SIZE
 
 TRACK_WEIGHT = 2.0
 ARTIST_WEIGHT = 1.5
 GENRE_WEIGHT = 1.0
 
-async def create_user_vector(music_taste: dict) -> np.ndarray:
+# --- Vectorizer Selection ---
+# "vocab" maps every item to a dense index kept in MongoDB (the default).
+# "hashing" derives positions from a stable hash of the item, with no database access.
+# Switching requires re-vectorizing every user (scripts/backfill_vectors.py).
+VECTORIZER = os.getenv("VECTORIZER", "vocab").lower()
+
+# Number of hash buckets per section in "hashing" mode (each must fit in SECTION_SIZE)
+ARTIST_HASH_SPACE = int(os.getenv("ARTIST_HASH_SPACE", 1 << 20))
+GENRE_HASH_SPACE = int(os.getenv("GENRE_HASH_SPACE", 1 << 14))
+TRACK_HASH_SPACE = int(os.getenv("TRACK_HASH_SPACE", 1 << 22))
+
+ARTIST_HASH_SALT = b"rhythm-artist"
+GENRE_HASH_SALT = b"rhythm-genre"
+TRACK_HASH_SALT = b"rhythm-track"
+
+
+class SparseVector(NamedTuple):
+    """
+    A user's taste vector in sparse form: the sorted positions of the non-zero
+    entries and their values. A typical user has 50-150 non-zero entries.
+    """
+    indices: np.ndarray  # uint32, sorted ascending, unique
+    values: np.ndarray   # float32, same length as indices
+
+    @classmethod
+    def from_dict(cls, entries: dict) -> "SparseVector":
+        """Builds a SparseVector from a {position: value} mapping."""
+        if not entries:
+            return cls(np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.float32))
+        indices = np.fromiter(entries.keys(), dtype=np.uint32, count=len(entries))
+        values = np.fromiter(entries.values(), dtype=np.float32, count=len(entries))
+        order = np.argsort(indices)
+        return cls(indices[order], values[order])
+
+    @property
+    def nnz(self) -> int:
+        return int(self.indices.size)
+
+    def normalized(self) -> "SparseVector":
+        """Returns a copy scaled to unit L2 norm (an empty vector is returned as-is)."""
+        norm = float(np.linalg.norm(self.values))
+        if norm == 0.0:
+            return self
+        return SparseVector(self.indices, (self.values / norm).astype(np.float32))
+
+    def to_pinecone(self) -> dict:
+        """Formats the vector as Pinecone 'sparse_values'."""
+        return {"indices": self.indices.tolist(), "values": self.values.tolist()}
+
+
+async def create_user_vector(music_taste: dict) -> SparseVector:
+    """
+    Creates a weighted, hybrid sparse vector from a user's music taste, including tracks.
+
+    Each vocabulary is resolved with a single bulk lookup, so the number of
+    database round trips does not depend on the size of the taste profile.
+    """
+    vectors = await create_user_vectors([music_taste])
+    return vectors[0]
+
+
+async def create_user_vectors(music_tastes: list) -> list:
+    """
+    Creates the vectors for several users at once.
+
+    The artists, genres and tracks of every taste are resolved together, so a
+    whole batch costs the same number of vocabulary round trips as one user.
+
+    Returns:
+        A list of SparseVectors, in the same order as music_tastes.
+    """
+    vocab_indices = await resolve_vocab_indices(music_tastes)
+    return build_user_vectors(music_tastes, vocab_indices)
+
+
+async def resolve_vocab_indices(music_tastes: list, known: tuple = None) -> tuple:
+    """
+    Resolves every artist, genre and track in the given tastes to its vocabulary index.
+    This is the I/O-bound half of vectorization.
+
+    Args:
+        music_tastes: The tastes to resolve.
+        known: Optionally, an (artist_indices, genre_indices, track_indices) tuple of
+            indices already known (e.g. from a user's previous taste). Only the
+            other items are looked up; vocabulary indices never change once assigned.
+
+    Returns:
+        An (artist_indices, genre_indices, track_indices) tuple of dicts, or None
+        in "hashing" mode, which needs no lookups.
+    """
+    if VECTORIZER == "hashing":
+        return None
+
+    with VECTORIZE_SECONDS.time(stage="resolve"):
+        return await _resolve_vocab_indices(music_tastes, known or ({}, {}, {}))
+
+
+async def _resolve_vocab_indices(music_tastes: list, known: tuple) -> tuple:
+    known_artists, known_genres, known_tracks = known
+    all_artists = [artist for taste in music_tastes for artist in taste.get("topArtists", []) if artist["id"] not in known_artists]
+    all_genres = [genre for taste in music_tastes for genre in taste.get("topGenres", []) if genre not in known_genres]
+    all_tracks = [track for taste in music_tastes for track in taste.get("topTracks", []) if track["id"] not in known_tracks]
+
+    artist_indices = await vocabulary_service.resolve_artist_indices(all_artists) if all_artists else {}
+    genre_indices = await vocabulary_service.resolve_genre_indices(all_genres) if all_genres else {}
+    track_indices = await vocabulary_service.resolve_track_indices(all_tracks) if all_tracks else {}
+    return {**known_artists, **artist_indices}, {**known_genres, **genre_indices}, {**known_tracks, **track_indices}
+
+
+def user_vocab_indices(music_taste: dict, vocab_indices: tuple) -> tuple:
+    """
+    Picks one taste's items out of resolved vocabulary indices (which may cover
+    a whole batch). Returns None in "hashing" mode.
+
+    Returns:
+        An (artist_indices, genre_indices, track_indices) tuple of dicts.
+    """
+    if vocab_indices is None:
+        return None
+    artist_indices, genre_indices, track_indices = vocab_indices
+    return (
+        {artist["id"]: artist_indices[artist["id"]] for artist in music_taste.get("topArtists", [])},
+        {genre: genre_indices[genre] for genre in music_taste.get("topGenres", [])},
+        {track["id"]: track_indices[track["id"]] for track in music_taste.get("topTracks", [])},
+    )
+
+
+def build_user_vectors(music_tastes: list, vocab_indices: tuple) -> list:
+    """
+    Builds the weighted vectors from already-resolved vocabulary indices.
+    This is the CPU-bound half of vectorization and never touches the database.
+    """
+    with VECTORIZE_SECONDS.time(stage="build"):
+        return _build_user_vectors(music_tastes, vocab_indices)
+
+
+def _build_user_vectors(music_tastes: list, vocab_indices: tuple) -> list:
+    if vocab_indices is None:
+        return [create_hashed_user_vector(music_taste) for music_taste in music_tastes]
+
+    artist_indices, genre_indices, track_indices = vocab_indices
+
+    vectors = []
+    for music_taste in music_tastes:
+        entries = {}
+
+        # --- 1. Process Artists ---
+        for artist in music_taste.get("topArtists", []):
+            entries[ARTIST_SECTION_START + artist_indices[artist["id"]]] = ARTIST_WEIGHT
+
+        # --- 2. Process Genres ---
+        # The genre section starts after the artist section
+        for genre in music_taste.get("topGenres", []):
+            entries[GENRE_SECTION_START + genre_indices[genre]] = GENRE_WEIGHT
+
+        # --- 3. Process Tracks ---
+        # The track section starts after artists and genres
+        for track in music_taste.get("topTracks", []):
+            entries[TRACK_SECTION_START + track_indices[track["id"]]] = TRACK_WEIGHT
+
+        vectors.append(SparseVector.from_dict(entries))
+
+    return vectors
+
+
+def create_hashed_user_vector(music_taste: dict) -> SparseVector:
     """
-    Creates a weighted, hybrid vector from a user's music taste, including tracks.
+    Creates a user's vector with feature hashing instead of vocabulary lookups.
+
+    Every item's position is a stable hash of its ID within its own section's
+    hash space, and its value carries a hash-derived sign. This is a pure CPU
+    function: no database round trips and no shared counter to contend on,
+    and new items never fall outside the vector.
     """
-    user_vector = np.zeros(TOTAL_VECTOR_DIMENSION, dtype=np.float32)
+    entries = {}
+
+    def add(section_start, key, salt, space, weight):
+        bucket, sign = hash_feature(key, salt, space)
+        position = section_start + bucket
+        # Colliding items within one user share a position, so their values add up
+        entries[position] = entries.get(position, 0.0) + sign * weight
 
     # --- 1. Process Artists ---
-    top_artists = music_taste.get("topArtists", [])
-    if top_artists:
-        for artist in top_artists:
-            artist_index = await vocabulary_service.get_or_create_artist_index(
-                artist_id=artist["id"], 
-                artist_name=artist["name"]
-            )
-            if artist_index < ARTIST_VOCAB_SIZE:
-                user_vector[artist_index] = ARTIST_WEIGHT
-            else:
-                print(f"Warning: Artist index {artist_index} exceeds allocated size {ARTIST_VOCAB_SIZE}.")
+    for artist in music_taste.get("topArtists", []):
+        add(ARTIST_SECTION_START, artist["id"], ARTIST_HASH_SALT, ARTIST_HASH_SPACE, ARTIST_WEIGHT)
 
     # --- 2. Process Genres ---
-    # The genre section starts after the artist section
-    genre_section_start_index = ARTIST_VOCAB_SIZE
-    top_genres = music_taste.get("topGenres", [])
-    if top_genres:
-        for genre in top_genres:
-            genre_index = await vocabulary_service.get_or_create_genre_index(genre_name=genre)
-            vector_position = genre_section_start_index + genre_index
-            if genre_index < GENRE_VOCAB_SIZE:
-                user_vector[vector_position] = GENRE_WEIGHT
-            else:
-                print(f"Warning: Genre index {genre_index} exceeds allocated size {GENRE_VOCAB_SIZE}.")
-
-    # --- 3. Process Tracks (NEW SECTION) ---
-    # The track section starts after artists and genres
-    track_section_start_index = ARTIST_VOCAB_SIZE + GENRE_VOCAB_SIZE
-    top_tracks = music_taste.get("topTracks", [])
-    if top_tracks:
-        for track in top_tracks:
-            track_index = await vocabulary_service.get_or_create_track_index(
-                track_id=track["id"],
-                track_name=track["name"]
-            )
-            vector_position = track_section_start_index + track_index
-            if track_index < TRACK_VOCAB_SIZE:
-                user_vector[vector_position] = TRACK_WEIGHT
-            else:
-                print(f"Warning: Track index {track_index} exceeds allocated size {TRACK_VOCAB_SIZE}.")
-
-    return user_vector
\ No newline at end of file
+    for genre in music_taste.get("topGenres", []):
+        add(GENRE_SECTION_START, genre, GENRE_HASH_SALT, GENRE_HASH_SPACE, GENRE_WEIGHT)
+
+    # --- 3. Process Tracks ---
+    for track in music_taste.get("topTracks", []):
+        add(TRACK_SECTION_START, track["id"], TRACK_HASH_SALT, TRACK_HASH_SPACE, TRACK_WEIGHT)
+
+    # Drop positions where colliding items cancelled out exactly
+    return SparseVector.from_dict({position: value for position, value in entries.items() if value != 0.0})
@@ -0,0 +1,151 @@
+import os
+import json
+import mmap
+import time
+import hashlib
+
+import numpy as np
+
+MAGIC = b"RHYVOCAB"
+FORMAT_VERSION = 1
+SECTIONS = ("artist", "genre", "track")
+
+# File layout: MAGIC, the header length (uint64), a JSON header, then for every
+# section four arrays, each starting on an 8-byte boundary:
+#   hashes       uint64[n]    key hashes, sorted ascending
+#   indices      uint32[n]    vocabulary index of each key, same order
+#   key_offsets  uint64[n+1]  where each key's UTF-8 bytes start in 'keys'
+#   keys         bytes        every key, concatenated in the same order
+# The header records each array's offset, and n per section.
+
+
+def key_hash(key: bytes) -> int:
+    """A stable 64-bit hash of a vocabulary key (the same in every process)."""
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def write_snapshot(path: str, vocabularies: dict):
+    """
+    Writes a vocabulary snapshot, atomically replacing any previous file so
+    processes that have the old one mapped keep reading it undisturbed.
+
+    Args:
+        path: Where to write the snapshot.
+        vocabularies: Maps each section name ('artist', 'genre', 'track') to a
+            dict of key -> vocabulary index.
+    """
+    header = {"version": FORMAT_VERSION, "created": time.time(), "sections": {}}
+    blobs = []
+    offset = 0
+    for section in SECTIONS:
+        entries = vocabularies.get(section, {})
+        keys = [key.encode("utf-8") for key in entries]
+        hashes = np.fromiter((key_hash(key) for key in keys), dtype=np.uint64, count=len(keys))
+        order = np.argsort(hashes, kind="stable")
+        keys = [keys[i] for i in order]
+        indices = np.fromiter(entries.values(), dtype=np.uint32, count=len(keys))[order]
+        key_offsets = np.zeros(len(keys) + 1, dtype=np.uint64)
+        np.cumsum([len(key) for key in keys], out=key_offsets[1:])
+
+        arrays = {"hashes": hashes[order].tobytes(), "indices": indices.tobytes(),
+                  "key_offsets": key_offsets.tobytes(), "keys": b"".join(keys)}
+        layout = {"count": len(keys)}
+        for name, blob in arrays.items():
+            layout[name] = offset
+            blobs.append((offset, blob))
+            offset = _aligned(offset + len(blob))
+        header["sections"][section] = layout
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = _aligned(len(MAGIC) + 8 + len(header_bytes))
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        for blob_offset, blob in blobs:
+            f.seek(data_start + blob_offset)
+            f.write(blob)
+        f.truncate(data_start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class _Section:
+    def __init__(self, buffer, data_start: int, layout: dict):
+        count = layout["count"]
+        self.count = count
+        self.hashes = np.frombuffer(buffer, dtype=np.uint64, count=count, offset=data_start + layout["hashes"])
+        self.indices = np.frombuffer(buffer, dtype=np.uint32, count=count, offset=data_start + layout["indices"])
+        self.key_offsets = np.frombuffer(buffer, dtype=np.uint64, count=count + 1, offset=data_start + layout["key_offsets"])
+        self.keys_start = data_start + layout["keys"]
+
+
+class VocabSnapshot:
+    """
+    A read-only, memory-mapped vocabulary snapshot.
+
+    The file is mapped rather than read, so every process that opens the same
+    snapshot shares one copy of its pages through the OS page cache, and
+    opening it costs nothing until keys are looked up. A lookup is a binary
+    search over the sorted key hashes, confirmed against the stored key.
+    """
+    def __init__(self, buffer: mmap.mmap, header: dict, data_start: int):
+        self._buffer = buffer
+        self.created = header["created"]
+        self._sections = {
+            section: _Section(buffer, data_start, layout) for section, layout in header["sections"].items()
+        }
+
+    @classmethod
+    def open(cls, path: str) -> "VocabSnapshot":
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"'{path}' is not a vocabulary snapshot.")
+        header_length = int.from_bytes(buffer[len(MAGIC):len(MAGIC) + 8], "little")
+        header_start = len(MAGIC) + 8
+        header = json.loads(buffer[header_start:header_start + header_length])
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vocabulary snapshot version {header.get('version')} in '{path}'.")
+        return cls(buffer, header, _aligned(header_start + header_length))
+
+    def count(self, section: str) -> int:
+        table = self._sections.get(section)
+        return table.count if table is not None else 0
+
+    def lookup(self, section: str, keys) -> dict:
+        """
+        Finds the vocabulary indices of the given keys.
+
+        Returns:
+            A dict mapping every key that is in the snapshot to its index.
+        """
+        table = self._sections.get(section)
+        keys = list(keys)
+        if table is None or table.count == 0 or not keys:
+            return {}
+        encoded = [key.encode("utf-8") for key in keys]
+        hashes = np.fromiter((key_hash(key) for key in encoded), dtype=np.uint64, count=len(keys))
+        slots = np.searchsorted(table.hashes, hashes).tolist()
+
+        found = {}
+        for key, raw, key_hash_value, slot in zip(keys, encoded, hashes.tolist(), slots):
+            # Keys that share a hash sit next to each other; the stored key decides
+            while slot < table.count and int(table.hashes[slot]) == key_hash_value:
+                start = table.keys_start + int(table.key_offsets[slot])
+                end = table.keys_start + int(table.key_offsets[slot + 1])
+                if self._buffer[start:end] == raw:
+                    found[key] = int(table.indices[slot])
+                    break
+                slot += 1
+        return found
@@ -2,36 +2,51 @@ import os
 import pinecone
 from dotenv import load_dotenv
 
+from core.embedding import Projection
+
 load_dotenv()
 
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-INDEX_NAME = "rhythm-users"
-# Ensure this matches the dimension in your vectorization.py file
-VECTOR_DIMENSION = 20000
+INDEX_NAME = "rhythm-users-sparse"
+# User vectors are sparse (see core/vectorization.py), so the index has no fixed
+# dimension. Vectors are normalized before upsert, so 'dotproduct' equals cosine.
+VECTOR_TYPE = "sparse"
+METRIC = "dotproduct"
+
+# With EMBEDDING_PATH set, vectors are compacted into dense embeddings instead
+# (core/embedding.py), which live in a dense index sized to the projection.
+EMBEDDING_PATH = os.getenv("EMBEDDING_PATH", "")
+DENSE_INDEX_NAME = "rhythm-users-dense"
 
 def main():
     print("Initializing Pinecone...")
     # Use the new Pinecone client
     pc = pinecone.Pinecone(api_key=PINECONE_API_KEY)
 
+    index_name, vector_type, dimension = INDEX_NAME, VECTOR_TYPE, None
+    if EMBEDDING_PATH:
+        projection = Projection.load(EMBEDDING_PATH)
+        index_name, vector_type, dimension = DENSE_INDEX_NAME, "dense", projection.dim
+
     # Check if the index already exists
     # The .names() method returns a list of index names
-    if INDEX_NAME in pc.list_indexes().names():
-        print(f"Index '{INDEX_NAME}' already exists. No action taken.")
+    if index_name in pc.list_indexes().names():
+        print(f"Index '{index_name}' already exists. No action taken.")
         return
 
-    print(f"Index '{INDEX_NAME}' not found. Creating new index...")
+    print(f"Index '{index_name}' not found. Creating new index...")
     # Use the new create_index method with the ServerlessSpec
     pc.create_index(
-        name=INDEX_NAME,
-        dimension=VECTOR_DIMENSION,
-        metric="cosine",
+        name=index_name,
+        vector_type=vector_type,
+        dimension=dimension,
+        metric=METRIC,
         spec=pinecone.ServerlessSpec(
             cloud="aws",
             region="us-east-1"
         )
     )
-    print(f"Successfully created index '{INDEX_NAME}' with dimension {VECTOR_DIMENSION}.")
+    print(f"Successfully created {vector_type} index '{index_name}' with metric '{METRIC}'.")
     print("It may take a minute for the index to be ready.")
 
 if __name__ == "__main__":
@@ -0,0 +1,181 @@
+"""
+Re-vectorizes every user's musicTaste and bulk-upserts the vectors into the index.
+
+Run it after changing the weights (TRACK_WEIGHT / ARTIST_WEIGHT / GENRE_WEIGHT),
+the vectorizer (VECTORIZER), the embedding projection (EMBEDDING_PATH) or the
+vector layout, or to populate a fresh index.
+Progress is checkpointed after every chunk, so an interrupted run picks up
+where it stopped.
+
+Usage (from the recommendation_service directory):
+    python -m scripts.backfill_vectors --workers 8 --chunk-size 500
+    python -m scripts.backfill_vectors --restart   # ignore the checkpoint
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from bson import ObjectId
+
+from core import vectorization
+
+DEFAULT_CHECKPOINT_PATH = "data/backfill_checkpoint.json"
+
+# Each worker process gets its own event loop (and with it its own async Mongo client)
+_worker_loop = None
+
+
+def _init_worker():
+    global _worker_loop
+    _worker_loop = asyncio.new_event_loop()
+
+
+def _vectorize_chunk(users: list) -> list:
+    """
+    Runs in a worker process. Vectorizes a chunk of (user_id, musicTaste) pairs.
+
+    Returns:
+        A list of (user_id, SparseVector) pairs, without users whose taste is empty.
+    """
+    user_ids = [user_id for user_id, _ in users]
+    vectors = _worker_loop.run_until_complete(
+        vectorization.create_user_vectors([music_taste for _, music_taste in users])
+    )
+    return [(user_id, vector) for user_id, vector in zip(user_ids, vectors) if vector.nnz > 0]
+
+
+def current_layout() -> dict:
+    """The settings a checkpoint was made with; a run with different ones starts over."""
+    from services.vector_index import vector_index
+
+    return {
+        "trackWeight": vectorization.TRACK_WEIGHT,
+        "artistWeight": vectorization.ARTIST_WEIGHT,
+        "genreWeight": vectorization.GENRE_WEIGHT,
+        "sectionSize": vectorization.SECTION_SIZE,
+        "vectorizer": vectorization.VECTORIZER,
+        "hashSpaces": [
+            vectorization.ARTIST_HASH_SPACE,
+            vectorization.GENRE_HASH_SPACE,
+            vectorization.TRACK_HASH_SPACE,
+        ],
+        "embedding": vector_index.projection.version if vector_index.projection is not None else "",
+    }
+
+
+def load_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("layout") != current_layout():
+        print("Checkpoint was made with different weights or layout. Starting over.")
+        return None
+    return checkpoint
+
+
+def save_checkpoint(path: str, last_user_id: str, processed: int, upserted: int):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({
+            "lastUserId": last_user_id,
+            "processed": processed,
+            "upserted": upserted,
+            "layout": current_layout(),
+        }, f)
+    # Atomic swap so a crash mid-write never corrupts the checkpoint
+    os.replace(tmp_path, path)
+
+
+def iter_user_chunks(users_collection, query: dict, chunk_size: int):
+    """Streams (user_id, musicTaste) pairs in _id order, chunk_size users at a time."""
+    cursor = users_collection.find(query, {"musicTaste": 1}).sort("_id", 1).batch_size(chunk_size)
+    chunk = []
+    for user_doc in cursor:
+        chunk.append((str(user_doc["_id"]), user_doc["musicTaste"]))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-vectorize and upsert every user's music taste.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Vectorization processes.")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Users per vectorization/upsert chunk.")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH, help="Where progress is recorded.")
+    parser.add_argument("--restart", action="store_true", help="Ignore any existing checkpoint.")
+    args = parser.parse_args()
+
+    # Imported here so worker processes don't open index/Mongo connections they never use
+    from services.mongo_client import get_collection
+    from services.vector_index import vector_index
+
+    users_collection = get_collection("users")
+    query = {"musicTaste": {"$exists": True}}
+
+    checkpoint = None if args.restart else load_checkpoint(args.checkpoint)
+    processed = upserted = 0
+    if checkpoint:
+        query["_id"] = {"$gt": ObjectId(checkpoint["lastUserId"])}
+        processed, upserted = checkpoint["processed"], checkpoint["upserted"]
+        print(f"Resuming after user {checkpoint['lastUserId']} ({processed} users already processed).")
+
+    remaining = users_collection.count_documents(query)
+    total = processed + remaining
+    print(f"Backfilling {remaining} users with {args.workers} workers in chunks of {args.chunk_size}...")
+
+    started = time.perf_counter()
+    run_processed = 0
+    # 'spawn' gives every worker fresh Mongo clients instead of forked copies of ours
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context, initializer=_init_worker) as executor:
+        # Keep a bounded window of chunks in flight and consume results in order,
+        # so the checkpoint always marks a point before which everything is done.
+        in_flight = deque()
+        chunks = iter_user_chunks(users_collection, query, args.chunk_size)
+
+        def submit_next() -> bool:
+            chunk = next(chunks, None)
+            if chunk is None:
+                return False
+            in_flight.append((chunk[-1][0], len(chunk), executor.submit(_vectorize_chunk, chunk)))
+            return True
+
+        for _ in range(args.workers * 2):
+            if not submit_next():
+                break
+
+        while in_flight:
+            last_user_id, chunk_len, future = in_flight.popleft()
+            items = future.result()
+            if items:
+                vector_index.upsert_user_vectors(items)
+            processed += chunk_len
+            upserted += len(items)
+            run_processed += chunk_len
+            save_checkpoint(args.checkpoint, last_user_id, processed, upserted)
+            submit_next()
+
+            elapsed = time.perf_counter() - started
+            rate = run_processed / elapsed if elapsed > 0 else 0.0
+            eta = (total - processed) / rate if rate > 0 else 0.0
+            print(f"[{processed}/{total}] {upserted} upserted, {rate:.0f} users/s, ETA {eta:.0f}s")
+
+    vector_index.flush()
+    print(f"✅ Backfill complete: {processed} users processed, {upserted} vectors upserted "
+          f"in {time.perf_counter() - started:.1f}s.")
+    print("Rebuild the neighbor table (scripts.build_neighbor_table) if you use one.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""
+One-time setup of everything the service expects to already exist: the
+vocabulary indexes and counter in MongoDB and, with the Pinecone backend,
+the Pinecone index. Safe to run repeatedly; start.sh runs it once per
+deployment, before the worker and the API start.
+
+Usage (from the recommendation_service directory):
+    python -m scripts.bootstrap
+"""
+import create_pinecone_index
+from services.mongo_client import ensure_schema
+from services.vector_index import VECTOR_INDEX_BACKEND
+
+
+def main():
+    ensure_schema()
+    if VECTOR_INDEX_BACKEND == "pinecone":
+        create_pinecone_index.main()
+    print("✅ Bootstrap complete.")
+
+
+if __name__ == "__main__":
+    main()
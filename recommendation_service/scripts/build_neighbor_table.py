@@ -0,0 +1,71 @@
+"""
+Rebuilds the precomputed top-K neighbor table from every vector in the index.
+
+Usage (from the recommendation_service directory):
+    NEIGHBOR_TABLE_PATH=data/neighbors.npz python -m scripts.build_neighbor_table --k 100
+"""
+import argparse
+import time
+
+from core.neighbors import NeighborTable
+from core.similarity import densify
+from services.vector_index import vector_index
+from services.neighbor_table import neighbor_table, NEIGHBOR_TABLE_PATH
+
+FETCH_CHUNK_SIZE = 1000
+
+
+def load_all_vectors() -> tuple:
+    """
+    Returns (ids, matrix) for every user in the index. The local backend hands
+    over its matrix directly; other backends are read back in chunks.
+    """
+    snapshot = vector_index.read_matrix(lambda matrix, ids, rows: (list(ids), matrix.copy()))
+    if snapshot is not None:
+        return snapshot
+
+    vectors = {}
+    chunk = []
+    for user_id in vector_index.list_user_ids():
+        chunk.append(user_id)
+        if len(chunk) == FETCH_CHUNK_SIZE:
+            vectors.update(vector_index.fetch_user_vectors(chunk))
+            print(f"Fetched {len(vectors)} vectors...")
+            chunk = []
+    if chunk:
+        vectors.update(vector_index.fetch_user_vectors(chunk))
+    return densify(vectors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the precomputed neighbor table.")
+    parser.add_argument("--k", type=int, default=100, help="Neighbors kept per user.")
+    parser.add_argument("--memory-budget-mb", type=int, default=512, help="Memory for in-flight score blocks.")
+    parser.add_argument("--workers", type=int, default=None, help="Threads to use (default: all CPUs).")
+    args = parser.parse_args()
+
+    if neighbor_table is None:
+        raise SystemExit("NEIGHBOR_TABLE_PATH is not set. Nowhere to write the table.")
+
+    print("Loading vectors...")
+    started = time.perf_counter()
+    ids, matrix = load_all_vectors()
+    print(f"Loaded {len(ids)} vectors with {matrix.shape[1]} dimensions in {time.perf_counter() - started:.1f}s.")
+
+    print(f"Computing top-{args.k} neighbors...")
+    started = time.perf_counter()
+    table = NeighborTable.build(
+        ids,
+        matrix,
+        args.k,
+        memory_budget_bytes=args.memory_budget_mb * 1024 * 1024,
+        workers=args.workers,
+    )
+    print(f"Computed neighbors in {time.perf_counter() - started:.1f}s.")
+
+    neighbor_table.replace(table)
+    print(f"✅ Wrote neighbor table for {len(ids)} users to '{NEIGHBOR_TABLE_PATH}'.")
+
+
+if __name__ == "__main__":
+    main()
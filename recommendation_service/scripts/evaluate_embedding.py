@@ -0,0 +1,101 @@
+"""
+Measures how well an embedding projection preserves recommendations.
+
+For a random sample of users, the exact top-k by cosine similarity on the raw
+sparse vectors is compared with the top-k by similarity of the embeddings,
+and recall@k is reported together with storage and query-time figures.
+
+Usage (from the recommendation_service directory):
+    python -m scripts.evaluate_embedding --embedding data/embedding.npz
+    python -m scripts.evaluate_embedding --dim 128 --k 10 50   # an unsaved random projection
+"""
+import time
+import argparse
+
+import numpy as np
+
+from core.embedding import Projection, SparseMatrix
+from core.neighbors import top_k_rows
+from scripts.fit_embedding import load_sample_vectors
+
+QUERY_BLOCK_SIZE = 64
+
+
+def recall_at_k(exact_scores: np.ndarray, approx_top: np.ndarray, k: int) -> np.ndarray:
+    """
+    Per-query recall@k of an approximate top-k against exact scores.
+
+    Ties are common (e.g. users sharing a single genre), so a returned user
+    counts as a hit if its exact score is at least the exact k-th best. Only
+    users with a positive exact score can be relevant.
+    """
+    _, exact_top_scores = top_k_rows(exact_scores, k)
+    kth_score = np.maximum(exact_top_scores[:, -1], np.finfo(np.float32).tiny)
+    relevant = np.minimum((exact_scores > 0.0).sum(axis=1), k)
+    hits = (np.take_along_axis(exact_scores, approx_top[:, :k], axis=1) >= kth_score[:, None]).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(relevant > 0, np.minimum(hits, relevant) / relevant, np.nan)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recall@k of an embedding projection against exact cosine.")
+    parser.add_argument("--embedding", help="A saved projection to evaluate.")
+    parser.add_argument("--dim", type=int, default=256, help="Without --embedding: evaluate an unsaved random projection.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sample", type=int, default=20000, help="Users in the evaluated population.")
+    parser.add_argument("--queries", type=int, default=1000, help="Users whose recommendations are compared.")
+    parser.add_argument("--k", type=int, nargs="+", default=[10, 50, 100])
+    args = parser.parse_args()
+
+    projection = Projection.load(args.embedding) if args.embedding else Projection.random(args.dim, seed=args.seed)
+    print(f"Evaluating projection '{projection.version}'.")
+
+    print(f"Vectorizing a sample of {args.sample} users...")
+    _, vectors = load_sample_vectors(args.sample)
+    raw = SparseMatrix.from_vectors(vectors)
+    started = time.perf_counter()
+    embedded = projection.embed_many(vectors)
+    embed_seconds = time.perf_counter() - started
+    n_users = raw.shape[0]
+    n_queries = min(args.queries, n_users)
+    max_k = min(max(args.k), n_users - 1)
+    print(f"{n_users} users, {raw.shape[1]} distinct positions, {n_queries} queries.")
+
+    recalls = {k: [] for k in args.k if k <= max_k}
+    exact_seconds = approx_seconds = 0.0
+    for start in range(0, n_queries, QUERY_BLOCK_SIZE):
+        queries = np.arange(start, min(start + QUERY_BLOCK_SIZE, n_queries))
+        self_cells = (np.arange(queries.size), queries)
+
+        started = time.perf_counter()
+        exact_scores = raw.dot(raw.dense_rows(queries)).T
+        exact_seconds += time.perf_counter() - started
+        exact_scores[self_cells] = -np.inf
+
+        started = time.perf_counter()
+        approx_scores = embedded[queries] @ embedded.T
+        approx_seconds += time.perf_counter() - started
+        approx_scores[self_cells] = -np.inf
+        approx_top, _ = top_k_rows(approx_scores, max_k)
+
+        for k in recalls:
+            recalls[k].append(recall_at_k(exact_scores, approx_top, k))
+
+    print("\nRecall against exact cosine on the raw vectors:")
+    for k, values in recalls.items():
+        values = np.concatenate(values)
+        print(f"  recall@{k}: {np.nanmean(values):.3f} (over {np.count_nonzero(~np.isnan(values))} users with any match)")
+
+    raw_bytes = raw.indptr[-1] * 8 / n_users
+    print("\nStorage per user:")
+    print(f"  raw sparse:  {raw_bytes:.0f} bytes ({raw.indptr[-1] / n_users:.0f} non-zeros x uint32 index + float32 value)")
+    print(f"  raw dense (one column per position): {raw.shape[1] * 4} bytes")
+    print(f"  embedding:   {projection.dim * 4} bytes")
+    print("\nTime:")
+    print(f"  embedding {n_users} users: {embed_seconds:.2f}s")
+    print(f"  exact sparse scoring: {exact_seconds / n_queries * 1000:.2f} ms/query")
+    print(f"  embedding scoring:    {approx_seconds / n_queries * 1000:.2f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Exports the artist, genre and track vocabularies from MongoDB to a compact,
+memory-mapped snapshot file (see core/vocab_snapshot.py). Every worker and
+API process with VOCAB_SNAPSHOT_PATH set maps the same file, so known items
+are resolved in microseconds without MongoDB and without a per-process copy.
+Only items added after the export still go to MongoDB.
+
+The file is replaced atomically and processes switch to the new one within
+VOCAB_SNAPSHOT_RELOAD_INTERVAL seconds. Vocabulary indices never change once
+assigned, so a snapshot never goes stale; re-exporting only covers more items.
+
+Usage (from the recommendation_service directory):
+    VOCAB_SNAPSHOT_PATH=data/vocab.snapshot python -m scripts.export_vocabulary_snapshot
+    python -m scripts.export_vocabulary_snapshot --every 3600   # keep refreshing it
+"""
+import time
+import argparse
+
+from core.vocab_snapshot import write_snapshot
+from services.mongo_client import get_collection, ARTIST_VOCAB_COLLECTION, GENRE_VOCAB_COLLECTION, TRACK_VOCAB_COLLECTION
+from services.vocab_snapshot import VOCAB_SNAPSHOT_PATH
+
+# Snapshot section -> (collection, key field)
+VOCABULARIES = {
+    "artist": (ARTIST_VOCAB_COLLECTION, "spotifyId"),
+    "genre": (GENRE_VOCAB_COLLECTION, "name"),
+    "track": (TRACK_VOCAB_COLLECTION, "spotifyId"),
+}
+
+
+def read_vocabularies() -> dict:
+    """Reads every vocabulary from MongoDB as a dict of key -> index per section."""
+    vocabularies = {}
+    for section, (collection, key_field) in VOCABULARIES.items():
+        vocabularies[section] = {
+            doc[key_field]: doc["index"]
+            for doc in get_collection(collection).find({}, {key_field: 1, "index": 1, "_id": 0})
+        }
+    return vocabularies
+
+
+def export(path: str):
+    started = time.perf_counter()
+    vocabularies = read_vocabularies()
+    write_snapshot(path, vocabularies)
+    counts = ", ".join(f"{len(entries)} {section}s" for section, entries in vocabularies.items())
+    print(f"✅ Exported {counts} to '{path}' in {time.perf_counter() - started:.1f}s.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the vocabularies to a memory-mapped snapshot.")
+    parser.add_argument("--path", default=VOCAB_SNAPSHOT_PATH, help="Where to write it (default: VOCAB_SNAPSHOT_PATH).")
+    parser.add_argument("--every", type=float, default=0, help="Re-export every this many seconds instead of once.")
+    args = parser.parse_args()
+
+    if not args.path:
+        raise SystemExit("VOCAB_SNAPSHOT_PATH is not set and --path was not given. Nowhere to write the snapshot.")
+
+    if args.every <= 0:
+        export(args.path)
+        return
+    while True:
+        try:
+            export(args.path)
+        except Exception as e:
+            # Processes keep using the previous snapshot (or MongoDB); try again next time
+            print(f"Snapshot export failed: {e}")
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Creates the projection that compacts user vectors into small dense embeddings.
+
+"random" needs no data: it is fully determined by --dim and --seed. "svd" is
+fitted on a random sample of users' vectors and only knows positions that
+appear in at least --min-users of them.
+
+Usage (from the recommendation_service directory):
+    python -m scripts.fit_embedding --method random --dim 256 --output data/embedding.npz
+    python -m scripts.fit_embedding --method svd --dim 256 --sample 50000 --output data/embedding.npz
+
+Then evaluate it (scripts.evaluate_embedding), set EMBEDDING_PATH to the output
+for both the worker and the API, and re-vectorize every user (scripts.backfill_vectors)
+into a fresh index: a new projection invalidates every stored embedding.
+"""
+import time
+import asyncio
+import argparse
+
+from core import vectorization
+from core.embedding import Projection, SparseMatrix
+
+DEFAULT_OUTPUT_PATH = "data/embedding.npz"
+
+
+def load_sample_vectors(size: int) -> tuple:
+    """
+    Vectorizes a random sample of users straight from their musicTaste.
+
+    Returns:
+        (ids, vectors): the user IDs and their raw SparseVectors, without users
+        whose taste is empty.
+    """
+    from services.mongo_client import get_collection
+
+    users = list(get_collection("users").aggregate([
+        {"$match": {"musicTaste": {"$exists": True}}},
+        {"$sample": {"size": size}},
+        {"$project": {"musicTaste": 1}},
+    ]))
+    vectors = asyncio.run(vectorization.create_user_vectors([user["musicTaste"] for user in users]))
+    pairs = [(str(user["_id"]), vector) for user, vector in zip(users, vectors) if vector.nnz > 0]
+    return [user_id for user_id, _ in pairs], [vector for _, vector in pairs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create an embedding projection for user vectors.")
+    parser.add_argument("--method", choices=["random", "svd"], default="random")
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimensions.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--nonzeros", type=int, default=4, help="'random' only: output dimensions per input position.")
+    parser.add_argument("--sample", type=int, default=50000, help="'svd' only: users to fit on.")
+    parser.add_argument("--min-users", type=int, default=2, help="'svd' only: drop positions held by fewer users.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_PATH, help="Where to write the projection.")
+    args = parser.parse_args()
+
+    if args.method == "random":
+        projection = Projection.random(args.dim, seed=args.seed, nonzeros=args.nonzeros)
+    else:
+        print(f"Vectorizing a sample of {args.sample} users...")
+        _, vectors = load_sample_vectors(args.sample)
+        matrix = SparseMatrix.from_vectors(vectors)
+        # A position only one user holds never makes two users similar
+        matrix = matrix.keep_columns(matrix.column_nnz() >= args.min_users)
+        print(f"Fitting a {args.dim}-dimension SVD on {matrix.shape[0]} users x {matrix.shape[1]} positions...")
+        started = time.perf_counter()
+        projection = Projection.fit_svd(matrix, args.dim, seed=args.seed)
+        print(f"Fitted in {time.perf_counter() - started:.1f}s.")
+
+    projection.save(args.output)
+    print(f"✅ Wrote projection '{projection.version}' to '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
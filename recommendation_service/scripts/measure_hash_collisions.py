@@ -0,0 +1,66 @@
+"""
+Measures how often feature hashing would put two different vocabulary items
+in the same bucket, using the real artist, genre and track vocabularies.
+
+Usage (from the recommendation_service directory):
+    python -m scripts.measure_hash_collisions
+    python -m scripts.measure_hash_collisions --artist-space 2097152 --track-space 8388608
+"""
+import argparse
+from collections import Counter
+
+from core import vectorization
+from core.hashing import hash_feature
+
+
+def collision_report(keys: list, salt: bytes, space: int) -> dict:
+    """
+    Hashes every key and counts how many of them share a bucket with another key.
+    Also returns what uniform random hashing would give for the same sizes.
+    """
+    buckets = Counter(hash_feature(key, salt, space)[0] for key in keys)
+    colliding_items = sum(count for count in buckets.values() if count > 1)
+    n = len(keys)
+    # Probability that a given item shares its bucket with at least one of the n - 1 others
+    expected_rate = 1.0 - (1.0 - 1.0 / space) ** (n - 1) if n > 1 else 0.0
+    return {
+        "items": n,
+        "space": space,
+        "load": n / space,
+        "buckets_used": len(buckets),
+        "colliding_items": colliding_items,
+        "collision_rate": colliding_items / n if n else 0.0,
+        "expected_rate": expected_rate,
+        "largest_bucket": max(buckets.values(), default=0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure feature-hashing collisions against the vocab collections.")
+    parser.add_argument("--artist-space", type=int, default=vectorization.ARTIST_HASH_SPACE)
+    parser.add_argument("--genre-space", type=int, default=vectorization.GENRE_HASH_SPACE)
+    parser.add_argument("--track-space", type=int, default=vectorization.TRACK_HASH_SPACE)
+    args = parser.parse_args()
+
+    from services.mongo_client import (
+        get_collection, ARTIST_VOCAB_COLLECTION, GENRE_VOCAB_COLLECTION, TRACK_VOCAB_COLLECTION
+    )
+
+    sections = [
+        ("artists", get_collection(ARTIST_VOCAB_COLLECTION), "spotifyId", vectorization.ARTIST_HASH_SALT, args.artist_space),
+        ("genres", get_collection(GENRE_VOCAB_COLLECTION), "name", vectorization.GENRE_HASH_SALT, args.genre_space),
+        ("tracks", get_collection(TRACK_VOCAB_COLLECTION), "spotifyId", vectorization.TRACK_HASH_SALT, args.track_space),
+    ]
+    for name, collection, key_field, salt, space in sections:
+        keys = [doc[key_field] for doc in collection.find({}, {key_field: 1, "_id": 0})]
+        report = collision_report(keys, salt, space)
+        print(
+            f"{name:>8}: {report['items']} items in {report['space']} buckets "
+            f"(load {report['load']:.4f}), {report['colliding_items']} colliding "
+            f"({report['collision_rate']:.3%}, uniform hashing expects {report['expected_rate']:.3%}), "
+            f"largest bucket {report['largest_bucket']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from dotenv import load_dotenv
+
+from .mongo_client import get_collection, get_async_collection
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+CONNECTION_CACHE_SIZE = int(os.getenv("CONNECTION_CACHE_SIZE", 10000))
+# Kept short: a request the user just sent should stop being recommended quickly
+CONNECTION_CACHE_TTL_SECONDS = float(os.getenv("CONNECTION_CACHE_TTL_SECONDS", 30))
+
+# Collections owned by the Node backend (Mongoose models 'User' and 'ConnectionRequest')
+USERS_COLLECTION = "users"
+CONNECTION_REQUESTS_COLLECTION = "connectionrequests"
+
+_cache = OrderedDict()  # user ID -> (set of connected user IDs, expires_at)
+_cache_lock = threading.Lock()
+
+
+def _connection_queries(object_id: ObjectId) -> tuple:
+    user_query = ({"_id": object_id}, {"friends": 1})
+    requests_query = (
+        {"$or": [{"fromUserId": object_id}, {"toUserId": object_id}]},
+        {"fromUserId": 1, "toUserId": 1}
+    )
+    return user_query, requests_query
+
+
+def _collect_connected(user_id: str, user_doc, request_docs) -> set:
+    connected = set()
+    if user_doc:
+        connected.update(str(friend_id) for friend_id in user_doc.get("friends", []))
+    for request_doc in request_docs:
+        connected.add(str(request_doc["fromUserId"]))
+        connected.add(str(request_doc["toUserId"]))
+    connected.discard(user_id)
+    return connected
+
+
+def _load_connected_user_ids(user_id: str) -> set:
+    """
+    Reads a user's friends and everyone they have a connection request with,
+    in either direction and with any status, straight from MongoDB.
+    """
+    try:
+        object_id = ObjectId(user_id)
+    except (InvalidId, TypeError):
+        # Not a Mongo user ID, so there can be no connections
+        return set()
+
+    user_query, requests_query = _connection_queries(object_id)
+    user_doc = get_collection(USERS_COLLECTION).find_one(*user_query)
+    request_docs = get_collection(CONNECTION_REQUESTS_COLLECTION).find(*requests_query)
+    return _collect_connected(user_id, user_doc, request_docs)
+
+
+async def _load_connected_user_ids_async(user_id: str) -> set:
+    """The same as _load_connected_user_ids, on the async client."""
+    try:
+        object_id = ObjectId(user_id)
+    except (InvalidId, TypeError):
+        return set()
+
+    user_query, requests_query = _connection_queries(object_id)
+    user_doc = await get_async_collection(USERS_COLLECTION).find_one(*user_query)
+    request_docs = [doc async for doc in get_async_collection(CONNECTION_REQUESTS_COLLECTION).find(*requests_query)]
+    return _collect_connected(user_id, user_doc, request_docs)
+
+
+def _cached(user_id: str):
+    with _cache_lock:
+        entry = _cache.get(user_id)
+        if entry is not None and time.monotonic() < entry[1]:
+            _cache.move_to_end(user_id)
+            return entry[0]
+    return None
+
+
+def _remember(user_id: str, connected: set):
+    with _cache_lock:
+        _cache[user_id] = (connected, time.monotonic() + CONNECTION_CACHE_TTL_SECONDS)
+        _cache.move_to_end(user_id)
+        while len(_cache) > CONNECTION_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def get_connected_user_ids(user_id: str) -> set:
+    """
+    Returns the IDs of the users that should never be recommended to this user:
+    their friends and anyone with a pending, accepted or rejected request.
+    Results are cached for CONNECTION_CACHE_TTL_SECONDS.
+    """
+    connected = _cached(user_id)
+    if connected is None:
+        connected = _load_connected_user_ids(user_id)
+        _remember(user_id, connected)
+    return connected
+
+
+async def get_connected_user_ids_async(user_id: str) -> set:
+    """get_connected_user_ids for the async API: reads MongoDB without blocking the event loop."""
+    connected = _cached(user_id)
+    if connected is None:
+        connected = await _load_connected_user_ids_async(user_id)
+        _remember(user_id, connected)
+    return connected
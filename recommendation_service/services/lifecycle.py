@@ -0,0 +1,91 @@
+import os
+import time
+import threading
+
+from dotenv import load_dotenv
+
+from services import mongo_client
+from services.vector_index import vector_index
+from services.neighbor_table import neighbor_table
+from services.vocab_snapshot import vocab_snapshot
+from services.logging_config import get_logger
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+# Open connections and load data on a background thread as soon as the API starts,
+# so the first requests don't pay for it. Startup itself never waits on it.
+WARM_UP_ON_START = os.getenv("WARM_UP_ON_START", "true").lower() == "true"
+
+logger = get_logger(__name__)
+
+_warm_lock = threading.Lock()
+_warm = False
+_last_error = None
+
+
+def warm_up() -> bool:
+    """
+    Connects to MongoDB and the vector index and loads any on-disk data, once
+    per process. Concurrent callers wait for the one in progress.
+
+    Returns:
+        True if the process is warm, False if a step failed (it is retried on the next call).
+    """
+    global _warm, _last_error
+    with _warm_lock:
+        if _warm:
+            return True
+        started = time.perf_counter()
+        try:
+            mongo_client.ping()
+            vector_index.warm_up()
+            if neighbor_table is not None:
+                neighbor_table.warm_up()
+            if vocab_snapshot is not None:
+                vocab_snapshot.warm_up()
+        except Exception as e:
+            _last_error = str(e)
+            logger.warning("Warm-up failed", extra={"error": str(e)})
+            return False
+        _warm = True
+        _last_error = None
+        logger.info("Warm-up finished", extra={"seconds": round(time.perf_counter() - started, 3)})
+        return True
+
+
+def start_background_warm_up():
+    """Runs warm_up() on a daemon thread if WARM_UP_ON_START is enabled."""
+    if not WARM_UP_ON_START:
+        return None
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def readiness() -> tuple:
+    """
+    Checks whether the process can serve requests.
+
+    Warm-up must have succeeded; if it hasn't run (or failed), it is attempted
+    now. MongoDB is then pinged on every call, since it can go away after warm-up.
+
+    Returns:
+        (ready, checks): whether every check passed, and each check's status.
+    """
+    checks = {}
+    if _warm:
+        checks["warmUp"] = "ok"
+    elif _warm_lock.locked():
+        checks["warmUp"] = "in progress"
+    else:
+        checks["warmUp"] = "ok" if warm_up() else f"error: {_last_error}"
+
+    try:
+        mongo_client.ping()
+        checks["mongo"] = "ok"
+    except Exception as e:
+        checks["mongo"] = f"error: {e}"
+
+    return all(status == "ok" for status in checks.values()), checks
@@ -0,0 +1,417 @@
+import os
+import fcntl
+import threading
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from core.vectorization import SparseVector
+from services.vector_index_backend import VectorIndexBackend
+from services.logging_config import get_logger
+from services.metrics import INDEX_UPSERT_SECONDS, INDEX_UPSERT_BATCH_SIZE, INDEX_QUERY_SECONDS
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+# How often (in seconds) pending writes are persisted to disk.
+LOCAL_INDEX_SAVE_INTERVAL = float(os.getenv("LOCAL_INDEX_SAVE_INTERVAL", 5))
+# How often (in seconds) a reader checks the file on disk for writes made by another process.
+LOCAL_INDEX_RELOAD_INTERVAL = float(os.getenv("LOCAL_INDEX_RELOAD_INTERVAL", 2))
+
+INITIAL_ROWS = 1024
+
+logger = get_logger(__name__)
+
+
+class LocalVectorIndex(VectorIndexBackend):
+    """
+    An in-process vector index backed by a contiguous NumPy matrix.
+
+    Every row is a user's dense embedding (see core/embedding.py), normalized
+    to unit length, so a single matrix-vector product gives the cosine
+    similarity against every user. The matrix is only 'dim' columns wide,
+    whatever the size of the vocabulary.
+
+    It needs a projection: raw sparse vectors would need a column for every
+    position in the vocabulary, which makes the matrix, every query and every
+    save grow with the vocabulary rather than with the number of users.
+
+    The index is persisted to a single .npz file. Writes are flushed at most
+    every LOCAL_INDEX_SAVE_INTERVAL seconds, and other processes (e.g. the API
+    reading what the worker wrote) pick up a newer file on their next query.
+    Saving and reloading read and write the file without holding the lock, so
+    queries and upserts carry on meanwhile.
+
+    Processes take turns to write (see _begin_write), so the worker and
+    scripts/backfill_vectors.py can run side by side without one overwriting
+    the other's writes.
+    """
+    def __init__(self, path: str, projection):
+        if projection is None:
+            raise ValueError(
+                "The local vector index stores dense embeddings and needs a projection. Create one with "
+                "'python -m scripts.fit_embedding --method random --output data/embedding.npz' and set EMBEDDING_PATH to it."
+            )
+        self.path = path
+        self.projection = projection
+        self._lock = threading.RLock()
+        # Held by the one save in progress, while the file is being written
+        self._save_lock = threading.Lock()
+        self._reset()
+        self._dirty = False
+        # Counts writes, so a save can tell whether any arrived while it was writing
+        self._version = 0
+        # The open '<path>.lock' file while this process holds the writer lock
+        self._writer_file = None
+        self._last_save = time.monotonic()
+        self._loaded_mtime = None
+        self._last_reload_check = 0.0
+        # The file is read on first use rather than at construction
+        self._initialized = False
+
+    @property
+    def name(self) -> str:
+        return f"local:{self.path}"
+
+    def _ensure_loaded(self):
+        """Reads the index file the first time the index is used. Call with the lock held."""
+        if self._initialized:
+            return
+        logger.info("Initializing local vector index", extra={"path": self.path})
+        if os.path.exists(self.path):
+            self._load()
+        self._initialized = True
+        logger.info("Local vector index ready", extra={"users": self._n_rows, "dimensions": self.projection.dim})
+
+    def warm_up(self):
+        with self._lock:
+            self._ensure_loaded()
+
+    # --- Storage helpers ---
+
+    def _reset(self):
+        self._matrix = np.zeros((INITIAL_ROWS, self.projection.dim), dtype=np.float32)
+        self._ids = []          # row -> user ID
+        self._rows = {}         # user ID -> row
+        self._n_rows = 0
+
+    def _grow(self, rows: int):
+        """Reallocates the matrix so it can hold at least the given number of rows."""
+        capacity = self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        while capacity < rows:
+            capacity *= 2
+        grown = np.zeros((capacity, self._matrix.shape[1]), dtype=np.float32)
+        grown[:self._n_rows] = self._matrix[:self._n_rows]
+        self._matrix = grown
+
+    # --- Persistence ---
+
+    def _read_file(self) -> tuple:
+        """
+        Reads the index file, without touching the in-memory index.
+
+        Returns:
+            (mtime, ids, matrix) of the file that was read.
+        """
+        with open(self.path, "rb") as f:
+            mtime = os.fstat(f.fileno()).st_mtime_ns
+            with np.load(f) as data:
+                ids = data["ids"].tolist()
+                matrix = data["matrix"]
+                embedding = str(data["embedding"]) if "embedding" in data.files else ""
+        if embedding != self._embedding_version():
+            raise ValueError(
+                f"Local vector index '{self.path}' holds {embedding or 'raw sparse'} vectors, but this process "
+                f"uses {self._embedding_version()} vectors. Check EMBEDDING_PATH, or backfill "
+                f"into a new LOCAL_INDEX_PATH."
+            )
+        return mtime, ids, matrix
+
+    def _install(self, state: tuple):
+        """Replaces the in-memory index with what _read_file returned. Call with the lock held."""
+        mtime, ids, matrix = state
+        self._reset()
+        self._grow(len(ids))
+        self._matrix[:len(ids)] = matrix
+        self._ids = ids
+        self._rows = {user_id: row for row, user_id in enumerate(ids)}
+        self._n_rows = len(ids)
+        self._loaded_mtime = mtime
+
+    def _load(self):
+        self._install(self._read_file())
+
+    def _embedding_version(self) -> str:
+        return self.projection.version
+
+    def _begin_write(self):
+        """
+        Makes sure this process holds the writer lock before it changes the index.
+        Call with the lock held.
+
+        The writer lock is an exclusive flock on '<path>.lock', taken before the
+        first unsaved write and released by the save that writes it to disk. A
+        process that takes it re-reads the file first if another process saved
+        since it was last read, so no process saves over writes it never saw.
+        """
+        self._ensure_loaded()
+        if self._writer_file is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        writer_file = open(f"{self.path}.lock", "a")
+        try:
+            try:
+                fcntl.flock(writer_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.warning("Waiting for another process to save the local vector index", extra={"path": self.path})
+                fcntl.flock(writer_file, fcntl.LOCK_EX)
+        except BaseException:
+            writer_file.close()
+            raise
+        self._writer_file = writer_file
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._loaded_mtime:
+            logger.info("Reloading local vector index saved by another process", extra={"path": self.path})
+            self._load()
+
+    def _release_writer(self):
+        """Lets other processes write. Call with the lock held, once nothing is left unsaved."""
+        if self._writer_file is not None:
+            fcntl.flock(self._writer_file, fcntl.LOCK_UN)
+            self._writer_file.close()
+            self._writer_file = None
+
+    def _save(self, wait: bool = True):
+        """
+        Writes the index to disk. The matrix is copied under the lock and written
+        without it. Only one save runs at a time; with wait=False, a save that
+        finds another one running returns at once. Call without the lock held.
+        """
+        if not self._save_lock.acquire(blocking=wait):
+            return
+        try:
+            with self._lock:
+                if not self._dirty:
+                    return
+                version = self._version
+                ids = list(self._ids)
+                matrix = self._matrix[:self._n_rows].copy()
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp.{os.getpid()}.npz"
+            np.savez(tmp_path, ids=np.asarray(ids, dtype=str), matrix=matrix, embedding=np.asarray(self._embedding_version()))
+            # Atomic swap so readers never see a partially written file
+            os.replace(tmp_path, self.path)
+            mtime = os.stat(self.path).st_mtime_ns
+
+            with self._lock:
+                self._loaded_mtime = mtime
+                self._last_save = time.monotonic()
+                if self._version == version:
+                    # Nothing changed while writing: everything is on disk
+                    self._dirty = False
+                    self._release_writer()
+        finally:
+            self._save_lock.release()
+
+    def _maybe_save(self):
+        """Saves if there are unsaved writes and the save interval has passed. Call without the lock held."""
+        if self._dirty and time.monotonic() - self._last_save >= LOCAL_INDEX_SAVE_INTERVAL:
+            self._save(wait=False)
+
+    def _maybe_reload(self):
+        """
+        Picks up a newer file saved by another process. Local unsaved writes take
+        precedence. The file is read without the lock, so queries keep being
+        answered from the current matrix until it is swapped in. Call without
+        the lock held.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            now = time.monotonic()
+            if self._dirty or now - self._last_reload_check < LOCAL_INDEX_RELOAD_INTERVAL:
+                return
+            self._last_reload_check = now
+            loaded_mtime = self._loaded_mtime
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == loaded_mtime:
+            return
+        logger.info("Reloading local vector index", extra={"path": self.path})
+        state = self._read_file()
+        with self._lock:
+            # Unless this process wrote, or another thread reloaded, in the meantime
+            if not self._dirty and self._loaded_mtime == loaded_mtime:
+                self._install(state)
+
+    def flush(self):
+        """Writes any pending changes to disk immediately."""
+        self._save()
+
+    def flush_if_due(self):
+        self._maybe_save()
+
+    # --- VectorIndexBackend ---
+
+    def _validate(self, user_id: str, vector: SparseVector) -> np.ndarray:
+        """Checks a vector before it is stored, and returns its embedding."""
+        if not isinstance(user_id, str) or not user_id:
+            raise ValueError("user_id must be a non-empty string.")
+        if not isinstance(vector, SparseVector):
+            raise TypeError("vector must be a SparseVector.")
+        if vector.nnz == 0:
+            raise ValueError(f"vector for user {user_id} has no non-zero entries.")
+        embedding = self.projection.embed(vector)
+        if not embedding.any():
+            raise ValueError(f"vector for user {user_id} has no positions known to embedding '{self.projection.version}'.")
+        return embedding
+
+    def _upsert_row(self, user_id: str, embedding: np.ndarray):
+        row = self._rows.get(user_id)
+        if row is None:
+            # New user: append a row at the end of the matrix
+            self._grow(self._n_rows + 1)
+            row = self._n_rows
+            self._rows[user_id] = row
+            self._ids.append(user_id)
+            self._n_rows += 1
+        # Existing users are updated in place; embeddings are already unit length
+        self._matrix[row] = embedding
+        self._version += 1
+        self._dirty = True
+
+    @INDEX_UPSERT_SECONDS.time(backend="local")
+    def upsert_user_vector(self, user_id: str, vector: SparseVector):
+        INDEX_UPSERT_BATCH_SIZE.observe(1, backend="local")
+        vector = self._validate(user_id, vector)
+        with self._lock:
+            self._begin_write()
+            self._upsert_row(user_id, vector)
+        self._maybe_save()
+
+    @INDEX_UPSERT_SECONDS.time(backend="local")
+    def upsert_user_vectors(self, items: list):
+        INDEX_UPSERT_BATCH_SIZE.observe(len(items), backend="local")
+        items = [(user_id, self._validate(user_id, vector)) for user_id, vector in items]
+        with self._lock:
+            self._begin_write()
+            for user_id, vector in items:
+                self._upsert_row(user_id, vector)
+        self._maybe_save()
+
+    def delete_user_vector(self, user_id: str):
+        with self._lock:
+            self._ensure_loaded()
+            if user_id not in self._rows:
+                return
+            self._begin_write()
+            # Taking the writer lock may have re-read the file
+            row = self._rows.pop(user_id, None)
+            if row is None:
+                return
+            # Move the last row into the freed slot so the matrix stays contiguous
+            last = self._n_rows - 1
+            if row != last:
+                moved_id = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = moved_id
+                self._rows[moved_id] = row
+            self._matrix[last] = 0.0
+            self._ids.pop()
+            self._n_rows -= 1
+            self._version += 1
+            self._dirty = True
+        self._maybe_save()
+
+    @INDEX_QUERY_SECONDS.time(backend="local", kind="single")
+    def query_similar_users(self, user_id: str, top_k: int = 50) -> list:
+        if not isinstance(user_id, str) or not user_id:
+            raise ValueError("user_id must be a non-empty string.")
+
+        self._maybe_reload()
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is None or top_k <= 0:
+                return []
+
+            matrix = self._matrix[:self._n_rows]
+            scores = matrix @ matrix[row]
+            return self._top_k(scores, top_k)
+
+    def _top_k(self, scores: np.ndarray, top_k: int) -> list:
+        """Turns one row of scores against every user into a sorted list of the best top_k."""
+        k = min(top_k, scores.size)
+        # argpartition finds the k best in O(n); only those k are then sorted
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        # Users with no overlap at all are not recommendations
+        return [
+            {"userId": self._ids[i], "score": float(scores[i])}
+            for i in top
+            if scores[i] > 0.0
+        ]
+
+    @INDEX_QUERY_SECONDS.time(backend="local", kind="batch")
+    def query_similar_users_batch(self, user_ids: list, top_k: int = 50) -> dict:
+        """
+        Finds similar users for several users with a single matrix product.
+
+        Returns:
+            A dict mapping each user ID to its list of {'userId', 'score'} dicts.
+            Users without a vector get an empty list.
+        """
+        self._maybe_reload()
+        with self._lock:
+            results = {user_id: [] for user_id in user_ids}
+            known = [user_id for user_id in user_ids if user_id in self._rows]
+            if not known or top_k <= 0:
+                return results
+
+            matrix = self._matrix[:self._n_rows]
+            query_rows = np.fromiter((self._rows[user_id] for user_id in known), dtype=np.int64, count=len(known))
+            # One (queries x users) product scores every query against every user
+            scores = matrix[query_rows] @ matrix.T
+            for user_id, user_scores in zip(known, scores):
+                results[user_id] = self._top_k(user_scores, top_k)
+            return results
+
+    def fetch_user_vectors(self, user_ids: list) -> dict:
+        self._maybe_reload()
+        with self._lock:
+            # Embeddings keep every dimension, zeros included, one position each
+            positions = np.arange(self.projection.dim, dtype=np.uint32)
+            return {
+                user_id: SparseVector(positions, self._matrix[self._rows[user_id]].copy())
+                for user_id in user_ids
+                if user_id in self._rows
+            }
+
+    def list_user_ids(self):
+        self._maybe_reload()
+        with self._lock:
+            return list(self._ids)
+
+    def read_matrix(self, callback):
+        self._maybe_reload()
+        with self._lock:
+            matrix = self._matrix[:self._n_rows]
+            return callback(matrix, self._ids, self._rows)
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return self._n_rows
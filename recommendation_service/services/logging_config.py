@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import time
+import atexit
+import queue
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" writes one JSON object per line for log collectors; "text" is easier to read in a terminal.
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Each distinct message is written at most LOG_RATE_LIMIT times per interval; the rest are counted.
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", 20))
+LOG_RATE_LIMIT_INTERVAL_SECONDS = float(os.getenv("LOG_RATE_LIMIT_INTERVAL_SECONDS", 10))
+
+# Attributes every LogRecord has; anything else on a record came in through 'extra'
+_STANDARD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+_configure_lock = threading.Lock()
+_configured = False
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in record.__dict__.items() if key not in _STANDARD_ATTRIBUTES}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object, with any 'extra' fields as top-level keys."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formats a record as a readable line, with any 'extra' fields as key=value pairs."""
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets each distinct message (the same logger and message template) through
+    at most 'limit' times per 'interval' seconds. When a new interval starts,
+    the first record that gets through reports how many were dropped.
+    """
+    def __init__(self, limit: int, interval: float):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows = {}  # (logger, template) -> [window start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit <= 0:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.limit:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+def configure_logging():
+    """
+    Sets up the root logger once per process. Records are queued and written
+    by a background thread, so logging never blocks a request or a message
+    on a stdout write.
+    """
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT, LOG_RATE_LIMIT_INTERVAL_SECONDS))
+        listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+
+        root = logging.getLogger()
+        root.handlers = [queue_handler]
+        root.setLevel(LOG_LEVEL)
+        _configured = True
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Returns a logger for a module, configuring logging for the process on first use."""
+    configure_logging()
+    return logging.getLogger(name)
@@ -0,0 +1,276 @@
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+# Port of the worker's own /metrics endpoint (the API serves /metrics itself). 0 disables it.
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", 9100))
+
+# The Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}   # label values -> state
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}.")
+        return tuple(str(labels[name]).replace("\\", "\\\\").replace('"', '\\"') for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+
+class Counter(_Metric):
+    """A value that only goes up, e.g. the number of messages processed."""
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _render_samples(self, items: list) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, e.g. the number of messages in flight."""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def _render_samples(self, items: list) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """
+    Counts observations in fixed buckets, so percentiles (e.g. p99 latency)
+    can be computed across processes and over any time range when scraped.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        # The last slot counts observations above the largest bucket (+Inf)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][slot] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall-clock duration of the block, in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_samples(self, items: list) -> list:
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += counts[-1]
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The process-wide collection of metrics, rendered in the Prometheus text format.
+
+    Every process keeps its own registry: the API serves it on /metrics and the
+    worker on its own small HTTP endpoint (start_metrics_server).
+    """
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Create a singleton registry for the process.
+registry = MetricsRegistry()
+
+# --- Stage metrics ---
+VOCAB_LOOKUPS = registry.counter(
+    "rhythm_vocab_lookups_total",
+    "Vocabulary keys resolved, by where the index came from (snapshot, cache, database or newly created).",
+    ("vocabulary", "result"),
+)
+VECTORIZE_SECONDS = registry.histogram(
+    "rhythm_vectorize_seconds",
+    "Time to vectorize a group of tastes: resolving vocabulary indices, then building the vectors.",
+    ("stage",),
+)
+INDEX_UPSERT_SECONDS = registry.histogram(
+    "rhythm_index_upsert_seconds", "Time to upsert vectors into the vector index.", ("backend",)
+)
+INDEX_UPSERT_BATCH_SIZE = registry.histogram(
+    "rhythm_index_upsert_batch_size", "Vectors per upsert call.", ("backend",), buckets=SIZE_BUCKETS
+)
+INDEX_QUERY_SECONDS = registry.histogram(
+    "rhythm_index_query_seconds", "Time to query the vector index for similar users.", ("backend", "kind")
+)
+TASTE_UPDATES = registry.counter(
+    "rhythm_taste_updates_total",
+    "Taste updates by how they were applied: skipped as unchanged, rebuilt from stored indices plus the new items (delta), or rebuilt in full.",
+    ("result",),
+)
+WORKER_MESSAGES = registry.counter(
+    "rhythm_worker_messages_total", "Queue messages handled by the worker, by outcome.", ("result",)
+)
+WORKER_BATCH_MESSAGES = registry.histogram(
+    "rhythm_worker_batch_messages", "Messages per processed batch.", buckets=SIZE_BUCKETS
+)
+WORKER_IN_FLIGHT = registry.gauge(
+    "rhythm_worker_in_flight_messages", "Messages the async pipeline is processing right now."
+)
+WORKER_QUEUE_LAG_SECONDS = registry.histogram(
+    "rhythm_worker_queue_lag_seconds", "Time from a message being published to it being acknowledged.", buckets=LAG_BUCKETS
+)
+WORKER_SHARD_QUEUE_DEPTH = registry.gauge(
+    "rhythm_worker_shard_queue_depth", "Messages routed to a worker pool shard and not yet acknowledged.", ("shard",)
+)
+WORKER_SHARD_RESTARTS = registry.counter(
+    "rhythm_worker_shard_restarts_total", "Times the worker pool restarted a shard process after it died.", ("shard",)
+)
+API_REQUEST_SECONDS = registry.histogram(
+    "rhythm_api_request_seconds", "API request latency.", ("endpoint", "method", "status")
+)
+API_IN_FLIGHT = registry.gauge(
+    "rhythm_api_in_flight_requests", "Recommendation requests the async API is serving right now."
+)
+API_REJECTED_REQUESTS = registry.counter(
+    "rhythm_api_rejected_requests_total",
+    "Recommendation requests the async API turned away: shed at the concurrency limit, or timed out.",
+    ("reason",),
+)
+ROOM_INDEX_ROOMS = registry.gauge(
+    "rhythm_room_index_rooms", "Active public rooms in this process's room index."
+)
+ROOM_EVENTS = registry.counter(
+    "rhythm_room_events_total", "Room events applied to the room index, by routing key.", ("event",)
+)
+RECOMMENDATION_SOURCE = registry.counter(
+    "rhythm_recommendation_source_total", "Where recommendations were served from.", ("source",)
+)
+
+
+def message_lag_seconds(headers: dict, timestamp) -> float:
+    """
+    Seconds since a queue message was published, from the publisher's
+    'publishedAtMs' header or else the AMQP timestamp (whole seconds).
+    Returns None if the message carries neither.
+    """
+    published_at_ms = (headers or {}).get("publishedAtMs")
+    if published_at_ms is not None:
+        return max(0.0, time.time() - float(published_at_ms) / 1000.0)
+    if timestamp is not None:
+        published_at = timestamp.timestamp() if hasattr(timestamp, "timestamp") else float(timestamp)
+        return max(0.0, time.time() - published_at)
+    return None
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are frequent; don't log each one
+        pass
+
+
+def start_metrics_server(port: int = WORKER_METRICS_PORT):
+    """
+    Serves the registry on http://0.0.0.0:<port>/metrics from a daemon thread,
+    for processes without a web server of their own (the worker).
+    Returns the server, or None if the port is 0.
+    """
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -1,48 +1,121 @@
 import os
+import threading
+
 import certifi # <-- Make sure you have run 'pip install certifi'
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient, MongoClient
 from dotenv import load_dotenv
 
+from services.logging_config import get_logger
+
 load_dotenv()
 
 MONGODB_URI = os.getenv("MONGODB_URI")
+DATABASE_NAME = "Rhythm"
+
+ARTIST_VOCAB_COLLECTION = "artist_vocab"
+GENRE_VOCAB_COLLECTION = "genre_vocab"
+TRACK_VOCAB_COLLECTION = "track_vocab"
+COUNTERS_COLLECTION = "vocab_counters"
+
+# Connections per client pool, and a deadline for every operation in milliseconds
+# (0 means none). A deadline makes a slow database fail requests quickly instead
+# of letting them pile up, which matters most to the async API.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", 0))
+
+logger = get_logger(__name__)
+
+# Nothing connects at import time. Each process lazily creates one sync and one
+# async client on first use; each client is a connection pool shared by every
+# caller in the process.
+_client = None
+_async_client = None
+_lock = threading.Lock()
+
+
+def _client_options() -> dict:
+    # Pass the certifi CA bundle to the client for SSL
+    options = {"tlsCAFile": certifi.where(), "maxPoolSize": MONGO_MAX_POOL_SIZE}
+    if MONGO_TIMEOUT_MS:
+        options["timeoutMS"] = MONGO_TIMEOUT_MS
+    return options
+
+
+def get_client() -> MongoClient:
+    """Returns the process-wide MongoClient, creating it on first use."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                logger.info("Connecting to MongoDB")
+                _client = MongoClient(MONGODB_URI, **_client_options())
+    return _client
+
+
+def get_db():
+    return get_client().get_database(DATABASE_NAME)
+
+
+def get_collection(name: str):
+    return get_db().get_collection(name)
+
+
+# --- Async handles for the worker's event loop ---
+# The async client binds to the event loop that first uses it, so it must only
+# be used from one long-lived loop (see worker.py).
+
+def get_async_client() -> AsyncMongoClient:
+    """Returns the process-wide AsyncMongoClient, creating it on first use."""
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                _async_client = AsyncMongoClient(MONGODB_URI, **_client_options())
+    return _async_client
+
+
+def get_async_collection(name: str):
+    return get_async_client().get_database(DATABASE_NAME).get_collection(name)
+
+
+def _forget_clients():
+    # A forked child can't use its parent's sockets; it connects again on first use
+    global _client, _async_client
+    _client = None
+    _async_client = None
+
+
+os.register_at_fork(after_in_child=_forget_clients)
+
+
+def ping():
+    """Round-trips to the server. Raises if MongoDB can't be reached."""
+    get_client().admin.command("ping")
+
+
+def ensure_schema():
+    """
+    Creates the indexes and documents the vocabulary depends on.
+    Idempotent; run once per deployment by scripts/bootstrap.py, not by every process.
+    """
+    db = get_db()
+
+    # Ensure unique indexes exist. This will create the collections if they don't.
+    logger.info("Ensuring indexes on vocabulary collections")
+    db.get_collection(ARTIST_VOCAB_COLLECTION).create_index("spotifyId", unique=True)
+    db.get_collection(GENRE_VOCAB_COLLECTION).create_index("name", unique=True)
+    db.get_collection(TRACK_VOCAB_COLLECTION).create_index("spotifyId", unique=True)
 
-# --- FIX 1: Pass the certifi CA bundle to the client for SSL ---
-ca = certifi.where()
-client = MongoClient(MONGODB_URI, tlsCAFile=ca)
-# --- END OF FIX 1 ---
-
-# --- FIX 2: Use your correct database name 'Rhythm' ---
-db = client.get_database("Rhythm")
-# --- END OF FIX 2 ---
-
-print("Attempting to connect to MongoDB and set up vocab collections...")
-
-# Get handles to the collections. MongoDB will create them on first use.
-artist_vocab_collection = db.get_collection("artist_vocab")
-genre_vocab_collection = db.get_collection("genre_vocab")
-track_vocab_collection = db.get_collection("track_vocab")
-counters_collection = db.get_collection("vocab_counters")
-
-# Ensure unique indexes exist. This will create the collections if they don't.
-print("Ensuring indexes on vocabulary collections...")
-artist_vocab_collection.create_index("spotifyId", unique=True)
-genre_vocab_collection.create_index("name", unique=True)
-track_vocab_collection.create_index("spotifyId", unique=True)
-print("Indexes ensured.")
-
-# Initialize the counter document if it doesn't exist. This is an atomic operation.
-print("Ensuring vocabulary counter exists...")
-counters_collection.find_one_and_update(
-    {"_id": "vocab_counters"},
-    # $setOnInsert will only apply these fields if the document is being created (upserted)
-    {"$setOnInsert": {
-        "artist_index": 0,
-        "genre_index": 0,
-        "track_index": 0
-    }},
-    upsert=True
-)
-print("Counter ensured.")
-
-print("✅ MongoDB connection for Python service established and vocabularies are set up.")
\ No newline at end of file
+    # Initialize the counter document if it doesn't exist. This is an atomic operation.
+    logger.info("Ensuring vocabulary counter exists")
+    db.get_collection(COUNTERS_COLLECTION).find_one_and_update(
+        {"_id": "vocab_counters"},
+        # $setOnInsert will only apply these fields if the document is being created (upserted)
+        {"$setOnInsert": {
+            "artist_index": 0,
+            "genre_index": 0,
+            "track_index": 0
+        }},
+        upsert=True
+    )
+    logger.info("Vocabulary schema ensured")
@@ -0,0 +1,135 @@
+import os
+import time
+import threading
+
+from dotenv import load_dotenv
+
+from core.neighbors import NeighborTable
+from services.logging_config import get_logger
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+# Where the precomputed table lives. Empty disables the table entirely. With a backend that
+# can't update it incrementally (Pinecone), rebuild it regularly: until then, a changed user
+# is missing from the rows they would newly enter.
+NEIGHBOR_TABLE_PATH = os.getenv("NEIGHBOR_TABLE_PATH", "")
+# How often (in seconds) incremental changes are persisted to disk.
+NEIGHBOR_TABLE_SAVE_INTERVAL = float(os.getenv("NEIGHBOR_TABLE_SAVE_INTERVAL", 5))
+# How often (in seconds) a reader checks the file on disk for a newer table.
+NEIGHBOR_TABLE_RELOAD_INTERVAL = float(os.getenv("NEIGHBOR_TABLE_RELOAD_INTERVAL", 2))
+
+logger = get_logger(__name__)
+
+
+class NeighborTableStore:
+    """
+    The process-wide handle on the precomputed neighbor table.
+
+    The API reads from it, the worker keeps it up to date after every upsert,
+    and scripts/build_neighbor_table.py rebuilds it from scratch. Processes
+    share the table through its file, which is replaced atomically on save and
+    re-read by other processes when it changes.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.table = None
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._loaded_mtime = None
+        # Far enough in the past that the first use reads the file
+        self._last_reload_check = float("-inf")
+
+    def _maybe_reload(self, force: bool = False):
+        now = time.monotonic()
+        if self._dirty or (not force and now - self._last_reload_check < NEIGHBOR_TABLE_RELOAD_INTERVAL):
+            return
+        self._last_reload_check = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._loaded_mtime:
+            logger.info("Loading neighbor table", extra={"path": self.path})
+            self.table = NeighborTable.load(self.path)
+            self._loaded_mtime = mtime
+
+    def _save(self):
+        self.table.save(self.path)
+        self._loaded_mtime = os.stat(self.path).st_mtime_ns
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def warm_up(self):
+        """Reads the table from disk ahead of the first request."""
+        with self._lock:
+            self._maybe_reload(force=True)
+
+    def get(self, user_id: str, limit: int):
+        """
+        Returns up to 'limit' precomputed recommendations for a user, or None if
+        the table can't answer and a live query is needed.
+        """
+        with self._lock:
+            self._maybe_reload()
+            if self.table is None:
+                return None
+            return self.table.get(user_id, limit)
+
+    def refresh_users(self, user_ids: list, vector_index):
+        """
+        Brings the table up to date after these users' vectors changed.
+
+        With a backend that keeps its matrix in memory (the local index), only
+        the affected rows are recomputed. Otherwise the users' rows, and every
+        row that lists them, are dropped and served by live queries until the
+        next full rebuild; rows the users would newly enter stay as they were
+        until then (see NeighborTable.drop_users).
+        """
+        with self._lock:
+            self._maybe_reload()
+            if self.table is None or not user_ids:
+                return
+
+            def update(matrix, ids, rows):
+                touched = 0
+                for user_id in user_ids:
+                    touched += self.table.update_user(user_id, matrix, ids, rows)
+                return touched
+
+            touched = vector_index.read_matrix(update)
+            if touched is None:
+                self.table.drop_users(user_ids)
+            self._dirty = True
+            self._maybe_save()
+
+    def _maybe_save(self):
+        if self._dirty and time.monotonic() - self._last_save >= NEIGHBOR_TABLE_SAVE_INTERVAL:
+            self._save()
+
+    def flush_if_due(self):
+        """
+        Writes pending changes if NEIGHBOR_TABLE_SAVE_INTERVAL has passed since the
+        last save. Called periodically by the worker, so the last updates of a
+        burst reach the API even when no further refresh follows them.
+        """
+        with self._lock:
+            self._maybe_save()
+
+    def replace(self, table: NeighborTable):
+        """Installs a freshly built table and writes it to disk."""
+        with self._lock:
+            self.table = table
+            self._save()
+
+    def flush(self):
+        """Writes any pending changes to disk immediately."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+
+# Create a singleton instance of the store, or None when the table is disabled.
+neighbor_table = NeighborTableStore(NEIGHBOR_TABLE_PATH) if NEIGHBOR_TABLE_PATH else None
@@ -1,73 +1,244 @@
 import os
-import pinecone
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
+import pinecone
 from dotenv import load_dotenv
 
+from core.vectorization import SparseVector
+from services.vector_index_backend import VectorIndexBackend, BATCH_QUERY_CONCURRENCY
+from services.logging_config import get_logger
+from services.metrics import INDEX_UPSERT_SECONDS, INDEX_UPSERT_BATCH_SIZE, INDEX_QUERY_SECONDS
+
 # Load environment variables from .env file
 load_dotenv()
 
 # --- Configuration ---
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-INDEX_NAME = "rhythm-users"
+INDEX_NAME = "rhythm-users-sparse"
+# The dense index used instead when vectors are compacted into embeddings (EMBEDDING_PATH)
+DENSE_INDEX_NAME = "rhythm-users-dense"
+# Maximum number of vectors sent in a single upsert request
+UPSERT_BATCH_SIZE = 100
+# Maximum number of IDs sent in a single fetch request
+FETCH_BATCH_SIZE = 100
+# Per-query timeout of the async client used by the async API
+PINECONE_QUERY_TIMEOUT_SECONDS = float(os.getenv("PINECONE_QUERY_TIMEOUT_SECONDS", 2))
+
+logger = get_logger(__name__)
 
-class PineconeService:
+class PineconeService(VectorIndexBackend):
     """
     A service class to encapsulate all interactions with the Pinecone vector database.
     """
-    def __init__(self):
+    def __init__(self, projection=None):
         """
-        Initializes the service by connecting to Pinecone and getting a handle
-        to the specified index.
+        Prepares the service. No connection is made until the index is first
+        used (or warm_up() is called), so constructing it is free.
+
+        Args:
+            projection: An optional embedding Projection. With one, vectors are
+                stored as dense embeddings in the dense index, tagged with the
+                projection's version so only matching embeddings are compared.
         """
-        print("Initializing Pinecone Service...")
         if not PINECONE_API_KEY:
             raise ValueError("PINECONE_API_KEY environment variable not set.")
+        self.projection = projection
+        self.index_name = DENSE_INDEX_NAME if projection is not None else INDEX_NAME
+        self._index = None
+        self._connect_lock = threading.Lock()
+        # The non-blocking client for the async API, created on the event loop that first queries
+        self._async_client = None
+        self._async_index = None
+        self._async_connect_lock = asyncio.Lock()
+
+    @property
+    def name(self) -> str:
+        return f"pinecone:{self.index_name}"
+
+    @property
+    def index(self):
+        """The handle to the Pinecone index, connected on first use and then shared."""
+        if self._index is None:
+            with self._connect_lock:
+                if self._index is None:
+                    self._index = self._connect()
+        return self._index
 
+    def _connect(self):
+        logger.info("Initializing Pinecone Service")
         # Initialize the Pinecone client
         # This uses the newer Pinecone client syntax
         pc = pinecone.Pinecone(api_key=PINECONE_API_KEY)
-        
+
         # Check if the index exists
-        if INDEX_NAME not in pc.list_indexes().names():
-            raise EnvironmentError(f"Pinecone index '{INDEX_NAME}' does not exist. Please run the create_pinecone_index.py script first.")
-            
+        if self.index_name not in pc.list_indexes().names():
+            raise EnvironmentError(f"Pinecone index '{self.index_name}' does not exist. Please run the create_pinecone_index.py script first.")
+        if self.projection is not None:
+            dimension = pc.describe_index(self.index_name).dimension
+            if dimension != self.projection.dim:
+                raise EnvironmentError(
+                    f"Pinecone index '{self.index_name}' has dimension {dimension}, but embedding "
+                    f"'{self.projection.version}' has {self.projection.dim}. Recreate the index for this projection."
+                )
+
         # Get a handle to the index. This object will be used for all operations.
-        self.index = pc.Index(INDEX_NAME)
-        print(f"Successfully connected to Pinecone index '{INDEX_NAME}'.")
-        # You can print stats to confirm connection
-        print(self.index.describe_index_stats())
+        index = pc.Index(self.index_name)
+        logger.info("Connected to Pinecone index", extra={"index": self.index_name})
+        return index
+
+    def warm_up(self):
+        """Connects to the index ahead of the first request, with one round trip to confirm it answers."""
+        self.index.describe_index_stats()
+
+    def _record(self, user_id: str, vector: SparseVector) -> dict:
+        """Validates a vector and formats it as a Pinecone record."""
+        if not isinstance(user_id, str) or not user_id:
+            raise ValueError("user_id must be a non-empty string.")
+        if not isinstance(vector, SparseVector):
+            raise TypeError("vector must be a SparseVector.")
+        if vector.nnz == 0:
+            raise ValueError(f"vector for user {user_id} has no non-zero entries.")
+        if self.projection is None:
+            return {"id": user_id, "sparse_values": vector.normalized().to_pinecone()}
 
-    def upsert_user_vector(self, user_id: str, vector: np.ndarray):
+        embedding = self.projection.embed(vector)
+        if not embedding.any():
+            raise ValueError(f"vector for user {user_id} has no positions known to embedding '{self.projection.version}'.")
+        return {
+            "id": user_id,
+            "values": embedding.tolist(),
+            "metadata": {"embedding": self.projection.version},
+        }
+
+    @INDEX_UPSERT_SECONDS.time(backend="pinecone")
+    def upsert_user_vector(self, user_id: str, vector: SparseVector):
         """
         Inserts or updates a user's vector in the Pinecone index.
 
+        The index is a sparse 'dotproduct' index, so the vector is normalized to
+        unit length before it is sent; the dot product is then the cosine similarity.
+
         Args:
             user_id: The unique ID of the user (from MongoDB).
-            vector: The user's music taste vector (as a NumPy array).
+            vector: The user's music taste vector (as a SparseVector).
         """
-        if not isinstance(user_id, str) or not user_id:
-            raise ValueError("user_id must be a non-empty string.")
-        if not isinstance(vector, np.ndarray):
-            raise TypeError("vector must be a NumPy array.")
-
-        print(f"Upserting vector for user: {user_id}")
-        
-        # Pinecone expects the vector as a list of floats, not a NumPy array
-        vector_as_list = vector.tolist()
-
-        # The upsert operation
-        self.index.upsert(
-            vectors=[
-                {
-                    "id": user_id,          # The unique ID for this vector
-                    "values": vector_as_list # The vector data
-                    # We can add metadata here if needed in the future
-                    # "metadata": {"last_updated": datetime.now().isoformat()}
-                }
-            ]
-        )
-        print(f"Successfully upserted vector for user: {user_id}")
+        record = self._record(user_id, vector)
+        INDEX_UPSERT_BATCH_SIZE.observe(1, backend="pinecone")
+
+        # The upsert operation. Only the non-zero entries (or the embedding) are sent.
+        self.index.upsert(vectors=[record])
+        logger.debug("Upserted vector", extra={"userId": user_id, "nnz": vector.nnz})
+
+    @INDEX_UPSERT_SECONDS.time(backend="pinecone")
+    def upsert_user_vectors(self, items: list):
+        """
+        Inserts or updates several users' vectors with as few requests as possible.
+
+        Args:
+            items: A list of (user_id, SparseVector) tuples.
+        """
+        vectors = [self._record(user_id, vector) for user_id, vector in items]
 
+        INDEX_UPSERT_BATCH_SIZE.observe(len(vectors), backend="pinecone")
+        for start in range(0, len(vectors), UPSERT_BATCH_SIZE):
+            self.index.upsert(vectors=vectors[start:start + UPSERT_BATCH_SIZE])
+        logger.debug("Upserted vectors", extra={"count": len(vectors)})
+
+    def delete_user_vector(self, user_id: str):
+        """
+        Removes a user's vector from the Pinecone index.
+
+        Args:
+            user_id: The unique ID of the user (from MongoDB).
+        """
+        logger.info("Deleting vector", extra={"userId": user_id})
+        self.index.delete(ids=[user_id])
+
+    def fetch_user_vectors(self, user_ids: list) -> dict:
+        """
+        Fetches the stored vectors of several users from the Pinecone index.
+
+        Returns:
+            A dict mapping each user ID that has a vector to its SparseVector.
+            In the dense index, that is the embedding with one position per dimension.
+        """
+        vectors = {}
+        for start in range(0, len(user_ids), FETCH_BATCH_SIZE):
+            response = self.index.fetch(ids=user_ids[start:start + FETCH_BATCH_SIZE])
+            for user_id, record in response.vectors.items():
+                if self.projection is not None:
+                    if record.values:
+                        vectors[user_id] = SparseVector(
+                            np.arange(len(record.values), dtype=np.uint32),
+                            np.asarray(record.values, dtype=np.float32)
+                        )
+                    continue
+                sparse_values = record.sparse_values
+                if sparse_values is None:
+                    continue
+                vectors[user_id] = SparseVector(
+                    np.asarray(sparse_values.indices, dtype=np.uint32),
+                    np.asarray(sparse_values.values, dtype=np.float32)
+                )
+        return vectors
+
+    def list_user_ids(self):
+        """Yields the ID of every vector in the Pinecone index, one page at a time."""
+        for id_page in self.index.list():
+            yield from id_page
+
+    def _query_filter(self):
+        # Only compare against embeddings made with the same projection
+        if self.projection is None:
+            return None
+        return {"embedding": {"$eq": self.projection.version}}
+
+    def _vector_query(self, vector: SparseVector) -> dict:
+        # Query arguments for searching with a fetched vector (or embedding)
+        if self.projection is not None:
+            return {"vector": vector.values.tolist(), "filter": self._query_filter()}
+        return {"sparse_vector": vector.to_pinecone()}
+
+    def _format_matches(self, query_results) -> list:
+        # Format the results into a clean list
+        return [
+            {"userId": match["id"], "score": match["score"]}
+            for match in query_results.get("matches", [])
+        ]
+
+    @INDEX_QUERY_SECONDS.time(backend="pinecone", kind="batch")
+    def query_similar_users_batch(self, user_ids: list, top_k: int = 50) -> dict:
+        """
+        Finds similar users for several users at once.
+
+        All query vectors are fetched in bulk first, then the similarity queries
+        run concurrently using the fetched vectors, which saves Pinecone a
+        lookup per query.
+
+        Returns:
+            A dict mapping each user ID to its list of {'userId', 'score'} dicts.
+            Users without a vector get an empty list.
+        """
+        query_vectors = self.fetch_user_vectors(user_ids)
+
+        def query(user_id):
+            vector = query_vectors.get(user_id)
+            if vector is None:
+                return []
+            try:
+                query_results = self.index.query(**self._vector_query(vector), top_k=top_k)
+                return self._format_matches(query_results)
+            except Exception as e:
+                logger.warning("Error querying Pinecone", extra={"userId": user_id, "error": str(e)})
+                return []
+
+        with ThreadPoolExecutor(max_workers=BATCH_QUERY_CONCURRENCY) as executor:
+            return dict(zip(user_ids, executor.map(query, user_ids)))
+
+    @INDEX_QUERY_SECONDS.time(backend="pinecone", kind="single")
     def query_similar_users(self, user_id: str, top_k: int = 50) -> list:
         """
         Queries the Pinecone index to find the most similar users.
@@ -82,33 +253,77 @@ class PineconeService:
         if not isinstance(user_id, str) or not user_id:
             raise ValueError("user_id must be a non-empty string.")
 
-        print(f"Querying for users similar to: {user_id}")
-
         try:
             # The query operation. We query by the ID of an existing vector.
             query_results = self.index.query(
                 id=user_id,
                 top_k=top_k,
-                # We can add filters here later, e.g., to exclude users from a certain country
-                # filter={"genre": {"$in": ["rock", "pop"]}}
+                filter=self._query_filter(),
             )
 
-            # Format the results into a clean list
-            recommendations = []
-            for match in query_results.get("matches", []):
-                recommendations.append({
-                    "userId": match["id"],
-                    "score": match["score"]
-                })
-            
-            print(f"Found {len(recommendations)} similar users for user: {user_id}")
+            recommendations = self._format_matches(query_results)
+
+            logger.debug("Queried similar users", extra={"userId": user_id, "found": len(recommendations)})
             return recommendations
 
         except Exception as e:
             # This can happen if the user_id does not exist in the index yet
-            print(f"Error querying Pinecone for user {user_id}: {e}")
+            logger.warning("Error querying Pinecone", extra={"userId": user_id, "error": str(e)})
             # Return an empty list if the user's vector isn't in Pinecone yet
             return []
 
-# Create a singleton instance of the service so we only initialize the connection once.
-pinecone_service = PineconeService()
\ No newline at end of file
+    # --- Async queries ---
+
+    async def _get_async_index(self):
+        if self._async_index is None:
+            async with self._async_connect_lock:
+                if self._async_index is None:
+                    client = pinecone.PineconeAsyncio(api_key=PINECONE_API_KEY)
+                    description = await client.describe_index(self.index_name)
+                    # One aiohttp session per process, so connections are pooled across requests
+                    self._async_client = client
+                    self._async_index = client.IndexAsyncio(host=description.host)
+        return self._async_index
+
+    async def _query_async(self, user_id: str, **query) -> list:
+        try:
+            index = await self._get_async_index()
+            query_results = await asyncio.wait_for(index.query(**query), PINECONE_QUERY_TIMEOUT_SECONDS)
+            return self._format_matches(query_results)
+        except Exception as e:
+            logger.warning("Error querying Pinecone", extra={"userId": user_id, "error": repr(e)})
+            return []
+
+    async def query_similar_users_async(self, user_id: str, top_k: int = 50) -> list:
+        """query_similar_users on Pinecone's asyncio client, with a timeout of PINECONE_QUERY_TIMEOUT_SECONDS."""
+        if not isinstance(user_id, str) or not user_id:
+            raise ValueError("user_id must be a non-empty string.")
+        with INDEX_QUERY_SECONDS.time(backend="pinecone", kind="single_async"):
+            return await self._query_async(user_id, id=user_id, top_k=top_k, filter=self._query_filter())
+
+    async def query_similar_users_batch_async(self, user_ids: list, top_k: int = 50) -> dict:
+        """
+        query_similar_users_batch on Pinecone's asyncio client: one bulk fetch,
+        then up to BATCH_QUERY_CONCURRENCY queries in flight at once.
+        """
+        with INDEX_QUERY_SECONDS.time(backend="pinecone", kind="batch_async"):
+            query_vectors = await asyncio.to_thread(self.fetch_user_vectors, user_ids)
+            limit = asyncio.Semaphore(BATCH_QUERY_CONCURRENCY)
+
+            async def query(user_id):
+                vector = query_vectors.get(user_id)
+                if vector is None:
+                    return []
+                async with limit:
+                    return await self._query_async(user_id, **self._vector_query(vector), top_k=top_k)
+
+            results = await asyncio.gather(*(query(user_id) for user_id in user_ids))
+            return dict(zip(user_ids, results))
+
+    async def close_async(self):
+        """Closes the asyncio client's connections."""
+        if self._async_index is not None:
+            await self._async_index.close()
+            await self._async_client.close()
+            self._async_index = None
+            self._async_client = None
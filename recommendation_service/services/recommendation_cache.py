@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+import pika
+from dotenv import load_dotenv
+
+from services.logging_config import get_logger
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", 10000))
+# Also the longest a cached list can miss a user whose new vector would now put them in it
+RECOMMENDATION_CACHE_TTL_SECONDS = float(os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", 300))
+
+# --- Invalidation signal ---
+# The worker publishes the IDs of users whose vector it just wrote; every API
+# process listens on its own exclusive queue and drops those users' entries.
+RABBITMQ_URL = os.getenv("RABBITMQ_URL")
+EXCHANGE_NAME = 'rhythm_exchange'
+INVALIDATION_ROUTING_KEY = 'user.vector.updated'
+RECONNECT_DELAY_SECONDS = 5
+
+logger = get_logger(__name__)
+
+
+class RecommendationCache:
+    """
+    A size-bounded, TTL-based cache of recommendation lists.
+
+    Only the longest list fetched for a user is kept: a request for a smaller
+    limit is served by slicing it. An entry is also marked complete when the
+    index returned fewer results than asked for, in which case it can serve
+    any limit at all.
+
+    Invalidating a user drops their own entry and every entry that lists them,
+    since the scores in those are stale. Entries that don't list the user but
+    would now include them can't be found; they stay until their TTL expires.
+    """
+    def __init__(self, max_size: int = RECOMMENDATION_CACHE_SIZE, ttl_seconds: float = RECOMMENDATION_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # user ID -> (limit, results, complete, expires_at)
+        self._listed_in = {}           # user ID -> IDs of the users whose entries list them
+        self._lock = threading.Lock()
+
+    def _remove(self, user_id: str):
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return
+        for result in entry[1]:
+            owners = self._listed_in.get(result["userId"])
+            if owners is not None:
+                owners.discard(user_id)
+                if not owners:
+                    del self._listed_in[result["userId"]]
+
+    def get(self, user_id: str, limit: int):
+        """
+        Returns the cached recommendations for a user, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            cached_limit, results, complete, expires_at = entry
+            if time.monotonic() >= expires_at:
+                self._remove(user_id)
+                return None
+            if limit > cached_limit and not complete:
+                return None
+            self._entries.move_to_end(user_id)
+            return results[:limit]
+
+    def put(self, user_id: str, limit: int, results: list, complete: bool):
+        """
+        Stores the recommendations fetched for a user with the given limit.
+
+        Args:
+            user_id: The user the recommendations are for.
+            limit: The number of results that were asked for.
+            results: The recommendations, best first.
+            complete: True if the index had no more results to give.
+        """
+        with self._lock:
+            existing = self._entries.get(user_id)
+            # Never replace a longer, still valid list with a shorter one
+            if existing is not None and existing[0] > limit and time.monotonic() < existing[3]:
+                return
+            self._remove(user_id)
+            self._entries[user_id] = (limit, results, complete, time.monotonic() + self.ttl_seconds)
+            for result in results:
+                self._listed_in.setdefault(result["userId"], set()).add(user_id)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, user_id: str):
+        """Drops the user's own entry and every entry that lists them."""
+        with self._lock:
+            self._remove(user_id)
+            for owner_id in list(self._listed_in.get(user_id, ())):
+                self._remove(owner_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._listed_in.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def publish_vector_updates(channel, user_ids: list):
+    """
+    Tells every API process that these users' vectors changed.
+    Used by the worker with its (blocking) pika channel.
+    """
+    if not user_ids:
+        return
+    channel.basic_publish(
+        exchange=EXCHANGE_NAME,
+        routing_key=INVALIDATION_ROUTING_KEY,
+        body=json.dumps({"userIds": list(user_ids)})
+    )
+
+
+def start_invalidation_listener(cache: RecommendationCache) -> threading.Thread:
+    """
+    Starts a daemon thread that drops cache entries when the worker reports a vector update.
+    If RabbitMQ is not configured, entries simply expire after the TTL.
+    """
+    if not RABBITMQ_URL:
+        logger.info("RABBITMQ_URL not set. Recommendation cache will rely on TTL expiry only.")
+        return None
+
+    def listen():
+        while True:
+            try:
+                connection = pika.BlockingConnection(pika.URLParameters(RABBITMQ_URL))
+                channel = connection.channel()
+                channel.exchange_declare(exchange=EXCHANGE_NAME, exchange_type='direct', durable=True)
+                # An exclusive, server-named queue per process: every API process gets every signal
+                result = channel.queue_declare(queue='', exclusive=True, auto_delete=True)
+                queue_name = result.method.queue
+                channel.queue_bind(exchange=EXCHANGE_NAME, queue=queue_name, routing_key=INVALIDATION_ROUTING_KEY)
+
+                def callback(ch, method, properties, body):
+                    try:
+                        for user_id in json.loads(body).get("userIds", []):
+                            cache.invalidate(user_id)
+                    except (json.JSONDecodeError, AttributeError):
+                        logger.warning("Ignoring malformed cache invalidation message.")
+
+                # Anything published while we were disconnected is lost, so start from a clean slate
+                cache.clear()
+                channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=True)
+                logger.info("Recommendation cache invalidation listener started.")
+                channel.start_consuming()
+            except Exception as e:
+                logger.warning(
+                    "Cache invalidation listener disconnected. Reconnecting.",
+                    extra={"error": str(e), "retryInSeconds": RECONNECT_DELAY_SECONDS},
+                )
+                time.sleep(RECONNECT_DELAY_SECONDS)
+
+    thread = threading.Thread(target=listen, name="recommendation-cache-invalidation", daemon=True)
+    thread.start()
+    return thread
+
+
+# Create a singleton instance of the cache shared by the whole API process.
+recommendation_cache = RecommendationCache()
@@ -0,0 +1,348 @@
+import os
+import asyncio
+from dotenv import load_dotenv
+
+from services.vector_index import vector_index
+from services.recommendation_cache import recommendation_cache
+from services.connection_service import get_connected_user_ids, get_connected_user_ids_async
+from services.neighbor_table import neighbor_table
+from services.room_index import room_index, room_user_vectors
+from services.metrics import RECOMMENDATION_SOURCE
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+# Maximum number of users accepted by a single batch request
+MAX_BATCH_USERS = int(os.getenv("MAX_BATCH_USERS", 500))
+# Upper bound on how many candidates are fetched while looking for enough eligible users
+MAX_CANDIDATES = int(os.getenv("MAX_CANDIDATES", 1000))
+
+# The request handling shared by the WSGI API (api.py) and the async API (api_async.py).
+# Every step that waits on the index or MongoDB comes in a blocking and an async version.
+
+
+class InvalidRequest(ValueError):
+    """A malformed request. The message is meant for the caller and is returned with a 400."""
+
+
+def parse_flag(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def parse_limit(value) -> int:
+    """
+    Validates a 'limit' parameter.
+
+    Returns:
+        The limit, an integer from 1 to MAX_CANDIDATES.
+    """
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise InvalidRequest("Invalid 'limit' parameter. Must be an integer.")
+    if not 1 <= limit <= MAX_CANDIDATES:
+        raise InvalidRequest(f"Invalid 'limit' parameter. Must be between 1 and {MAX_CANDIDATES}.")
+    return limit
+
+
+def parse_recommend_args(args) -> tuple:
+    """
+    Validates the query parameters of GET /recommend/<user_id>.
+
+    Returns:
+        (limit, explicit_ids, exclude_connections)
+    """
+    # Get the 'limit' query parameter, with a default of 50
+    limit = parse_limit(args.get('limit', 50))
+
+    exclude_param = args.get('exclude', '')
+    explicit_ids = [excluded_id for excluded_id in exclude_param.split(',') if excluded_id]
+    exclude_connections = parse_flag(args.get('excludeConnections', 'false'))
+    return limit, explicit_ids, exclude_connections
+
+
+def parse_room_args(args) -> int:
+    """
+    Validates the query parameters of GET /recommend/rooms/<user_id>.
+
+    Returns:
+        The limit.
+    """
+    return parse_limit(args.get('limit', 10))
+
+
+def parse_batch_body(body) -> tuple:
+    """
+    Validates the JSON body of POST /recommend/batch.
+
+    Args:
+        body: The decoded JSON body, which may be any JSON value.
+
+    Returns:
+        (user_ids, limit, exclude, exclude_connections), with duplicate user IDs dropped.
+    """
+    if not isinstance(body, dict):
+        raise InvalidRequest("The request body must be a JSON object.")
+    user_ids = body.get("userIds")
+    if not isinstance(user_ids, list) or not all(isinstance(user_id, str) and user_id for user_id in user_ids):
+        raise InvalidRequest("'userIds' must be a list of non-empty strings.")
+    if len(user_ids) > MAX_BATCH_USERS:
+        raise InvalidRequest(f"At most {MAX_BATCH_USERS} userIds are allowed per request.")
+    limit = parse_limit(body.get("limit", 50))
+
+    exclude = body.get("exclude") or {}
+    if not isinstance(exclude, dict) or not all(
+        isinstance(excluded, list) and all(isinstance(other_id, str) for other_id in excluded)
+        for excluded in exclude.values()
+    ):
+        raise InvalidRequest("'exclude' must map user IDs to lists of user IDs.")
+    exclude_connections = parse_flag(body.get("excludeConnections", False))
+
+    # Preserve order while dropping duplicates
+    return list(dict.fromkeys(user_ids)), limit, exclude, exclude_connections
+
+
+def finalize_recommendations(user_id: str, limit: int, recommendations: list) -> list:
+    """
+    Turns raw index results (fetched with top_k = limit + 1) into the final list
+    for a user, and caches it.
+    """
+    # Filter out the user themselves from the recommendation list
+    # The most similar user to 'user_id' will always be 'user_id' with a score of 1.0
+    filtered_recommendations = [rec for rec in recommendations if rec["userId"] != user_id]
+
+    # Ensure we only return the number of results requested by the limit
+    final_recommendations = filtered_recommendations[:limit]
+
+    # Cache the list. If the index returned fewer results than asked for, it has no more.
+    # Empty lists are not cached: the user may simply not have been vectorized yet.
+    if final_recommendations:
+        recommendation_cache.put(
+            user_id,
+            limit,
+            final_recommendations,
+            complete=len(recommendations) < limit + 1
+        )
+    return final_recommendations
+
+
+def lookup_precomputed(user_id: str, count: int):
+    """
+    Returns up to 'count' recommendations without querying the index: from the
+    precomputed neighbor table if enabled, otherwise from the cache. None on a miss.
+    """
+    if neighbor_table is not None:
+        precomputed = neighbor_table.get(user_id, count)
+        if precomputed is not None:
+            RECOMMENDATION_SOURCE.inc(source="neighbor_table")
+            return precomputed
+    cached = recommendation_cache.get(user_id, count)
+    if cached is not None:
+        RECOMMENDATION_SOURCE.inc(source="cache")
+    return cached
+
+
+async def lookup_precomputed_async(user_id: str, count: int):
+    """lookup_precomputed without blocking the event loop; the neighbor table may read its file."""
+    if neighbor_table is not None:
+        return await asyncio.to_thread(lookup_precomputed, user_id, count)
+    return lookup_precomputed(user_id, count)
+
+
+def get_candidates(user_id: str, count: int) -> list:
+    """
+    Returns up to 'count' recommendations for a user (never the user themselves),
+    from the neighbor table or the cache if possible. Fewer than 'count' means
+    the index has no more.
+    """
+    precomputed = lookup_precomputed(user_id, count)
+    if precomputed is not None:
+        return precomputed
+
+    RECOMMENDATION_SOURCE.inc(source="index")
+    recommendations = vector_index.query_similar_users(
+        user_id=user_id,
+        top_k=count + 1 # Fetch one extra in case the user themselves is in the results
+    )
+    return finalize_recommendations(user_id, count, recommendations)
+
+
+async def get_candidates_async(user_id: str, count: int) -> list:
+    """get_candidates without blocking the event loop on the index."""
+    precomputed = await lookup_precomputed_async(user_id, count)
+    if precomputed is not None:
+        return precomputed
+
+    RECOMMENDATION_SOURCE.inc(source="index")
+    recommendations = await vector_index.query_similar_users_async(user_id=user_id, top_k=count + 1)
+    return finalize_recommendations(user_id, count, recommendations)
+
+
+def initial_candidate_count(limit: int, excluded: set) -> int:
+    # Over-fetch by the number of excluded users, but never more than double the limit;
+    # most excluded users are not among the top matches anyway.
+    return min(limit + min(len(excluded), limit), MAX_CANDIDATES)
+
+
+def _eligible(candidates: list, excluded: set, limit: int, count: int):
+    # The eligible candidates if there are enough of them (or no more to fetch), else None
+    eligible = [rec for rec in candidates if rec["userId"] not in excluded]
+    if len(eligible) >= limit or len(candidates) < count or count >= MAX_CANDIDATES:
+        return eligible[:limit]
+    return None
+
+
+def collect_eligible(user_id: str, limit: int, excluded: set, candidates: list = None) -> list:
+    """
+    Returns exactly 'limit' recommendations that are not in 'excluded' (or all the
+    eligible ones there are). Starts from 'candidates' if given and keeps
+    doubling the number of candidates until there are enough eligible users.
+    """
+    count = initial_candidate_count(limit, excluded)
+    if candidates is None:
+        candidates = get_candidates(user_id, count)
+    while (eligible := _eligible(candidates, excluded, limit, count)) is None:
+        count = min(count * 2, MAX_CANDIDATES)
+        candidates = get_candidates(user_id, count)
+    return eligible
+
+
+async def collect_eligible_async(user_id: str, limit: int, excluded: set, candidates: list = None) -> list:
+    """collect_eligible without blocking the event loop on the index."""
+    count = initial_candidate_count(limit, excluded)
+    if candidates is None:
+        candidates = await get_candidates_async(user_id, count)
+    while (eligible := _eligible(candidates, excluded, limit, count)) is None:
+        count = min(count * 2, MAX_CANDIDATES)
+        candidates = await get_candidates_async(user_id, count)
+    return eligible
+
+
+def excluded_user_ids(user_id: str, explicit_ids, exclude_connections: bool) -> set:
+    """
+    Combines the IDs the caller asked to exclude with, optionally, the user's
+    friends and connection requests.
+    """
+    excluded = set(explicit_ids or [])
+    if exclude_connections:
+        excluded |= get_connected_user_ids(user_id)
+    excluded.discard(user_id)
+    return excluded
+
+
+async def excluded_user_ids_async(user_id: str, explicit_ids, exclude_connections: bool) -> set:
+    """excluded_user_ids without blocking the event loop on MongoDB."""
+    excluded = set(explicit_ids or [])
+    if exclude_connections:
+        excluded |= await get_connected_user_ids_async(user_id)
+    excluded.discard(user_id)
+    return excluded
+
+
+def recommend(user_id: str, limit: int, explicit_ids: list, exclude_connections: bool) -> list:
+    """The recommendations for one user, with the requested users excluded."""
+    # 1. Work out who must not be recommended
+    excluded = excluded_user_ids(user_id, explicit_ids, exclude_connections)
+
+    # 2. Fetch candidates (cached when possible), over-fetching only as much as the
+    # exclusions require, until we have 'limit' eligible users
+    return collect_eligible(user_id, limit, excluded)
+
+
+async def recommend_async(user_id: str, limit: int, explicit_ids: list, exclude_connections: bool) -> list:
+    """recommend without blocking the event loop."""
+    excluded = await excluded_user_ids_async(user_id, explicit_ids, exclude_connections)
+    return await collect_eligible_async(user_id, limit, excluded)
+
+
+def _precomputed_candidates(user_ids: list, counts: dict) -> tuple:
+    # Serves whatever we can from the neighbor table or the cache; returns (candidates, misses)
+    candidates = {}
+    for user_id in user_ids:
+        precomputed = lookup_precomputed(user_id, counts[user_id])
+        if precomputed is not None:
+            candidates[user_id] = precomputed
+    misses = [user_id for user_id in user_ids if user_id not in candidates]
+    if misses:
+        RECOMMENDATION_SOURCE.inc(len(misses), source="index")
+    return candidates, misses
+
+
+def recommend_batch(user_ids: list, limit: int, exclude: dict, exclude_connections: bool) -> dict:
+    """The recommendations for several users, querying the index once for all cache misses."""
+    excluded = {
+        user_id: excluded_user_ids(user_id, exclude.get(user_id), exclude_connections)
+        for user_id in user_ids
+    }
+    counts = {user_id: initial_candidate_count(limit, excluded[user_id]) for user_id in user_ids}
+
+    # 1. Serve whatever we can from the neighbor table or the cache
+    candidates, misses = _precomputed_candidates(user_ids, counts)
+
+    # 2. Query the index once for all the remaining users
+    if misses:
+        count = max(counts[user_id] for user_id in misses)
+        batch_recommendations = vector_index.query_similar_users_batch(
+            user_ids=misses,
+            top_k=count + 1 # Fetch one extra in case the user themselves is in the results
+        )
+        for user_id in misses:
+            candidates[user_id] = finalize_recommendations(user_id, count, batch_recommendations.get(user_id, []))
+
+    # 3. Apply the exclusions. Only users left short go back to the index for more.
+    return {
+        user_id: collect_eligible(user_id, limit, excluded[user_id], candidates[user_id])
+        for user_id in user_ids
+    }
+
+
+async def recommend_batch_async(user_ids: list, limit: int, exclude: dict, exclude_connections: bool) -> dict:
+    """recommend_batch without blocking the event loop."""
+    excluded = {
+        user_id: await excluded_user_ids_async(user_id, exclude.get(user_id), exclude_connections)
+        for user_id in user_ids
+    }
+    counts = {user_id: initial_candidate_count(limit, excluded[user_id]) for user_id in user_ids}
+
+    if neighbor_table is not None:
+        candidates, misses = await asyncio.to_thread(_precomputed_candidates, user_ids, counts)
+    else:
+        candidates, misses = _precomputed_candidates(user_ids, counts)
+    if misses:
+        count = max(counts[user_id] for user_id in misses)
+        batch_recommendations = await vector_index.query_similar_users_batch_async(user_ids=misses, top_k=count + 1)
+        for user_id in misses:
+            candidates[user_id] = finalize_recommendations(user_id, count, batch_recommendations.get(user_id, []))
+
+    return {
+        user_id: await collect_eligible_async(user_id, limit, excluded[user_id], candidates[user_id])
+        for user_id in user_ids
+    }
+
+
+def recommend_rooms(user_id: str, limit: int) -> list:
+    """
+    The active public rooms that best match a user's taste, from the in-memory
+    room index. Empty if the user has no vector yet.
+    """
+    user_vector = room_user_vectors.get(user_id)
+    if user_vector is None:
+        user_vector = vector_index.fetch_user_vectors([user_id]).get(user_id)
+        if user_vector is None:
+            return []
+        room_user_vectors.put(user_id, user_vector)
+    return room_index.recommend(user_vector, limit)
+
+
+async def recommend_rooms_async(user_id: str, limit: int) -> list:
+    """recommend_rooms without blocking the event loop on the index or the room scoring."""
+    user_vector = room_user_vectors.get(user_id)
+    if user_vector is None:
+        user_vector = (await asyncio.to_thread(vector_index.fetch_user_vectors, [user_id])).get(user_id)
+        if user_vector is None:
+            return []
+        room_user_vectors.put(user_id, user_vector)
+    return await asyncio.to_thread(room_index.recommend, user_vector, limit)
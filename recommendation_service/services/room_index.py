@@ -0,0 +1,377 @@
+import os
+import json
+import time
+import heapq
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pika
+from dotenv import load_dotenv
+
+from core.vectorization import VECTORIZER, SparseVector, build_user_vectors
+from services import vocabulary_service
+from services.mongo_client import get_collection
+from services.vector_index import vector_index
+from services.recommendation_cache import RABBITMQ_URL, EXCHANGE_NAME, INVALIDATION_ROUTING_KEY, RECONNECT_DELAY_SECONDS
+from services.logging_config import get_logger
+from services.metrics import ROOM_INDEX_ROOMS, ROOM_EVENTS
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+# Users whose vectors are kept in memory for room recommendations
+ROOM_USER_VECTOR_CACHE_SIZE = int(os.getenv("ROOM_USER_VECTOR_CACHE_SIZE", 10000))
+ROOM_USER_VECTOR_CACHE_TTL_SECONDS = float(os.getenv("ROOM_USER_VECTOR_CACHE_TTL_SECONDS", 300))
+# How often (in seconds) the index is rebuilt from MongoDB, to catch changes no event was
+# published for (e.g. rooms removed by the rooms collection's TTL index). 0 disables it.
+ROOM_INDEX_RECONCILE_SECONDS = float(os.getenv("ROOM_INDEX_RECONCILE_SECONDS", 300))
+
+# --- Room events ---
+# The backend publishes a room summary (roomId, code, name, isPublic, isActive,
+# genres, tracks) on every change; see publishRoomEvent in messageQueueService.js.
+ROOM_OPENED_ROUTING_KEY = 'room.opened'
+ROOM_UPDATED_ROUTING_KEY = 'room.updated'
+ROOM_CLOSED_ROUTING_KEY = 'room.closed'
+
+# Collection owned by the Node backend (Mongoose model 'Room')
+ROOMS_COLLECTION = "rooms"
+
+logger = get_logger(__name__)
+
+
+def room_from_document(doc: dict) -> dict:
+    """Turns a 'rooms' document into the summary the backend publishes with room events."""
+    playback = doc.get("currentPlayback") or {}
+    tracks = [track for track in [playback, *doc.get("queue", [])] if track.get("spotifyId")]
+    return {
+        "roomId": str(doc["_id"]),
+        "code": doc.get("code"),
+        "name": doc.get("name"),
+        "isPublic": doc.get("isPublic", True),
+        "isActive": doc.get("isActive", True),
+        "genres": doc.get("genres", []),
+        "tracks": [{"id": track["spotifyId"], "name": track.get("name")} for track in tracks],
+    }
+
+
+def room_taste(room: dict) -> dict:
+    """
+    Describes a room as a music taste, so it is vectorized exactly like a user:
+    its vibe tags as genres and the tracks playing or queued as tracks.
+    """
+    return {
+        "topArtists": room.get("artists", []),
+        # Tags are typed by hosts; Spotify genre names are lowercase
+        "topGenres": list(dict.fromkeys(genre.strip().lower() for genre in room.get("genres", []) if genre.strip())),
+        "topTracks": room.get("tracks", []),
+    }
+
+
+def vectorize_rooms(rooms: list) -> list:
+    """
+    Builds the vectors of several rooms. Items that aren't in the vocabulary
+    are dropped rather than added: no user has them, so they can't match anyone.
+
+    Returns:
+        A list of normalized SparseVectors, in the same order as rooms.
+    """
+    tastes = [room_taste(room) for room in rooms]
+    if VECTORIZER == "hashing":
+        vectors = build_user_vectors(tastes, None)
+    else:
+        artist_indices, genre_indices, track_indices = vocabulary_service.find_known_indices(tastes)
+        tastes = [
+            {
+                "topArtists": [artist for artist in taste["topArtists"] if artist["id"] in artist_indices],
+                "topGenres": [genre for genre in taste["topGenres"] if genre in genre_indices],
+                "topTracks": [track for track in taste["topTracks"] if track["id"] in track_indices],
+            }
+            for taste in tastes
+        ]
+        vectors = build_user_vectors(tastes, (artist_indices, genre_indices, track_indices))
+    if vector_index.projection is not None:
+        # Compare rooms with users in the same embedding space the index uses
+        return [
+            SparseVector(np.arange(vector_index.projection.dim, dtype=np.uint32), vector_index.projection.embed(vector))
+            for vector in vectors
+        ]
+    return [vector.normalized() for vector in vectors]
+
+
+class _PostingsStore:
+    """
+    Sparse room vectors as an inverted index: position -> {room ID: value}.
+    Scoring only touches the rooms that share a position with the user.
+    """
+    def __init__(self):
+        self._postings = {}
+
+    def add(self, room_id: str, vector: SparseVector):
+        for position, value in zip(vector.indices.tolist(), vector.values.tolist()):
+            self._postings.setdefault(position, {})[room_id] = value
+
+    def remove(self, room_id: str, vector: SparseVector):
+        for position in vector.indices.tolist():
+            posting = self._postings.get(position)
+            if posting is not None:
+                posting.pop(room_id, None)
+                if not posting:
+                    del self._postings[position]
+
+    def top(self, query: SparseVector, k: int) -> list:
+        scores = {}
+        for position, value in zip(query.indices.tolist(), query.values.tolist()):
+            for room_id, room_value in self._postings.get(position, {}).items():
+                scores[room_id] = scores.get(room_id, 0.0) + value * room_value
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+class _MatrixStore:
+    """
+    Dense room embeddings as rows of a matrix. A removed room's row is filled
+    with the last row, so rows stay contiguous and removal is O(1).
+    """
+    def __init__(self, dim: int):
+        self._matrix = np.zeros((64, dim), dtype=np.float32)
+        self._ids = []      # row -> room ID
+        self._rows = {}     # room ID -> row
+
+    def add(self, room_id: str, vector: SparseVector):
+        row = self._rows.get(room_id)
+        if row is None:
+            row = len(self._ids)
+            if row == self._matrix.shape[0]:
+                self._matrix = np.concatenate([self._matrix, np.zeros_like(self._matrix)])
+            self._ids.append(room_id)
+            self._rows[room_id] = row
+        self._matrix[row] = vector.values
+
+    def remove(self, room_id: str, vector: SparseVector):
+        row = self._rows.pop(room_id, None)
+        if row is None:
+            return
+        last = len(self._ids) - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = self._ids[last]
+            self._rows[self._ids[row]] = row
+        self._ids.pop()
+
+    def top(self, query: SparseVector, k: int) -> list:
+        n = len(self._ids)
+        if n == 0 or k <= 0:
+            return []
+        scores = self._matrix[:n] @ query.values
+        top = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+        top = top[np.argsort(-scores[top])]
+        return [(self._ids[row], float(scores[row])) for row in top]
+
+
+class RoomIndex:
+    """
+    The active public rooms, held in memory and ranked against a user's vector.
+
+    Rooms are added, updated and removed one at a time as room events arrive
+    (see start_room_listener), in time proportional to the room's own size;
+    nothing is rebuilt per request. Scores are cosine similarities between
+    the user's vector, as stored in the vector index, and the room's vector.
+    """
+    def __init__(self, projection=None):
+        self._lock = threading.Lock()
+        self._projection = projection
+        self._rooms = {}    # room ID -> (summary, vector)
+        self._store = self._new_store()
+
+    def _new_store(self):
+        return _PostingsStore() if self._projection is None else _MatrixStore(self._projection.dim)
+
+    def upsert(self, room: dict, vector: SparseVector):
+        """Adds or replaces a room. Inactive and private rooms are removed instead."""
+        if not room.get("isActive", True) or not room.get("isPublic", True):
+            self.remove(room["roomId"])
+            return
+        summary = {"roomId": room["roomId"], "code": room.get("code"), "name": room.get("name"), "genres": room.get("genres", [])}
+        with self._lock:
+            previous = self._rooms.get(room["roomId"])
+            if previous is not None:
+                self._store.remove(room["roomId"], previous[1])
+            self._rooms[room["roomId"]] = (summary, vector)
+            self._store.add(room["roomId"], vector)
+            ROOM_INDEX_ROOMS.set(len(self._rooms))
+
+    def remove(self, room_id: str):
+        """Removes a room. Removing an unknown room is a no-op."""
+        with self._lock:
+            previous = self._rooms.pop(room_id, None)
+            if previous is not None:
+                self._store.remove(room_id, previous[1])
+            ROOM_INDEX_ROOMS.set(len(self._rooms))
+
+    def replace_all(self, rooms: list, vectors: list):
+        """Swaps in a complete set of rooms, e.g. after reloading them from MongoDB."""
+        fresh = RoomIndex(self._projection)
+        for room, vector in zip(rooms, vectors):
+            fresh.upsert(room, vector)
+        with self._lock:
+            self._rooms, self._store = fresh._rooms, fresh._store
+            ROOM_INDEX_ROOMS.set(len(self._rooms))
+
+    def recommend(self, user_vector: SparseVector, limit: int) -> list:
+        """
+        Ranks the rooms against a user's vector.
+
+        Returns:
+            Up to 'limit' dicts with the room's 'roomId', 'code', 'name', 'genres'
+            and 'score', best first. Rooms with nothing in common are left out.
+        """
+        with self._lock:
+            ranked = self._store.top(user_vector, limit)
+            return [dict(self._rooms[room_id][0], score=score) for room_id, score in ranked if score > 0]
+
+    def __len__(self):
+        return len(self._rooms)
+
+
+class UserVectorCache:
+    """
+    A size-bounded, TTL-based cache of users' stored vectors, so ranking rooms
+    doesn't wait on the vector index. Entries are dropped when the worker
+    reports a new vector for the user.
+    """
+    def __init__(self, max_size: int = ROOM_USER_VECTOR_CACHE_SIZE, ttl_seconds: float = ROOM_USER_VECTOR_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # user ID -> (vector, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[0]
+
+    def put(self, user_id: str, vector: SparseVector):
+        with self._lock:
+            self._entries[user_id] = (vector, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def load_active_rooms(index: RoomIndex):
+    """Rebuilds the index from every active public room in MongoDB."""
+    docs = get_collection(ROOMS_COLLECTION).find(
+        {"isActive": True, "isPublic": True},
+        {"code": 1, "name": 1, "isPublic": 1, "isActive": 1, "genres": 1, "currentPlayback": 1, "queue": 1}
+    )
+    rooms = [room_from_document(doc) for doc in docs]
+    index.replace_all(rooms, vectorize_rooms(rooms))
+    logger.info("Loaded active rooms", extra={"rooms": len(index)})
+
+
+def apply_room_event(index: RoomIndex, routing_key: str, room: dict):
+    """Applies one room event to the index."""
+    if routing_key == ROOM_CLOSED_ROUTING_KEY:
+        index.remove(room["roomId"])
+    else:
+        index.upsert(room, vectorize_rooms([room])[0])
+    ROOM_EVENTS.inc(event=routing_key)
+
+
+def start_room_listener(index: RoomIndex, user_vectors: UserVectorCache) -> threading.Thread:
+    """
+    Starts a daemon thread that loads the active rooms and then keeps the index
+    up to date from room events, reloading it every ROOM_INDEX_RECONCILE_SECONDS
+    for changes no event reports. It also drops cached user vectors when the
+    worker reports an update. If RabbitMQ is not configured, the rooms are only
+    reloaded periodically and user vectors simply expire after the TTL.
+    """
+    def load_once():
+        try:
+            load_active_rooms(index)
+        except Exception as e:
+            logger.warning("Could not load active rooms.", extra={"error": str(e)})
+
+    if not RABBITMQ_URL:
+        logger.info("RABBITMQ_URL not set. The room index is only kept up to date by periodic reloads.")
+
+        def reload():
+            while True:
+                load_once()
+                if ROOM_INDEX_RECONCILE_SECONDS <= 0:
+                    return
+                time.sleep(ROOM_INDEX_RECONCILE_SECONDS)
+
+        thread = threading.Thread(target=reload, name="room-index-load", daemon=True)
+        thread.start()
+        return thread
+
+    def listen():
+        while True:
+            try:
+                connection = pika.BlockingConnection(pika.URLParameters(RABBITMQ_URL))
+                channel = connection.channel()
+                channel.exchange_declare(exchange=EXCHANGE_NAME, exchange_type='direct', durable=True)
+                # An exclusive, server-named queue per process: every API process gets every event
+                result = channel.queue_declare(queue='', exclusive=True, auto_delete=True)
+                queue_name = result.method.queue
+                for routing_key in (ROOM_OPENED_ROUTING_KEY, ROOM_UPDATED_ROUTING_KEY, ROOM_CLOSED_ROUTING_KEY, INVALIDATION_ROUTING_KEY):
+                    channel.queue_bind(exchange=EXCHANGE_NAME, queue=queue_name, routing_key=routing_key)
+
+                def callback(ch, method, properties, body):
+                    try:
+                        message = json.loads(body)
+                        if method.routing_key == INVALIDATION_ROUTING_KEY:
+                            for user_id in message.get("userIds", []):
+                                user_vectors.invalidate(user_id)
+                        else:
+                            apply_room_event(index, method.routing_key, message)
+                    except (json.JSONDecodeError, AttributeError, KeyError, TypeError):
+                        logger.warning("Ignoring malformed room event.", extra={"routingKey": method.routing_key})
+
+                # Events published while we were disconnected are lost, so start from what MongoDB has.
+                # The queue is bound first, so nothing published during the load is missed.
+                user_vectors.clear()
+                load_active_rooms(index)
+
+                # Runs on this thread between events, so events published after the reload's
+                # query are applied after it, just like after the initial load
+                def reconcile():
+                    load_once()
+                    connection.call_later(ROOM_INDEX_RECONCILE_SECONDS, reconcile)
+
+                if ROOM_INDEX_RECONCILE_SECONDS > 0:
+                    connection.call_later(ROOM_INDEX_RECONCILE_SECONDS, reconcile)
+                channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=True)
+                logger.info("Room index listener started.")
+                channel.start_consuming()
+            except Exception as e:
+                logger.warning(
+                    "Room index listener disconnected. Reconnecting.",
+                    extra={"error": str(e), "retryInSeconds": RECONNECT_DELAY_SECONDS},
+                )
+                time.sleep(RECONNECT_DELAY_SECONDS)
+
+    thread = threading.Thread(target=listen, name="room-index-listener", daemon=True)
+    thread.start()
+    return thread
+
+
+# Create singletons shared by the whole API process.
+room_index = RoomIndex(vector_index.projection)
+room_user_vectors = UserVectorCache()
@@ -0,0 +1,140 @@
+import os
+from typing import NamedTuple
+
+from pymongo import ReplaceOne
+from dotenv import load_dotenv
+
+from core.fingerprint import taste_fingerprint
+from core.vectorization import resolve_vocab_indices, build_user_vectors, user_vocab_indices
+from services.mongo_client import get_async_collection
+from services.metrics import TASTE_UPDATES
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+# Skip taste updates whose vector-relevant content is unchanged (e.g. a periodic
+# Spotify re-sync that only moved 'updatedAt' or reordered artists), and look up
+# only the items that are new when a taste did change.
+TASTE_CHANGE_DETECTION = os.getenv("TASTE_CHANGE_DETECTION", "true").lower() == "true"
+
+# One document per user: the fingerprint of the taste behind their current
+# vector and, in "vocab" mode, the vocabulary indices of its items.
+# If the vector index is ever wiped without a backfill, drop this collection too,
+# or unchanged users will not be re-upserted.
+TASTE_STATE_COLLECTION = "taste_states"
+
+_SECTIONS = ("artists", "genres", "tracks")
+
+
+class TasteState(NamedTuple):
+    """What the worker remembers about the taste behind a user's current vector."""
+    fingerprint: str
+    # (artist_indices, genre_indices, track_indices) for the taste's items, or None in "hashing" mode
+    vocab_indices: tuple
+
+
+class TasteChanges(NamedTuple):
+    """The result of filter_changed: what still has to be vectorized."""
+    tastes: dict         # userId -> musicTaste, only for users whose taste changed
+    fingerprints: dict   # userId -> fingerprint of the new taste
+    known: tuple         # vocabulary indices reusable from the previous tastes, or None
+
+
+def _to_document(user_id: str, state: TasteState) -> dict:
+    document = {"_id": user_id, "fingerprint": state.fingerprint}
+    if state.vocab_indices is not None:
+        # Genre names can contain characters that aren't valid field names, hence parallel arrays
+        for section, indices in zip(_SECTIONS, state.vocab_indices):
+            document[section] = {"keys": list(indices), "indices": list(indices.values())}
+    return document
+
+
+def _from_document(document: dict) -> TasteState:
+    vocab_indices = None
+    if all(section in document for section in _SECTIONS):
+        vocab_indices = tuple(
+            dict(zip(document[section]["keys"], document[section]["indices"])) for section in _SECTIONS
+        )
+    return TasteState(document["fingerprint"], vocab_indices)
+
+
+async def load_states(user_ids: list) -> dict:
+    """Reads the stored states of several users in one round trip. Users never seen before are missing."""
+    cursor = get_async_collection(TASTE_STATE_COLLECTION).find({"_id": {"$in": list(user_ids)}})
+    return {document["_id"]: _from_document(document) async for document in cursor}
+
+
+async def save_states(states: dict):
+    """Records the states of users whose new vectors have been upserted."""
+    if not TASTE_CHANGE_DETECTION or not states:
+        return
+    await get_async_collection(TASTE_STATE_COLLECTION).bulk_write(
+        [ReplaceOne({"_id": user_id}, _to_document(user_id, state), upsert=True) for user_id, state in states.items()],
+        ordered=False
+    )
+
+
+async def filter_changed(latest: dict) -> TasteChanges:
+    """
+    Drops the users whose taste is unchanged since their last upserted vector.
+
+    For the rest, returns the vocabulary indices already known from their
+    previous tastes, so only new items need to be resolved: when a few items
+    changed, the vector is rebuilt from the stored indices plus a lookup of
+    the new items rather than from scratch.
+
+    Args:
+        latest: Maps each userId to its newest musicTaste.
+    """
+    fingerprints = {user_id: taste_fingerprint(music_taste) for user_id, music_taste in latest.items()}
+    if not TASTE_CHANGE_DETECTION:
+        TASTE_UPDATES.inc(len(latest), result="full")
+        return TasteChanges(dict(latest), fingerprints, None)
+
+    previous = await load_states(list(latest))
+    changed = {}
+    known = ({}, {}, {})
+    for user_id, music_taste in latest.items():
+        state = previous.get(user_id)
+        if state is not None and state.fingerprint == fingerprints[user_id]:
+            TASTE_UPDATES.inc(result="unchanged")
+            continue
+        changed[user_id] = music_taste
+        if state is not None and state.vocab_indices is not None:
+            # Vocabulary indices never change, so indices from any user's taste are valid for all
+            for merged, indices in zip(known, state.vocab_indices):
+                merged.update(indices)
+            TASTE_UPDATES.inc(result="delta")
+        else:
+            TASTE_UPDATES.inc(result="full")
+    return TasteChanges(changed, fingerprints, known)
+
+
+def new_states(changes: TasteChanges, vocab_indices: tuple, user_ids: list) -> dict:
+    """The states to save for the given users once their vectors have been upserted."""
+    return {
+        user_id: TasteState(changes.fingerprints[user_id], user_vocab_indices(changes.tastes[user_id], vocab_indices))
+        for user_id in user_ids
+    }
+
+
+async def vectorize_changed(latest: dict) -> tuple:
+    """
+    Vectorizes only the tastes that changed, resolving only their new items.
+
+    Args:
+        latest: Maps each userId to its newest musicTaste.
+
+    Returns:
+        (vectors, states): vectors maps each changed user to their new SparseVector,
+        and states holds what to pass to save_states once those vectors are upserted.
+        Users with unchanged tastes are in neither.
+    """
+    changes = await filter_changed(latest)
+    if not changes.tastes:
+        return {}, {}
+    music_tastes = list(changes.tastes.values())
+    vocab_indices = await resolve_vocab_indices(music_tastes, known=changes.known)
+    vectors = dict(zip(changes.tastes, build_user_vectors(music_tastes, vocab_indices)))
+    return vectors, new_states(changes, vocab_indices, list(changes.tastes))
@@ -0,0 +1,49 @@
+import os
+from dotenv import load_dotenv
+
+from core.embedding import Projection
+from services.logging_config import get_logger
+# Re-exported, so the contract can still be imported from here
+from services.vector_index_backend import VectorIndexBackend
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+# Which vector index backend to use: "pinecone" (hosted) or "local" (in-process NumPy).
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "pinecone").lower()
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "data/user_vectors.npz")
+# A stored projection (see scripts/fit_embedding.py) that compacts every vector into a
+# small dense embedding before it is indexed. Empty indexes the raw sparse vectors,
+# which only the Pinecone backend supports. The worker and the API must point at the same file.
+EMBEDDING_PATH = os.getenv("EMBEDDING_PATH", "")
+
+logger = get_logger(__name__)
+
+
+def load_projection(path: str = EMBEDDING_PATH):
+    """Loads the configured embedding projection, or returns None if embeddings are off."""
+    if not path:
+        return None
+    projection = Projection.load(path)
+    logger.info("Using embedding projection", extra={"embedding": projection.version, "dimensions": projection.dim, "path": path})
+    return projection
+
+
+def create_vector_index(backend: str = VECTOR_INDEX_BACKEND) -> VectorIndexBackend:
+    """
+    Builds the configured vector index backend.
+    The backends are imported lazily so the local one never needs the Pinecone client.
+    """
+    projection = load_projection()
+    if backend == "pinecone":
+        from services.pinecone_service import PineconeService
+        return PineconeService(projection)
+    if backend == "local":
+        from services.local_vector_index import LocalVectorIndex
+        return LocalVectorIndex(LOCAL_INDEX_PATH, projection)
+    raise ValueError(f"Unknown VECTOR_INDEX_BACKEND '{backend}'. Expected 'pinecone' or 'local'.")
+
+
+# Create a singleton instance of the configured backend so we only initialize it once.
+vector_index = create_vector_index()
@@ -0,0 +1,136 @@
+import os
+import asyncio
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from core.vectorization import SparseVector
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+# How many index queries a batch request may run at the same time
+BATCH_QUERY_CONCURRENCY = int(os.getenv("BATCH_QUERY_CONCURRENCY", 8))
+
+# The contract every vector index backend implements. It lives apart from
+# services/vector_index.py, which builds the configured backend on import, so
+# the backends can import it without importing (and constructing) themselves.
+
+
+class VectorIndexBackend(ABC):
+    """
+    The contract shared by every vector index backend.
+
+    Vectors go in as SparseVectors keyed by user ID, and similarity queries
+    return a list of {'userId', 'score'} dicts ordered by descending score.
+
+    When the backend has a projection, it stores and compares each vector's
+    dense embedding instead of the raw sparse vector.
+
+    Backends must implement every abstract method; the rest have defaults.
+    """
+    projection = None
+
+    @property
+    @abstractmethod
+    def name(self) -> str:
+        """Identifies the backend and the index the vectors are stored in."""
+
+    @abstractmethod
+    def upsert_user_vector(self, user_id: str, vector: SparseVector):
+        """Inserts or updates a user's vector."""
+
+    def upsert_user_vectors(self, items: list):
+        """
+        Inserts or updates several users' vectors in one call.
+
+        Args:
+            items: A list of (user_id, SparseVector) tuples.
+        """
+        for user_id, vector in items:
+            self.upsert_user_vector(user_id, vector)
+
+    @abstractmethod
+    def delete_user_vector(self, user_id: str):
+        """Removes a user's vector. Deleting an unknown user is a no-op."""
+
+    @abstractmethod
+    def fetch_user_vectors(self, user_ids: list) -> dict:
+        """
+        Reads back the stored vectors of several users.
+
+        Returns:
+            A dict mapping each user ID that has a vector to its (normalized) SparseVector.
+            With a projection, this is the embedding, with one position per dimension.
+        """
+
+    @abstractmethod
+    def list_user_ids(self):
+        """Yields the ID of every user that has a vector."""
+
+    def read_matrix(self, callback):
+        """
+        Gives direct access to the backend's row-normalized matrix of all users, for
+        backends that keep one in memory. Calls callback(matrix, ids, rows) while
+        holding the backend's lock and returns its result; 'ids' maps rows to user IDs
+        and 'rows' is the reverse. Returns None without calling it if unsupported.
+        """
+        return None
+
+    def flush(self):
+        """Persists pending writes, for backends that buffer them. A no-op by default."""
+
+    def flush_if_due(self):
+        """
+        Persists pending writes if the backend's save interval has passed since the
+        last save. Called periodically by the worker, so a burst of writes reaches
+        readers even when no further write follows it. A no-op by default.
+        """
+
+    def warm_up(self):
+        """
+        Opens connections and loads data ahead of the first request, and raises
+        if the backend isn't usable. Backends otherwise do this lazily on first use.
+        """
+
+    @abstractmethod
+    def query_similar_users(self, user_id: str, top_k: int = 50) -> list:
+        """
+        Finds the users most similar to an existing user.
+
+        Args:
+            user_id: The ID of the user to find recommendations for.
+            top_k: The number of similar users to return.
+
+        Returns:
+            A list of dictionaries, each containing a 'userId' and a 'score'.
+            An empty list if the user has no vector yet.
+        """
+
+    def query_similar_users_batch(self, user_ids: list, top_k: int = 50) -> dict:
+        """
+        Runs query_similar_users for several users, BATCH_QUERY_CONCURRENCY at a time.
+        Backends that can do better (e.g. one matrix product) override this.
+
+        Returns:
+            A dict mapping each user ID to its list of {'userId', 'score'} dicts.
+        """
+        with ThreadPoolExecutor(max_workers=BATCH_QUERY_CONCURRENCY) as executor:
+            results = executor.map(lambda user_id: self.query_similar_users(user_id, top_k), user_ids)
+            return dict(zip(user_ids, results))
+
+    # --- Async queries, for the async API (api_async.py) ---
+    # By default these run the blocking query on a worker thread so the event loop
+    # stays free; backends with a non-blocking client override them.
+
+    async def query_similar_users_async(self, user_id: str, top_k: int = 50) -> list:
+        """query_similar_users without blocking the event loop."""
+        return await asyncio.to_thread(self.query_similar_users, user_id, top_k)
+
+    async def query_similar_users_batch_async(self, user_ids: list, top_k: int = 50) -> dict:
+        """query_similar_users_batch without blocking the event loop."""
+        return await asyncio.to_thread(self.query_similar_users_batch, user_ids, top_k)
+
+    async def close_async(self):
+        """Closes any connections opened by the async queries. A no-op by default."""
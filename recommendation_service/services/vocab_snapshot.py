@@ -0,0 +1,86 @@
+import os
+import time
+import threading
+
+from dotenv import load_dotenv
+
+from core.vocab_snapshot import VocabSnapshot
+from services.logging_config import get_logger
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+# Where the vocabulary snapshot lives (written by scripts/export_vocabulary_snapshot.py).
+# Empty disables it: every vocabulary lookup goes to the in-process cache and MongoDB.
+VOCAB_SNAPSHOT_PATH = os.getenv("VOCAB_SNAPSHOT_PATH", "")
+# How often (in seconds) a process checks whether the snapshot file was replaced.
+VOCAB_SNAPSHOT_RELOAD_INTERVAL = float(os.getenv("VOCAB_SNAPSHOT_RELOAD_INTERVAL", 10))
+
+logger = get_logger(__name__)
+
+
+class VocabSnapshotStore:
+    """
+    The process-wide handle on the memory-mapped vocabulary snapshot.
+
+    The exporter replaces the file atomically; when a process notices a new
+    file it maps that one and swaps it in. Lookups already running finish on
+    the old mapping, which is released once nothing refers to it.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.snapshot = None
+        self._lock = threading.Lock()
+        self._loaded_file = None
+        # Far enough in the past that the first use maps the file
+        self._last_reload_check = float("-inf")
+
+    def _maybe_reload(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_reload_check < VOCAB_SNAPSHOT_RELOAD_INTERVAL:
+            return
+        with self._lock:
+            if not force and now - self._last_reload_check < VOCAB_SNAPSHOT_RELOAD_INTERVAL:
+                return
+            self._last_reload_check = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            file_id = (stat.st_ino, stat.st_mtime_ns)
+            if file_id == self._loaded_file:
+                return
+            try:
+                snapshot = VocabSnapshot.open(self.path)
+            except (OSError, ValueError) as e:
+                logger.warning("Could not open vocabulary snapshot", extra={"path": self.path, "error": str(e)})
+                return
+            self.snapshot = snapshot
+            self._loaded_file = file_id
+            logger.info(
+                "Mapped vocabulary snapshot",
+                extra={"path": self.path, **{f"{section}s": snapshot.count(section) for section in ("artist", "genre", "track")}},
+            )
+
+    def warm_up(self):
+        """Maps the snapshot ahead of the first lookup."""
+        self._maybe_reload(force=True)
+
+    def lookup(self, section: str, keys) -> dict:
+        """
+        Finds keys in the current snapshot.
+
+        Returns:
+            A dict mapping every key that is in the snapshot to its index;
+            empty if there is no snapshot yet.
+        """
+        self._maybe_reload()
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {}
+        return snapshot.lookup(section, keys)
+
+
+# Create a singleton handle for the process, if a snapshot is configured.
+vocab_snapshot = VocabSnapshotStore(VOCAB_SNAPSHOT_PATH) if VOCAB_SNAPSHOT_PATH else None
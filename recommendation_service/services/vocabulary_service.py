@@ -1,111 +1,242 @@
-from .mongo_client import artist_vocab_collection, genre_vocab_collection, track_vocab_collection, counters_collection
+import os
+from collections import OrderedDict
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from .logging_config import get_logger
+from .metrics import VOCAB_LOOKUPS
+from .vocab_snapshot import vocab_snapshot
+
+from .mongo_client import (
+    get_collection,
+    get_async_collection,
+    ARTIST_VOCAB_COLLECTION,
+    GENRE_VOCAB_COLLECTION,
+    TRACK_VOCAB_COLLECTION,
+    COUNTERS_COLLECTION,
+)
+
+# --- Configuration ---
+# Maximum number of id -> index entries kept in memory per vocabulary.
+# Indices never change once assigned, so cached entries never go stale.
+VOCAB_CACHE_SIZE = int(os.getenv("VOCAB_CACHE_SIZE", 100000))
+
+DUPLICATE_KEY_ERROR = 11000
+
+logger = get_logger(__name__)
+
+
+class LRUCache:
+    """
+    A small, size-bounded least-recently-used mapping.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data = OrderedDict()
+
+    def get_many(self, keys) -> dict:
+        """Returns the cached values for the keys that are present."""
+        found = {}
+        for key in keys:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+                found[key] = value
+        return found
+
+    def put_many(self, entries: dict):
+        for key, value in entries.items():
+            self._data[key] = value
+            self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+artist_index_cache = LRUCache(VOCAB_CACHE_SIZE)
+genre_index_cache = LRUCache(VOCAB_CACHE_SIZE)
+track_index_cache = LRUCache(VOCAB_CACHE_SIZE)
+
+
+def _snapshot_lookup(section: str, keys) -> dict:
+    # Keys found in the shared snapshot are not copied into the per-process cache
+    if vocab_snapshot is None:
+        return {}
+    return vocab_snapshot.lookup(section, keys)
+
+
+async def _resolve_indices(collection, section: str, key_field: str, counter_field: str, cache: LRUCache, new_docs: dict) -> dict:
+    """
+    Resolves a batch of vocabulary keys to their indices, creating the missing ones.
+
+    Keys in the vocabulary snapshot (if configured) or the cache cost nothing;
+    the rest cost at most one '$in' query, one counter update and one
+    'insert_many', no matter how many keys are passed.
+
+    Args:
+        collection: The vocabulary collection.
+        section: The snapshot section of this vocabulary ('artist', 'genre' or 'track').
+        key_field: The field that uniquely identifies a term ('spotifyId' or 'name').
+        counter_field: The field of the counter document that holds the last used index.
+        cache: The in-process id -> index cache for this vocabulary.
+        new_docs: Maps each key to the document to insert if the key is new.
+
+    Returns:
+        A dict mapping every key in new_docs to its index.
+    """
+    resolved = _snapshot_lookup(section, new_docs.keys())
+    VOCAB_LOOKUPS.inc(len(resolved), vocabulary=collection.name, result="snapshot_hit")
+    cached = cache.get_many(key for key in new_docs if key not in resolved)
+    VOCAB_LOOKUPS.inc(len(cached), vocabulary=collection.name, result="cache_hit")
+    resolved.update(cached)
+    missing = [key for key in new_docs if key not in resolved]
+    if not missing:
+        return resolved
+
+    # 1. Look up every uncached key in a single round trip
+    found = {
+        doc[key_field]: doc["index"]
+        async for doc in collection.find({key_field: {"$in": missing}}, {key_field: 1, "index": 1})
+    }
+    resolved.update(found)
+    cache.put_many(found)
+    VOCAB_LOOKUPS.inc(len(found), vocabulary=collection.name, result="db_hit")
+
+    new_keys = [key for key in missing if key not in found]
+    if not new_keys:
+        return resolved
+
+    # 2. Reserve a contiguous block of indices for all new keys with a single $inc
+    counter_update = await get_async_collection(COUNTERS_COLLECTION).find_one_and_update(
+        {"_id": "vocab_counters"},
+        {"$inc": {counter_field: len(new_keys)}},
+        # Creates the counter (starting from 0) if bootstrap hasn't run yet
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    last_index = counter_update[counter_field]
+    first_index = last_index - len(new_keys) + 1
+    assigned = {key: first_index + offset for offset, key in enumerate(new_keys)}
+
+    # 3. Insert all new terms at once. ordered=False lets the rest of the batch go
+    # through if another process inserted some of the same terms concurrently.
+    docs = [dict(new_docs[key], index=assigned[key]) for key in new_keys]
+    lost_keys = []
+    try:
+        await collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != DUPLICATE_KEY_ERROR for error in write_errors):
+            raise
+        # Another process won the race for these terms; use the index it stored.
+        lost_keys = [docs[error["index"]][key_field] for error in write_errors]
+        logger.info("Race condition handled. Re-fetching indices.", extra={"vocabulary": collection.name, "terms": len(lost_keys)})
+        async for doc in collection.find({key_field: {"$in": lost_keys}}, {key_field: 1, "index": 1}):
+            assigned[doc[key_field]] = doc["index"]
+
+    logger.debug(
+        "Added new terms",
+        extra={"vocabulary": collection.name, "terms": len(new_keys) - len(lost_keys), "firstIndex": first_index, "lastIndex": last_index},
+    )
+    VOCAB_LOOKUPS.inc(len(lost_keys), vocabulary=collection.name, result="db_hit")
+    VOCAB_LOOKUPS.inc(len(new_keys) - len(lost_keys), vocabulary=collection.name, result="created")
+    resolved.update(assigned)
+    cache.put_many(assigned)
+    return resolved
+
+
+async def resolve_artist_indices(artists: list) -> dict:
+    """
+    Finds or creates the vocabulary entries for a list of artists.
+
+    Args:
+        artists: A list of {'id', 'name'} dicts, as found in 'musicTaste.topArtists'.
+
+    Returns:
+        A dict mapping each artist's Spotify ID to its index.
+    """
+    new_docs = {artist["id"]: {"spotifyId": artist["id"], "name": artist["name"]} for artist in artists}
+    return await _resolve_indices(get_async_collection(ARTIST_VOCAB_COLLECTION), "artist", "spotifyId", "artist_index", artist_index_cache, new_docs)
+
+
+async def resolve_genre_indices(genre_names: list) -> dict:
+    """
+    Finds or creates the vocabulary entries for a list of genre names.
+    Returns a dict mapping each genre name to its index.
+    """
+    new_docs = {name: {"name": name} for name in genre_names}
+    return await _resolve_indices(get_async_collection(GENRE_VOCAB_COLLECTION), "genre", "name", "genre_index", genre_index_cache, new_docs)
+
+
+async def resolve_track_indices(tracks: list) -> dict:
+    """
+    Finds or creates the vocabulary entries for a list of tracks.
+
+    Args:
+        tracks: A list of {'id', 'name'} dicts, as found in 'musicTaste.topTracks'.
+
+    Returns:
+        A dict mapping each track's Spotify ID to its index.
+    """
+    new_docs = {track["id"]: {"spotifyId": track["id"], "name": track["name"]} for track in tracks}
+    return await _resolve_indices(get_async_collection(TRACK_VOCAB_COLLECTION), "track", "spotifyId", "track_index", track_index_cache, new_docs)
+
+
+def find_known_indices(music_tastes: list) -> tuple:
+    """
+    Looks up the artists, genres and tracks of the given tastes without
+    creating entries for new ones: from the snapshot, then with one blocking
+    query per vocabulary for anything newer.
+    For scoring things other than users (e.g. rooms): an item no user has
+    can't match anyone, so it doesn't need an index.
+
+    Returns:
+        An (artist_indices, genre_indices, track_indices) tuple of dicts holding
+        only the items already in the vocabulary.
+    """
+    lookups = (
+        (ARTIST_VOCAB_COLLECTION, "artist", "spotifyId", {artist["id"] for taste in music_tastes for artist in taste.get("topArtists", [])}),
+        (GENRE_VOCAB_COLLECTION, "genre", "name", {genre for taste in music_tastes for genre in taste.get("topGenres", [])}),
+        (TRACK_VOCAB_COLLECTION, "track", "spotifyId", {track["id"] for taste in music_tastes for track in taste.get("topTracks", [])}),
+    )
+    results = []
+    for name, section, key_field, keys in lookups:
+        found = _snapshot_lookup(section, keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            found.update(
+                (doc[key_field], doc["index"])
+                for doc in get_collection(name).find({key_field: {"$in": missing}}, {key_field: 1, "index": 1})
+            )
+        results.append(found)
+    return tuple(results)
+
 
 async def get_or_create_artist_index(artist_id: str, artist_name: str) -> int:
     """
     Finds an artist in the vocabulary or creates a new entry atomically.
     Returns the index for the artist.
     """
-    # 1. Try to find the existing artist
-    artist_doc = artist_vocab_collection.find_one({"spotifyId": artist_id})
-    
-    if artist_doc:
-        return artist_doc["index"]
-    else:
-        # 2. If not found, it's a new artist. We need to get a new index.
-        try:
-            # Atomically increment the counter and get the new value
-            counter_update = counters_collection.find_one_and_update(
-                {"_id": "vocab_counters"},
-                {"$inc": {"artist_index": 1}},
-                return_document=True # In PyMongo, this is an enum
-            )
-            new_index = counter_update["artist_index"]
-
-            # 3. Create the new artist document with the new index
-            # We use insert_one inside a try-except to handle the rare race condition
-            # where two processes try to insert the same artist at the same time.
-            artist_vocab_collection.insert_one({
-                "spotifyId": artist_id,
-                "name": artist_name,
-                "index": new_index
-            })
-            print(f"Added new artist '{artist_name}' to vocabulary at index {new_index}")
-            return new_index
-        except Exception as e:
-            # This handles the race condition. If insert_one fails because another
-            # process just inserted it, we re-query to get the correct index.
-            print(f"Race condition handled for artist {artist_name}. Re-fetching index.")
-            retry_doc = artist_vocab_collection.find_one({"spotifyId": artist_id})
-            if retry_doc:
-                return retry_doc["index"]
-            else:
-                # If it still fails, something is seriously wrong.
-                raise e
+    indices = await resolve_artist_indices([{"id": artist_id, "name": artist_name}])
+    return indices[artist_id]
+
 
 async def get_or_create_genre_index(genre_name: str) -> int:
     """
     Finds a genre in the vocabulary or creates a new entry atomically.
     Returns the index for the genre.
     """
-    # This logic is identical to the artist function, just with different fields
-    genre_doc = genre_vocab_collection.find_one({"name": genre_name})
-    
-    if genre_doc:
-        return genre_doc["index"]
-    else:
-        try:
-            counter_update = counters_collection.find_one_and_update(
-                {"_id": "vocab_counters"},
-                {"$inc": {"genre_index": 1}},
-                return_document=True
-            )
-            new_index = counter_update["genre_index"]
-            
-            genre_vocab_collection.insert_one({
-                "name": genre_name,
-                "index": new_index
-            })
-            print(f"Added new genre '{genre_name}' to vocabulary at index {new_index}")
-            return new_index
-        except Exception as e:
-            print(f"Race condition handled for genre {genre_name}. Re-fetching index.")
-            retry_doc = genre_vocab_collection.find_one({"name": genre_name})
-            if retry_doc:
-                return retry_doc["index"]
-            else:
-                raise e
-            
+    indices = await resolve_genre_indices([genre_name])
+    return indices[genre_name]
+
+
 async def get_or_create_track_index(track_id: str, track_name: str) -> int:
     """
     Finds a track in the vocabulary or creates a new entry atomically.
     Returns the index for the track.
     """
-    track_doc = track_vocab_collection.find_one({"spotifyId": track_id})
-    
-    if track_doc:
-        return track_doc["index"]
-    else:
-        try:
-            # Atomically increment the track counter
-            counter_update = counters_collection.find_one_and_update(
-                {"_id": "vocab_counters"},
-                {"$inc": {"track_index": 1}},
-                return_document=True # Or ReturnDocument.AFTER
-            )
-            new_index = counter_update["track_index"]
-            
-            track_vocab_collection.insert_one({
-                "spotifyId": track_id,
-                "name": track_name,
-                "index": new_index
-            })
-            print(f"Added new track '{track_name}' to vocabulary at index {new_index}")
-            return new_index
-        except Exception as e:
-            # Handle race condition
-            print(f"Race condition handled for track {track_name}. Re-fetching index.")
-            retry_doc = track_vocab_collection.find_one({"spotifyId": track_id})
-            if retry_doc:
-                return retry_doc["index"]
-            else:
-                raise e
\ No newline at end of file
+    indices = await resolve_track_indices([{"id": track_id, "name": track_name}])
+    return indices[track_id]
@@ -1,7 +1,30 @@
+# 0. One-time setup: Mongo indexes and the vector index (safe to repeat)
+echo "Bootstrapping..."
+python -m scripts.bootstrap || exit 1
+
+# With VOCAB_SNAPSHOT_PATH set, export the vocabularies to a memory-mapped file that every
+# process shares, and refresh it in the background (hourly unless VOCAB_SNAPSHOT_REFRESH_SECONDS says otherwise)
+if [ -n "${VOCAB_SNAPSHOT_PATH}" ]; then
+    echo "Starting vocabulary snapshot exporter"
+    python -m scripts.export_vocabulary_snapshot --every "${VOCAB_SNAPSHOT_REFRESH_SECONDS:-3600}" &
+fi
+
 # 1. Start the Worker in the background (& symbol does this)
-echo "Starting Background Worker"
-python worker.py &
+# WORKER_PROCESSES > 1 runs a supervised pool of worker processes sharded by user (worker_pool.py)
+if [ "${WORKER_PROCESSES:-1}" -gt 1 ]; then
+    echo "Starting Background Worker pool (${WORKER_PROCESSES} processes)"
+    python worker_pool.py &
+else
+    echo "Starting Background Worker"
+    python worker.py &
+fi
 
 # 2. Start the API in the foreground (This keeps the container alive)
+# API_SERVER=async serves it from the async app (api_async.py), where one process
+# handles many concurrent requests; the default is the Flask app on Gunicorn.
+if [ "${API_SERVER:-gunicorn}" = "async" ]; then
+    echo "Starting API Server (async)..."
+    exec hypercorn api_async:app --bind "0.0.0.0:${PORT:-8000}" --workers "${API_WORKERS:-1}"
+fi
 echo "Starting API Server..."
 gunicorn api:app
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""
+Runs the service against the in-memory stand-ins from benchmarks/standins.py
+and a local vector index (with a random projection) in a temporary directory,
+so the tests need neither MongoDB, RabbitMQ nor Pinecone. Service modules read
+their configuration at import time, so the environment is prepared here,
+before any test imports them.
+
+Usage (from the recommendation_service directory):
+    python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+from core.embedding import Projection
+
+_workdir = tempfile.TemporaryDirectory(prefix="rhythm-tests-")
+EMBEDDING_PATH = os.path.join(_workdir.name, "embedding.npz")
+Projection.random(64, seed=1).save(EMBEDDING_PATH)
+os.environ.update({
+    "VECTOR_INDEX_BACKEND": "local",
+    "LOCAL_INDEX_PATH": os.path.join(_workdir.name, "user_vectors.npz"),
+    "NEIGHBOR_TABLE_PATH": "",
+    "EMBEDDING_PATH": EMBEDDING_PATH,
+    "VOCAB_SNAPSHOT_PATH": "",
+    "RABBITMQ_URL": "",
+    "WARM_UP_ON_START": "false",
+    "LOG_LEVEL": "WARNING",
+})
+
+from benchmarks import standins
+
+standins.install_mongo()
@@ -0,0 +1,64 @@
+import pytest
+
+from core.vectorization import SparseVector
+from services.recommender import MAX_CANDIDATES
+from services.vector_index import vector_index
+
+import api
+
+
+@pytest.fixture(scope="module")
+def client():
+    vector_index.upsert_user_vectors([
+        ("user-1", SparseVector.from_dict({1: 1.0, 2: 1.0})),
+        ("user-2", SparseVector.from_dict({2: 1.0, 3: 1.0})),
+    ])
+    return api.app.test_client()
+
+
+@pytest.mark.parametrize("limit", [1, MAX_CANDIDATES])
+def test_recommend_accepts_limits_in_range(client, limit):
+    response = client.get(f"/recommend/user-1?limit={limit}")
+    assert response.status_code == 200
+    assert [item["userId"] for item in response.get_json()] == ["user-2"]
+
+
+@pytest.mark.parametrize("limit", [0, -1, MAX_CANDIDATES + 1, "ten"])
+def test_recommend_rejects_limits_out_of_range(client, limit):
+    response = client.get(f"/recommend/user-1?limit={limit}")
+    assert response.status_code == 400
+    assert "limit" in response.get_json()["error"]
+
+
+@pytest.mark.parametrize("limit", [1, MAX_CANDIDATES])
+def test_batch_accepts_limits_in_range(client, limit):
+    response = client.post("/recommend/batch", json={"userIds": ["user-1"], "limit": limit})
+    assert response.status_code == 200
+    assert [item["userId"] for item in response.get_json()["user-1"]] == ["user-2"]
+
+
+@pytest.mark.parametrize("limit", [0, -1, MAX_CANDIDATES + 1, None])
+def test_batch_rejects_limits_out_of_range(client, limit):
+    response = client.post("/recommend/batch", json={"userIds": ["user-1"], "limit": limit})
+    assert response.status_code == 400
+    assert "limit" in response.get_json()["error"]
+
+
+@pytest.mark.parametrize("body", [["user-1"], "user-1", 42])
+def test_batch_rejects_bodies_that_are_not_objects(client, body):
+    response = client.post("/recommend/batch", json=body)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+@pytest.mark.parametrize("exclude", [["user-2"], {"user-1": "user-2"}, {"user-1": [2]}])
+def test_batch_rejects_malformed_exclude(client, exclude):
+    response = client.post("/recommend/batch", json={"userIds": ["user-1"], "exclude": exclude})
+    assert response.status_code == 400
+    assert "exclude" in response.get_json()["error"]
+
+
+def test_batch_applies_exclude(client):
+    response = client.post("/recommend/batch", json={"userIds": ["user-1"], "exclude": {"user-1": ["user-2"]}})
+    assert response.status_code == 200
+    assert response.get_json()["user-1"] == []
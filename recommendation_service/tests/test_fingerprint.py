@@ -0,0 +1,25 @@
+from core.embedding import Projection
+from core.fingerprint import taste_fingerprint
+from services.vector_index import vector_index
+
+TASTE = {
+    "topArtists": [{"id": "artist-1", "name": "Artist"}],
+    "topGenres": ["indie", "rock"],
+    "topTracks": [{"id": "track-1", "name": "Track"}, {"id": "track-2", "name": "Other"}],
+}
+
+
+def test_fingerprint_is_independent_of_item_order():
+    reordered = dict(TASTE, topGenres=["rock", "indie"], topTracks=list(reversed(TASTE["topTracks"])))
+    assert taste_fingerprint(reordered) == taste_fingerprint(TASTE)
+
+
+def test_fingerprint_changes_with_the_embedding_and_the_index(monkeypatch):
+    before = taste_fingerprint(TASTE)
+
+    monkeypatch.setattr(vector_index, "projection", Projection.random(16, seed=3))
+    with_embedding = taste_fingerprint(TASTE)
+    assert with_embedding != before
+
+    monkeypatch.setattr(vector_index, "path", vector_index.path + ".fresh")
+    assert taste_fingerprint(TASTE) not in (before, with_embedding)
@@ -0,0 +1,56 @@
+import numpy as np
+
+from core.neighbors import NeighborTable
+
+K = 8
+
+
+def random_rows(rng, count: int, dim: int = 24) -> np.ndarray:
+    # Sparse-ish non-negative rows, so some pairs of users have nothing in common
+    rows = (rng.random((count, dim)) < 0.2) * rng.random((count, dim))
+    rows[~rows.any(axis=1), 0] = 1.0
+    return (rows / np.linalg.norm(rows, axis=1, keepdims=True)).astype(np.float32)
+
+
+def neighbor_scores(table: NeighborTable, user_ids: list) -> dict:
+    # Compared by score: users with equal scores may be listed in either order
+    return {user_id: [round(item["score"], 5) for item in table.get(user_id, K)] for user_id in user_ids}
+
+
+def test_incremental_updates_match_a_full_rebuild(tmp_path):
+    rng = np.random.default_rng(7)
+    matrix = random_rows(rng, 60)
+    ids = [f"user-{index}" for index in range(60)]
+    table = NeighborTable.build(ids[:40], matrix[:40], K)
+
+    # New users arrive one at a time, and existing users' vectors change, some to copies of others'
+    for index in range(40, 60):
+        table.update_user(ids[index], matrix[:index + 1], ids[:index + 1])
+    for step in range(120):
+        user = int(rng.integers(len(ids)))
+        matrix[user] = matrix[int(rng.integers(len(ids)))] if step % 4 == 0 else random_rows(rng, 1)[0]
+        table.update_user(ids[user], matrix, ids)
+
+    rebuilt = NeighborTable.build(ids, matrix, K)
+    assert neighbor_scores(table, ids) == neighbor_scores(rebuilt, ids)
+
+    table.save(str(tmp_path / "neighbors.npz"))
+    loaded = NeighborTable.load(str(tmp_path / "neighbors.npz"))
+    assert loaded.ids == ids
+    assert neighbor_scores(loaded, ids) == neighbor_scores(rebuilt, ids)
+
+
+def test_dropping_a_user_also_drops_the_rows_that_list_them():
+    matrix = np.eye(4, dtype=np.float32)
+    matrix[1] = matrix[0] + matrix[1]
+    matrix[2] = matrix[2] + matrix[3]
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    ids = ["a", "b", "c", "d"]
+    table = NeighborTable.build(ids, matrix, K)
+    assert [item["userId"] for item in table.get("b", K)] == ["a"]
+
+    table.drop_users(["a"])
+
+    assert table.get("a", K) is None
+    assert table.get("b", K) is None
+    assert [item["userId"] for item in table.get("c", K)] == ["d"]
@@ -0,0 +1,34 @@
+from services.recommendation_cache import RecommendationCache
+
+
+def results(*user_ids) -> list:
+    return [{"userId": user_id, "score": 1.0} for user_id in user_ids]
+
+
+def test_invalidating_a_user_drops_every_entry_that_lists_them():
+    cache = RecommendationCache(max_size=10, ttl_seconds=60)
+    cache.put("a", 2, results("b", "c"), complete=False)
+    cache.put("b", 2, results("c", "d"), complete=False)
+    cache.put("d", 2, results("a", "e"), complete=False)
+
+    cache.invalidate("c")
+
+    assert cache.get("a", 2) is None
+    assert cache.get("b", 2) is None
+    assert cache.get("d", 2) == results("a", "e")
+
+
+def test_replaced_and_evicted_entries_stop_being_invalidated_through_their_old_results():
+    cache = RecommendationCache(max_size=2, ttl_seconds=60)
+    cache.put("a", 1, results("b"), complete=False)
+    cache.put("a", 2, results("c", "d"), complete=False)
+    cache.put("x", 1, results("y"), complete=False)
+    assert cache.get("a", 2) == results("c", "d")
+    cache.put("z", 1, results("y"), complete=False)
+
+    # "a" no longer lists "b", and "x" was evicted
+    cache.invalidate("b")
+    assert cache.get("a", 2) == results("c", "d")
+    cache.invalidate("y")
+    assert len(cache) == 1
+    assert cache._listed_in == {"c": {"a"}, "d": {"a"}}
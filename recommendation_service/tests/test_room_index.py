@@ -0,0 +1,27 @@
+import numpy as np
+
+from core.embedding import Projection
+from core.vectorization import SparseVector
+from services.room_index import RoomIndex
+from services.local_vector_index import LocalVectorIndex
+
+
+def test_embedded_rooms_rank_against_embeddings_with_zero_dimensions(tmp_path):
+    projection = Projection.random(16, seed=3)
+    index = LocalVectorIndex(str(tmp_path / "user_vectors.npz"), projection)
+    # A single sparse position lands on only a few of the 16 dimensions
+    taste = SparseVector.from_dict({7: 1.0})
+    assert np.count_nonzero(projection.embed(taste)) < projection.dim
+    index.upsert_user_vector("user-1", taste)
+
+    user_vector = index.fetch_user_vectors(["user-1"])["user-1"]
+    assert user_vector.indices.tolist() == list(range(projection.dim))
+
+    rooms = RoomIndex(projection)
+    positions = np.arange(projection.dim, dtype=np.uint32)
+    rooms.upsert({"roomId": "same"}, SparseVector(positions, projection.embed(taste)))
+    rooms.upsert({"roomId": "other"}, SparseVector(positions, projection.embed(SparseVector.from_dict({9000: 1.0}))))
+
+    ranked = rooms.recommend(user_vector, 5)
+    assert ranked[0]["roomId"] == "same"
+    assert ranked[0]["score"] > 0.99
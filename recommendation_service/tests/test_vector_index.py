@@ -0,0 +1,60 @@
+import os
+import sys
+import threading
+import subprocess
+
+from conftest import SERVICE_DIR
+from core.embedding import Projection
+from core.vectorization import SparseVector
+from services.local_vector_index import LocalVectorIndex
+
+
+def test_local_backend_imports_on_its_own():
+    # A fresh interpreter, so nothing has imported services.vector_index first
+    result = subprocess.run(
+        [sys.executable, "-c", "import services.local_vector_index"],
+        cwd=SERVICE_DIR, env=os.environ.copy(), capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def _embedding_index(path):
+    return LocalVectorIndex(str(path), Projection.random(16, seed=3))
+
+
+def _vector(position):
+    return SparseVector.from_dict({position: 1.0})
+
+
+def test_two_writers_keep_each_others_saved_writes(tmp_path):
+    path = tmp_path / "user_vectors.npz"
+    worker, backfill = _embedding_index(path), _embedding_index(path)
+    worker.warm_up()
+    backfill.warm_up()
+
+    worker.upsert_user_vector("from-worker", _vector(1))
+    worker.flush()
+    # The backfill read the file before the worker saved; it picks that save up before writing
+    backfill.upsert_user_vector("from-backfill", _vector(2))
+    backfill.flush()
+    worker.upsert_user_vector("from-worker-2", _vector(3))
+    worker.flush()
+
+    assert sorted(_embedding_index(path).list_user_ids()) == ["from-backfill", "from-worker", "from-worker-2"]
+
+
+def test_a_writer_waits_for_unsaved_writes_of_another(tmp_path):
+    path = tmp_path / "user_vectors.npz"
+    worker, backfill = _embedding_index(path), _embedding_index(path)
+    worker.upsert_user_vector("from-worker", _vector(1))
+
+    writer = threading.Thread(target=backfill.upsert_user_vector, args=("from-backfill", _vector(2)))
+    writer.start()
+    writer.join(timeout=0.5)
+    assert writer.is_alive(), "the second writer must wait while the first has unsaved writes"
+
+    worker.flush()
+    writer.join(timeout=5)
+    assert not writer.is_alive()
+    backfill.flush()
+    assert sorted(_embedding_index(path).list_user_ids()) == ["from-backfill", "from-worker"]
@@ -0,0 +1,33 @@
+import asyncio
+
+from services.mongo_client import get_async_collection, get_collection, GENRE_VOCAB_COLLECTION
+from services.vocabulary_service import LRUCache, _resolve_indices
+
+
+def test_concurrent_bulk_resolution_agrees_on_one_index_per_term():
+    names = [f"concurrent-genre-{index}" for index in range(30)]
+    # Overlapping batches, as several worker processes would see them
+    batches = [names[start:start + 15] for start in range(0, 16, 3)]
+
+    async def resolve(batch: list) -> dict:
+        collection = get_async_collection(GENRE_VOCAB_COLLECTION)
+        # A round trip per call, so the resolutions interleave between lookup and insert
+        collection.latency = 0.001
+        # A cache per call, like separate processes: none of them can see the others' inserts
+        return await _resolve_indices(
+            collection, "genre", "name", "genre_index", LRUCache(100), {name: {"name": name} for name in batch}
+        )
+
+    async def resolve_all() -> list:
+        return await asyncio.gather(*(resolve(batch) for batch in batches))
+
+    results = asyncio.run(resolve_all())
+
+    stored = {
+        doc["name"]: doc["index"]
+        for doc in get_collection(GENRE_VOCAB_COLLECTION).find({"name": {"$in": names}}, {"name": 1, "index": 1})
+    }
+    assert sorted(stored) == sorted(names)
+    assert len(set(stored.values())) == len(names)
+    for batch, resolved in zip(batches, results):
+        assert resolved == {name: stored[name] for name in batch}
@@ -0,0 +1,85 @@
+import json
+
+import numpy as np
+import pytest
+
+import worker
+from benchmarks.standins import InMemoryChannel
+from services.metrics import WORKER_MESSAGES
+
+EMPTY_TASTE = {"topArtists": [], "topGenres": [], "topTracks": []}
+
+
+def message_counts() -> dict:
+    return {key[0]: value for key, value in WORKER_MESSAGES._values.items()}
+
+
+@pytest.mark.parametrize("process", [
+    lambda payload: worker.process_message_payload(payload),
+    lambda payload: worker.process_message_batch([payload]),
+])
+def test_empty_vectors_are_skipped_the_same_way_on_every_path(process):
+    before = message_counts()
+    process({"userId": "empty-taste", "musicTaste": EMPTY_TASTE})
+    after = message_counts()
+
+    changed = {result: after[result] - before.get(result, 0) for result in after if after[result] != before.get(result, 0)}
+    assert changed == {"empty": 1}
+    assert "empty-taste" not in worker.vector_index.fetch_user_vectors(["empty-taste"])
+
+
+def taste(genre: str) -> dict:
+    return {"topArtists": [], "topGenres": [genre], "topTracks": []}
+
+
+class RecordingChannel(InMemoryChannel):
+    """Records the upserts, invalidations and acks in the order they happen."""
+    def __init__(self, events: list):
+        super().__init__()
+        self.events = events
+
+    def basic_publish(self, exchange: str, routing_key: str, body, properties=None):
+        super().basic_publish(exchange, routing_key, body, properties)
+        self.events.append(("invalidate", sorted(json.loads(body)["userIds"])))
+
+    def basic_ack(self, delivery_tag: int, multiple: bool = False):
+        super().basic_ack(delivery_tag, multiple)
+        self.events.append(("ack", delivery_tag, multiple))
+
+
+def test_batches_keep_each_users_latest_taste_and_are_acked_after_they_are_written(monkeypatch):
+    monkeypatch.setattr(worker, "WORKER_BATCH_SIZE", 4)
+    monkeypatch.setattr(worker, "WORKER_BATCH_WINDOW_SECONDS", 0.05)
+    events = []
+    upsert = worker.vector_index.upsert_user_vectors
+    monkeypatch.setattr(
+        worker.vector_index, "upsert_user_vectors",
+        lambda items: events.append(("upsert", sorted(user_id for user_id, _ in items))) or upsert(items)
+    )
+    channel = RecordingChannel(events)
+    messages = [
+        {"userId": "batch-a", "musicTaste": taste("old genre")},
+        {"userId": "batch-b", "musicTaste": taste("b genre")},
+        {"userId": "batch-a", "musicTaste": taste("new genre")},
+        "not json",
+        {"userId": "batch-c", "musicTaste": taste("c genre")},
+    ]
+    for message in messages:
+        channel.enqueue(message.encode() if isinstance(message, str) else json.dumps(message).encode())
+
+    # Returns once every message has been acknowledged
+    worker.consume_in_batches(channel)
+
+    # Two updates for batch-a in one batch: only the newer one is written
+    assert events == [
+        ("upsert", ["batch-a", "batch-b"]),
+        ("invalidate", ["batch-a", "batch-b"]),
+        ("ack", 4, True),
+        ("upsert", ["batch-c"]),
+        ("invalidate", ["batch-c"]),
+        ("ack", 5, True),
+    ]
+    assert len(channel.latencies) == len(messages)
+    worker.process_message_payload({"userId": "batch-reference", "musicTaste": taste("new genre")})
+    stored = worker.vector_index.fetch_user_vectors(["batch-a", "batch-reference"])
+    np.testing.assert_array_equal(stored["batch-a"].values, stored["batch-reference"].values)
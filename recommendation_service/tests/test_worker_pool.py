@@ -0,0 +1,126 @@
+import os
+import json
+import signal
+from collections import Counter, defaultdict
+
+import pytest
+
+import worker_pool
+from benchmarks.standins import InMemoryChannel
+from core.sharding import ConsistentHashRing
+from services.metrics import WORKER_MESSAGES, WORKER_SHARD_RESTARTS
+
+BATCH_SIZE = 4
+
+
+def crashing_shard(shard, inbox, outbox, in_flight):
+    """
+    Runs the real shard loop in the child process with the work faked out:
+    a batch containing a message marked 'crash' kills the process abruptly, as
+    does one marked 'crashOnce' the first time. Reports "shard/userId/seq" for
+    every message it processes instead of the upserted userIds.
+    """
+    def process(payloads):
+        for payload in payloads:
+            if payload.get("crash"):
+                os._exit(3)
+            if payload.get("crashOnce") and not os.path.exists(payload["crashOnce"]):
+                open(payload["crashOnce"], "w").close()
+                os._exit(3)
+        return [f"{shard}/{payload['userId']}/{payload.get('seq')}" for payload in payloads]
+
+    worker_pool.warm_up = lambda: None
+    worker_pool.flush_all = lambda: None
+    worker_pool.process_message_batch = process
+    worker_pool.WORKER_METRICS_PORT = 0
+    worker_pool.WORKER_BATCH_SIZE = BATCH_SIZE
+    worker_pool.WORKER_BATCH_WINDOW_SECONDS = 0.2
+    worker_pool.run_shard(shard, inbox, outbox, in_flight)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(worker_pool, "run_shard", crashing_shard)
+    # The fake shards write no files, so several processes are fine with the local backend
+    monkeypatch.setattr(worker_pool, "VECTOR_INDEX_BACKEND", "pinecone")
+    monkeypatch.setattr(worker_pool, "WORKER_RESTART_BACKOFF_SECONDS", 0.0)
+    monkeypatch.setattr(worker_pool, "WORKER_MAX_DELIVERY_ATTEMPTS", 2)
+    # run() installs its own stop handlers
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGINT, signal.SIGTERM)}
+    pools = []
+    yield lambda processes: pools.append(worker_pool.ShardedWorkerPool(processes)) or pools[-1]
+    for started in pools:
+        started.stop()
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+def run_messages(pool, payloads: list) -> InMemoryChannel:
+    channel = InMemoryChannel()
+    for payload in payloads:
+        channel.enqueue(json.dumps(payload).encode())
+    # Returns once every message has been acknowledged or rejected
+    pool.run(channel)
+    return channel
+
+
+def processed_by_user(channel: InMemoryChannel) -> dict:
+    """Maps each userId to the (shard, seq) of its processed messages, in the order they were reported."""
+    processed = defaultdict(list)
+    for _, _, body in channel.published:
+        for report in json.loads(body)["userIds"]:
+            shard, user_id, seq = report.split("/")
+            processed[user_id].append((int(shard), int(seq)))
+    return processed
+
+
+def test_the_ring_is_stable_balanced_and_moves_few_keys_when_a_shard_is_added():
+    keys = [f"{index:024x}" for index in range(20000)]
+    ring, same_ring, bigger_ring = ConsistentHashRing(4), ConsistentHashRing(4), ConsistentHashRing(5)
+    four = [ring.shard_for(key) for key in keys]
+    five = [bigger_ring.shard_for(key) for key in keys]
+
+    assert four == [same_ring.shard_for(key) for key in keys]
+    counts = Counter(four)
+    assert sorted(counts) == [0, 1, 2, 3]
+    assert max(counts.values()) < 1.5 * min(counts.values())
+    moved = [after for before, after in zip(four, five) if before != after]
+    # Ideally 1/5 of the keys, all of them to the new shard
+    assert len(moved) < 0.3 * len(keys)
+    assert set(moved) == {4}
+
+
+def test_messages_go_to_their_users_shard_in_order_and_survive_a_restart(pool, tmp_path):
+    user_ids = [f"user-{index}" for index in range(12)]
+    payloads = [{"userId": user_ids[seq % len(user_ids)], "seq": seq} for seq in range(60)]
+    payloads[25]["crashOnce"] = str(tmp_path / "crashed")
+    workers = pool(3)
+    restarts_before = sum(WORKER_SHARD_RESTARTS._values.values())
+
+    channel = run_messages(workers, payloads)
+
+    assert channel.rejected == []
+    assert len(channel.latencies) == len(payloads)
+    assert sum(WORKER_SHARD_RESTARTS._values.values()) - restarts_before == 1
+    processed = processed_by_user(channel)
+    for user_id in user_ids:
+        expected = [payload["seq"] for payload in payloads if payload["userId"] == user_id]
+        shards = {shard for shard, _ in processed[user_id]}
+        assert shards == {workers.ring.shard_for(user_id)}
+        # A message the dead process finished may be reported again after the restart, but
+        # every message is first processed in publish order
+        assert list(dict.fromkeys(seq for _, seq in processed[user_id])) == expected
+
+
+def test_a_message_that_keeps_crashing_its_shard_is_rejected(pool):
+    payloads = [{"userId": f"user-{index}", "crash": index == 2} for index in range(8)]
+    rejected_before = WORKER_MESSAGES._values.get(("rejected",), 0)
+    restarts_before = WORKER_SHARD_RESTARTS._values.get(("0",), 0)
+
+    channel = run_messages(pool(1), payloads)
+
+    # Its batchmates were retried one at a time and went through; only the bad message is dropped
+    assert [json.loads(body) for body in channel.rejected] == [payloads[2]]
+    assert len(channel.latencies) == len(payloads) - 1
+    assert WORKER_MESSAGES._values.get(("rejected",), 0) - rejected_before == 1
+    assert WORKER_SHARD_RESTARTS._values.get(("0",), 0) - restarts_before == 2
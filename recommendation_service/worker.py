@@ -1,86 +1,460 @@
 import os
 import pika
+import aio_pika
 import json
+import time
 import asyncio
 from dotenv import load_dotenv
 
 # Import the core components we've built
-from core.vectorization import create_user_vector
-from services.pinecone_service import pinecone_service
+from core.vectorization import resolve_vocab_indices, build_user_vectors
+from services.vector_index import vector_index
+from services.recommendation_cache import publish_vector_updates, INVALIDATION_ROUTING_KEY
+from services.neighbor_table import neighbor_table
+from services.lifecycle import warm_up
+from services.taste_state import vectorize_changed, filter_changed, new_states, save_states
+from services.logging_config import get_logger
+from services.metrics import (
+    WORKER_MESSAGES, WORKER_BATCH_MESSAGES, WORKER_QUEUE_LAG_SECONDS, WORKER_IN_FLIGHT,
+    message_lag_seconds, start_metrics_server,
+)
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = get_logger(__name__)
+
 # --- RabbitMQ Configuration ---
 RABBITMQ_URL = os.getenv("RABBITMQ_URL")
 EXCHANGE_NAME = 'rhythm_exchange'
 QUEUE_NAME = 'user_taste_queue'
 ROUTING_KEY = 'user.taste.updated'
 
+# --- Batching Configuration ---
+# With a batch size above 1 the worker prefetches that many messages and
+# processes them together; 1 keeps the one-message-at-a-time behaviour.
+WORKER_BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", 1))
+# A partial batch is flushed once its oldest message has waited this long.
+WORKER_BATCH_WINDOW_SECONDS = float(os.getenv("WORKER_BATCH_WINDOW_SECONDS", 0.5))
+
+# --- Async Pipeline Configuration ---
+# "blocking" consumes with pika (one message or one batch at a time);
+# "async" runs the concurrent asyncio pipeline built on aio-pika.
+WORKER_MODE = os.getenv("WORKER_MODE", "blocking").lower()
+# Maximum number of messages being processed at once (also the prefetch count)
+WORKER_MAX_IN_FLIGHT = int(os.getenv("WORKER_MAX_IN_FLIGHT", 32))
+# Per-stage concurrency limits
+WORKER_VOCAB_CONCURRENCY = int(os.getenv("WORKER_VOCAB_CONCURRENCY", 8))
+WORKER_VECTORIZE_CONCURRENCY = int(os.getenv("WORKER_VECTORIZE_CONCURRENCY", 4))
+WORKER_UPSERT_CONCURRENCY = int(os.getenv("WORKER_UPSERT_CONCURRENCY", 8))
+
+# How often (in seconds) an idle worker checks for buffered writes that are due to be saved
+FLUSH_CHECK_INTERVAL_SECONDS = 1.0
+
+# One long-lived event loop for the whole process. The async Mongo client binds
+# to the loop that first uses it, and creating a loop per message is wasteful.
+event_loop = asyncio.new_event_loop()
+
+def refresh_neighbor_table(user_ids: list):
+    """
+    Keeps the precomputed neighbor table (if enabled) in step with the index.
+    """
+    if neighbor_table is not None:
+        neighbor_table.refresh_users(user_ids, vector_index)
+
+def flush_all():
+    """
+    Makes sure buffered writes (local backend, neighbor table) reach disk.
+    """
+    vector_index.flush()
+    if neighbor_table is not None:
+        neighbor_table.flush()
+
+def flush_due():
+    """
+    Persists buffered writes whose save interval has passed. The worker calls
+    this while idle too, so the last writes of a burst don't wait for the next message.
+    """
+    vector_index.flush_if_due()
+    if neighbor_table is not None:
+        neighbor_table.flush_if_due()
+
+def record_ack(lag_seconds):
+    """Records the queue lag of a message that was just acknowledged, if it carried a timestamp."""
+    if lag_seconds is not None:
+        WORKER_QUEUE_LAG_SECONDS.observe(lag_seconds)
+
+def skip_if_empty(user_id: str, user_vector) -> bool:
+    """
+    Tastes with nothing the vectorizer knows produce an empty vector, which no
+    backend can store. Every processing path logs and counts them the same way.
+
+    Returns:
+        True if the vector is empty and the user must be skipped.
+    """
+    if user_vector.nnz > 0:
+        return False
+    logger.warning("Taste produced an empty vector. Skipping.", extra={"userId": user_id})
+    WORKER_MESSAGES.inc(result="empty")
+    return True
+
 def process_message_payload(payload: dict):
     """
     The main logic for processing a message.
     This function is called from the RabbitMQ callback.
+
+    Returns:
+        The userId whose vector was upserted, or None if nothing was written
+        (including when the taste is unchanged since the user's last update).
     """
-    print(" [x] Processing message payload...")
+    user_id = None
     try:
         # 1. Extract necessary data from the message payload
         user_id = payload.get("userId")
         music_taste = payload.get("musicTaste")
 
         if not user_id or not music_taste:
-            print(" [!] Invalid message format. Missing userId or musicTaste. Skipping.")
+            logger.warning("Invalid message format. Missing userId or musicTaste. Skipping.")
+            WORKER_MESSAGES.inc(result="invalid")
             return
 
-        # 2. Run the asynchronous vectorization function
-        # We use asyncio.run() to execute our async function in this sync callback
-        user_vector = asyncio.run(create_user_vector(music_taste))
+        # 2. Run the asynchronous vectorization function, unless the taste is unchanged
+        # We reuse the worker's event loop to execute our async function in this sync callback
+        user_vectors, states = event_loop.run_until_complete(vectorize_changed({user_id: music_taste}))
+        if user_id not in user_vectors:
+            logger.debug("Taste unchanged since the last update. Skipping.", extra={"userId": user_id})
+            WORKER_MESSAGES.inc(result="unchanged")
+            return None
+        if skip_if_empty(user_id, user_vectors[user_id]):
+            return None
+
+        # 3. Upsert the resulting vector to the configured vector index
+        vector_index.upsert_user_vector(user_id=user_id, vector=user_vectors[user_id])
+        refresh_neighbor_table([user_id])
+        # Remember what was upserted, so an identical taste is skipped next time
+        event_loop.run_until_complete(save_states(states))
 
-        # 3. Upsert the resulting vector to Pinecone using our service
-        pinecone_service.upsert_user_vector(user_id=user_id, vector=user_vector)
-        
-        print(f" [✔] Successfully processed and upserted vector for user: {user_id}")
+        logger.debug("Processed and upserted vector", extra={"userId": user_id})
+        WORKER_MESSAGES.inc(result="processed")
+        return user_id
 
     except Exception as e:
-        print(f" [!] An error occurred while processing message for user {user_id}: {e}")
+        logger.error("Error while processing message", extra={"userId": user_id, "error": str(e)})
+        WORKER_MESSAGES.inc(result="failed")
         # In a production system, you might want to re-queue the message or send it to a dead-letter queue.
         # For now, we'll just log the error.
+        return None
+
+def coalesce_payloads(payloads: list) -> dict:
+    """
+    Keeps only the newest taste for every user in a batch.
+    Messages arrive in publish order, so a later update for a user replaces an earlier one.
+
+    Returns:
+        A dict mapping each userId to its latest musicTaste.
+    """
+    latest = {}
+    for payload in payloads:
+        user_id = payload.get("userId")
+        music_taste = payload.get("musicTaste")
+        if not user_id or not music_taste:
+            logger.warning("Invalid message format. Missing userId or musicTaste. Skipping.")
+            WORKER_MESSAGES.inc(result="invalid")
+            continue
+        latest[user_id] = music_taste
+    return latest
+
+def process_message_batch(payloads: list):
+    """
+    Processes a batch of messages: coalesces repeated updates per user, drops
+    users whose taste is unchanged, vectorizes every remaining taste together
+    and sends one bulk upsert.
+
+    Returns:
+        The list of userIds whose vectors were upserted.
+    """
+    WORKER_BATCH_MESSAGES.observe(len(payloads))
+    latest = coalesce_payloads(payloads)
+    if not latest:
+        return []
+    logger.debug("Processing batch", extra={"messages": len(payloads), "users": len(latest)})
+
+    try:
+        user_vectors, states = event_loop.run_until_complete(vectorize_changed(latest))
+
+        items = []
+        for user_id, user_vector in user_vectors.items():
+            if not skip_if_empty(user_id, user_vector):
+                items.append((user_id, user_vector))
+
+        if items:
+            vector_index.upsert_user_vectors(items)
+            refresh_neighbor_table([user_id for user_id, _ in items])
+            event_loop.run_until_complete(save_states({user_id: states[user_id] for user_id, _ in items}))
+        unchanged = len(latest) - len(user_vectors)
+        logger.debug("Processed and upserted batch", extra={"users": len(items), "unchanged": unchanged})
+        WORKER_MESSAGES.inc(len(items), result="processed")
+        WORKER_MESSAGES.inc(unchanged, result="unchanged")
+        return [user_id for user_id, _ in items]
+
+    except Exception as e:
+        # Fall back to one user at a time so a single bad taste doesn't fail the whole batch
+        logger.warning("Batch processing failed. Retrying users one at a time.", extra={"error": str(e)})
+        upserted = []
+        for user_id, music_taste in latest.items():
+            if process_message_payload({"userId": user_id, "musicTaste": music_taste}):
+                upserted.append(user_id)
+        return upserted
+
+def consume_in_batches(channel):
+    """
+    Consumes the queue in micro-batches. A batch is flushed once it holds
+    WORKER_BATCH_SIZE messages or its oldest message has waited
+    WORKER_BATCH_WINDOW_SECONDS, and is then acknowledged with a single ack.
+    """
+    channel.basic_qos(prefetch_count=WORKER_BATCH_SIZE)
+
+    batch = []
+    lags = []
+    last_delivery_tag = None
+    deadline = None
+
+    # consume() yields (None, None, None) after the window passes with no new message,
+    # which is what lets a partial batch be flushed during quiet periods.
+    for method, properties, body in channel.consume(QUEUE_NAME, inactivity_timeout=WORKER_BATCH_WINDOW_SECONDS):
+        if method is not None:
+            try:
+                batch.append(json.loads(body))
+            except json.JSONDecodeError:
+                logger.warning("Received a message that is not valid JSON. Skipping.")
+                WORKER_MESSAGES.inc(result="invalid")
+            # Remember when each message was published; its lag is measured when it's acked
+            lags.append((time.monotonic(), message_lag_seconds(properties.headers, properties.timestamp)))
+            last_delivery_tag = method.delivery_tag
+            if deadline is None:
+                deadline = time.monotonic() + WORKER_BATCH_WINDOW_SECONDS
+
+        if last_delivery_tag is None:
+            flush_due()
+            continue
+        if len(batch) >= WORKER_BATCH_SIZE or time.monotonic() >= deadline:
+            upserted = process_message_batch(batch)
+            # Let the API drop its cached recommendations for these users
+            publish_vector_updates(channel, upserted)
+            # Acknowledge every message of the batch at once
+            channel.basic_ack(delivery_tag=last_delivery_tag, multiple=True)
+            acked_at = time.monotonic()
+            for received_at, lag in lags:
+                record_ack(None if lag is None else lag + acked_at - received_at)
+            batch = []
+            lags = []
+            last_delivery_tag = None
+            deadline = None
+
+class AsyncPipeline:
+    """
+    Processes messages concurrently on one long-lived event loop.
+
+    Each message goes through three stages - vocabulary resolution (Mongo),
+    vectorization (CPU) and index upsert - and each stage has its own
+    concurrency limit, so a slow Mongo or index call only holds up its own
+    stage instead of the whole consumer. Messages for the same user are still
+    applied in the order they arrived.
+    """
+    def __init__(self):
+        self.in_flight = asyncio.Semaphore(WORKER_MAX_IN_FLIGHT)
+        self.vocab_stage = asyncio.Semaphore(WORKER_VOCAB_CONCURRENCY)
+        self.vectorize_stage = asyncio.Semaphore(WORKER_VECTORIZE_CONCURRENCY)
+        self.upsert_stage = asyncio.Semaphore(WORKER_UPSERT_CONCURRENCY)
+        self.user_locks = {}
+        self.tasks = set()
+        self.exchange = None
+
+    async def process_payload(self, payload: dict):
+        user_id = payload.get("userId")
+        music_taste = payload.get("musicTaste")
+        if not user_id or not music_taste:
+            logger.warning("Invalid message format. Missing userId or musicTaste. Skipping.")
+            WORKER_MESSAGES.inc(result="invalid")
+            return
+
+        # Serialize updates for the same user so an older taste can never overwrite a newer one.
+        # Each entry is [lock, number of messages holding or waiting for it].
+        entry = self.user_locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self.vocab_stage:
+                    changes = await filter_changed({user_id: music_taste})
+                    if not changes.tastes:
+                        logger.debug("Taste unchanged since the last update. Skipping.", extra={"userId": user_id})
+                        WORKER_MESSAGES.inc(result="unchanged")
+                        return
+                    vocab_indices = await resolve_vocab_indices([music_taste], known=changes.known)
+                async with self.vectorize_stage:
+                    user_vectors = await asyncio.to_thread(build_user_vectors, [music_taste], vocab_indices)
+                if skip_if_empty(user_id, user_vectors[0]):
+                    return
+                async with self.upsert_stage:
+                    await asyncio.to_thread(vector_index.upsert_user_vector, user_id, user_vectors[0])
+                    await asyncio.to_thread(refresh_neighbor_table, [user_id])
+                    await save_states(new_states(changes, vocab_indices, [user_id]))
+                # Let the API drop its cached recommendations for this user
+                await self.exchange.publish(
+                    aio_pika.Message(body=json.dumps({"userIds": [user_id]}).encode()),
+                    routing_key=INVALIDATION_ROUTING_KEY
+                )
+            logger.debug("Processed and upserted vector", extra={"userId": user_id})
+            WORKER_MESSAGES.inc(result="processed")
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.user_locks[user_id]
+
+    async def handle_message(self, message: aio_pika.abc.AbstractIncomingMessage):
+        WORKER_IN_FLIGHT.inc()
+        lag = message_lag_seconds(message.headers, message.timestamp)
+        received_at = time.monotonic()
+        # The message is acknowledged when the block exits, like the blocking consumer does
+        try:
+            async with message.process(ignore_processed=True):
+                try:
+                    await self.process_payload(json.loads(message.body))
+                except Exception as e:
+                    logger.error("Error while processing message", extra={"error": str(e)})
+                    WORKER_MESSAGES.inc(result="failed")
+                finally:
+                    self.in_flight.release()
+                    WORKER_IN_FLIGHT.dec()
+        finally:
+            record_ack(None if lag is None else lag + time.monotonic() - received_at)
+
+    async def on_message(self, message: aio_pika.abc.AbstractIncomingMessage):
+        await self.in_flight.acquire()
+        task = asyncio.create_task(self.handle_message(message))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def flush_periodically(self):
+        """Saves buffered writes on a timer, so they reach readers even when the queue goes quiet."""
+        while True:
+            await asyncio.sleep(FLUSH_CHECK_INTERVAL_SECONDS)
+            await asyncio.to_thread(flush_due)
+
+    async def run(self):
+        connection = await aio_pika.connect_robust(RABBITMQ_URL)
+        async with connection:
+            channel = await connection.channel()
+            await channel.set_qos(prefetch_count=WORKER_MAX_IN_FLIGHT)
+
+            # Ensure the exchange and queue exist and are bound together
+            self.exchange = await channel.declare_exchange(EXCHANGE_NAME, aio_pika.ExchangeType.DIRECT, durable=True)
+            queue = await channel.declare_queue(QUEUE_NAME, durable=True)
+            await queue.bind(self.exchange, routing_key=ROUTING_KEY)
+
+            await queue.consume(self.on_message)
+            logger.info("Async worker is waiting for messages. To exit press CTRL+C", extra={"maxInFlight": WORKER_MAX_IN_FLIGHT})
+            flusher = asyncio.create_task(self.flush_periodically())
+            try:
+                await asyncio.Future()
+            finally:
+                flusher.cancel()
+                # Let the messages already being processed finish before disconnecting
+                if self.tasks:
+                    await asyncio.gather(*self.tasks, return_exceptions=True)
+
+def main_async():
+    """
+    Runs the concurrent asyncio pipeline on the worker's event loop.
+    """
+    logger.info("Starting Recommendation Worker (async pipeline)")
+    try:
+        event_loop.run_until_complete(AsyncPipeline().run())
+    except aio_pika.exceptions.AMQPConnectionError as e:
+        logger.error("Could not connect to RabbitMQ. Please ensure it is running and the URL is correct.", extra={"error": str(e)})
+    except KeyboardInterrupt:
+        logger.info("Worker shutting down.")
+    except Exception as e:
+        logger.exception("An unexpected error occurred", extra={"error": str(e)})
+    finally:
+        # Make sure buffered writes reach disk before exiting
+        flush_all()
+
+def declare_queue(channel):
+    """
+    Ensures the exchange and queue exist and are bound together.
+    """
+    channel.exchange_declare(exchange=EXCHANGE_NAME, exchange_type='direct', durable=True)
+    channel.queue_declare(queue=QUEUE_NAME, durable=True)
+    channel.queue_bind(exchange=EXCHANGE_NAME, queue=QUEUE_NAME, routing_key=ROUTING_KEY)
 
 def main():
     """
     Connects to RabbitMQ and starts consuming messages from the queue.
     """
-    print("--- Starting Recommendation Worker ---")
+    logger.info("Starting Recommendation Worker")
     try:
         # Establish a connection to RabbitMQ
         connection = pika.BlockingConnection(pika.URLParameters(RABBITMQ_URL))
         channel = connection.channel()
 
-        # Ensure the exchange and queue exist and are bound together
-        channel.exchange_declare(exchange=EXCHANGE_NAME, exchange_type='direct', durable=True)
-        channel.queue_declare(queue=QUEUE_NAME, durable=True)
-        channel.queue_bind(exchange=EXCHANGE_NAME, queue=QUEUE_NAME, routing_key=ROUTING_KEY)
+        declare_queue(channel)
+
+        if WORKER_BATCH_SIZE > 1:
+            logger.info("Worker is consuming in batches. To exit press CTRL+C", extra={"batchSize": WORKER_BATCH_SIZE})
+            consume_in_batches(channel)
+            return
 
         # Define the callback function for when a message is received
         def callback(ch, method, properties, body):
-            print("\n [x] Received new message from RabbitMQ.")
-            payload = json.loads(body)
-            process_message_payload(payload)
+            lag = message_lag_seconds(properties.headers, properties.timestamp)
+            received_at = time.monotonic()
+            try:
+                payload = json.loads(body)
+            except json.JSONDecodeError:
+                payload = None
+            if not isinstance(payload, dict):
+                # Retrying can't fix a malformed message, so drop it instead of stopping the consumer
+                logger.warning("Received a message that is not a JSON object. Skipping.")
+                WORKER_MESSAGES.inc(result="invalid")
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+                return
+            user_id = process_message_payload(payload)
+            if user_id:
+                # Let the API drop its cached recommendations for this user
+                publish_vector_updates(ch, [user_id])
             # Acknowledge the message to remove it from the queue
             ch.basic_ack(delivery_tag=method.delivery_tag)
+            record_ack(None if lag is None else lag + time.monotonic() - received_at)
+
+        # Save buffered writes on a timer as well, since a quiet queue brings no callbacks
+        def flush_tick():
+            flush_due()
+            connection.call_later(FLUSH_CHECK_INTERVAL_SECONDS, flush_tick)
+        connection.call_later(FLUSH_CHECK_INTERVAL_SECONDS, flush_tick)
 
         # Tell the channel to start consuming messages from the queue
         channel.basic_consume(queue=QUEUE_NAME, on_message_callback=callback)
 
-        print(' [*] Worker is waiting for messages. To exit press CTRL+C')
+        logger.info("Worker is waiting for messages. To exit press CTRL+C")
         channel.start_consuming()
 
     except pika.exceptions.AMQPConnectionError as e:
-        print(f" [!] Could not connect to RabbitMQ. Please ensure it is running and the URL is correct. Error: {e}")
+        logger.error("Could not connect to RabbitMQ. Please ensure it is running and the URL is correct.", extra={"error": str(e)})
     except KeyboardInterrupt:
-        print(' [*] Worker shutting down.')
+        logger.info("Worker shutting down.")
     except Exception as e:
-        print(f" [!] An unexpected error occurred: {e}")
+        logger.exception("An unexpected error occurred", extra={"error": str(e)})
+    finally:
+        # Make sure buffered writes reach disk before exiting
+        flush_all()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # Expose this process's metrics for scraping
+    start_metrics_server()
+    # Connect and load everything up front so the first message isn't slow
+    warm_up()
+    if WORKER_MODE == "async":
+        main_async()
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,350 @@
+"""
+Runs the worker as a supervised pool of processes, so vectorization uses
+every core instead of one.
+
+The supervisor is the only RabbitMQ consumer. It routes every message to one
+of WORKER_PROCESSES shard processes by consistent hashing on its userId, so
+all updates for a user go to the same process and are applied in the order
+they were published, while different users are processed in parallel. A
+message is acknowledged only once its shard has processed it, and the
+supervisor publishes the cache invalidations.
+
+If a shard process dies, the supervisor starts a new one and hands it the
+dead process's unacknowledged messages again, in order. The messages that
+were being processed when it died are retried one at a time, and a message
+that has been in flight through WORKER_MAX_DELIVERY_ATTEMPTS crashes is
+rejected without requeueing, so one bad message can't crash-loop its shard.
+On SIGTERM (or
+CTRL+C) it stops taking new messages, waits up to
+WORKER_DRAIN_TIMEOUT_SECONDS for the shards to finish the ones they have,
+then stops them; anything still unacknowledged is redelivered by RabbitMQ.
+
+Shards process messages like the blocking worker: one at a time, or in
+micro-batches of WORKER_BATCH_SIZE. The number of messages waiting in each
+shard is exported as rhythm_worker_shard_queue_depth on the supervisor's
+metrics port; shard N serves its own metrics on WORKER_METRICS_PORT + 1 + N.
+
+Run with (start.sh does this when WORKER_PROCESSES > 1):
+    python worker_pool.py
+"""
+import os
+import json
+import time
+import queue
+import signal
+import multiprocessing
+
+import pika
+from dotenv import load_dotenv
+
+from core.sharding import ConsistentHashRing
+from services.vector_index import VECTOR_INDEX_BACKEND
+from services.neighbor_table import neighbor_table
+from services.recommendation_cache import publish_vector_updates
+from services.lifecycle import warm_up
+from services.logging_config import get_logger
+from services.metrics import (
+    WORKER_MESSAGES, WORKER_SHARD_QUEUE_DEPTH, WORKER_SHARD_RESTARTS, WORKER_METRICS_PORT,
+    message_lag_seconds, start_metrics_server,
+)
+from worker import (
+    RABBITMQ_URL, QUEUE_NAME, WORKER_BATCH_SIZE, WORKER_BATCH_WINDOW_SECONDS,
+    FLUSH_CHECK_INTERVAL_SECONDS, declare_queue, process_message_payload, process_message_batch, record_ack, flush_all, flush_due,
+)
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# --- Configuration ---
+# Number of shard processes; each user's messages always go to the same one
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", 1))
+# Unacknowledged messages allowed per shard (the prefetch count is this times the number of shards)
+WORKER_SHARD_PREFETCH = int(os.getenv("WORKER_SHARD_PREFETCH", 64))
+# How long shutdown waits for the shards to finish the messages they already have
+WORKER_DRAIN_TIMEOUT_SECONDS = float(os.getenv("WORKER_DRAIN_TIMEOUT_SECONDS", 30))
+# Minimum time between two starts of the same shard, so a crash loop doesn't spin
+WORKER_RESTART_BACKOFF_SECONDS = float(os.getenv("WORKER_RESTART_BACKOFF_SECONDS", 1))
+# How many shard crashes a message may be in flight for before it is rejected (dead-lettered
+# if the queue has a dead-letter exchange, otherwise dropped)
+WORKER_MAX_DELIVERY_ATTEMPTS = int(os.getenv("WORKER_MAX_DELIVERY_ATTEMPTS", 3))
+
+# How often the supervisor checks its children, and how long it waits for a message when idle
+SUPERVISE_INTERVAL_SECONDS = 0.5
+POLL_INTERVAL_SECONDS = 0.01
+
+
+def run_shard(shard: int, inbox, outbox, in_flight):
+    """
+    The body of a shard process. Processes the messages the supervisor routes
+    to it, in the order they arrive, and reports every batch back as
+    (shard, delivery tags, upserted userIds) so the supervisor can acknowledge it.
+    While it processes a batch, 'in_flight' holds the batch's first and last
+    delivery tags, so the supervisor knows which messages a crash happened on.
+    Messages that were in flight when a previous shard process died are
+    processed on their own, so only the one that crashes it is retried again.
+    Returns when the supervisor sends None.
+    """
+    # Shutdown is coordinated by the supervisor: it drains the shard, then sends None
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    if WORKER_METRICS_PORT:
+        start_metrics_server(WORKER_METRICS_PORT + 1 + shard)
+    warm_up()
+
+    stopping = False
+    try:
+        while not stopping:
+            try:
+                item = inbox.get(timeout=FLUSH_CHECK_INTERVAL_SECONDS)
+            except queue.Empty:
+                # Idle: save buffered writes whose interval has passed
+                flush_due()
+                continue
+            if item is None:
+                break
+            batch = [item]
+            # Gather a micro-batch, like consume_in_batches does. Retries come first and go alone.
+            deadline = time.monotonic() + WORKER_BATCH_WINDOW_SECONDS
+            while len(batch) < WORKER_BATCH_SIZE and not batch[0][2]:
+                try:
+                    item = inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            # Written straight to shared memory, so it's accurate even if the process dies abruptly
+            in_flight[:] = [batch[0][0], batch[-1][0]]
+            payloads = [payload for _, payload, _ in batch]
+            if WORKER_BATCH_SIZE > 1:
+                upserted = process_message_batch(payloads)
+            else:
+                upserted = [user_id for user_id in [process_message_payload(payloads[0])] if user_id]
+            outbox.put((shard, [tag for tag, _, _ in batch], upserted))
+            in_flight[:] = [0, 0]
+    finally:
+        # Make sure buffered writes reach disk before exiting
+        flush_all()
+
+
+class Shard:
+    """A shard process, its inbox, and the messages routed to it that are not yet acknowledged."""
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.inbox = None
+        # Delivery tag -> (payload, received at, lag when received, crashes survived), in arrival order
+        self.pending = {}
+        self.started_at = 0.0
+        # The first and last delivery tag of the batch the process is working on; 0, 0 when idle
+        self.in_flight = None
+
+    def update_depth(self):
+        WORKER_SHARD_QUEUE_DEPTH.set(len(self.pending), shard=self.index)
+
+
+class ShardedWorkerPool:
+    """
+    Supervises the shard processes and routes messages to them.
+
+    Args:
+        processes: The number of shard processes.
+    """
+    def __init__(self, processes: int = WORKER_PROCESSES):
+        if processes > 1 and (VECTOR_INDEX_BACKEND == "local" or neighbor_table is not None):
+            # Every process would keep its own copy and overwrite the others' writes on save
+            raise ValueError(
+                "The local vector index and the neighbor table are files with a single writer; "
+                "run one worker process (WORKER_PROCESSES=1) with them."
+            )
+        self.ring = ConsistentHashRing(processes)
+        # Fresh interpreters: children must not inherit the supervisor's sockets or threads
+        self.context = multiprocessing.get_context("spawn")
+        self.outbox = self.context.Queue()
+        self.shards = [Shard(index) for index in range(processes)]
+        self.stopping = False
+        self.next_supervise = 0.0
+
+    def start_shard(self, shard: Shard):
+        """Starts (or restarts) a shard process and hands it the shard's unacknowledged messages."""
+        shard.inbox = self.context.Queue()
+        shard.in_flight = self.context.Array("q", 2)
+        shard.process = self.context.Process(
+            target=run_shard, args=(shard.index, shard.inbox, self.outbox, shard.in_flight), name=f"worker-shard-{shard.index}"
+        )
+        shard.process.start()
+        shard.started_at = time.monotonic()
+        for tag, (payload, _, _, crashes) in shard.pending.items():
+            shard.inbox.put((tag, payload, crashes))
+        shard.update_depth()
+        logger.info("Started shard process", extra={"shard": shard.index, "pid": shard.process.pid, "resent": len(shard.pending)})
+
+    def count_crash(self, channel, shard: Shard):
+        """
+        Charges a shard's death to the batch it was processing, if any, and
+        rejects the messages that have now been in flight for
+        WORKER_MAX_DELIVERY_ATTEMPTS crashes.
+        """
+        first, last = shard.in_flight[:]
+        # Delivery tags grow in arrival order, which is also the order the shard processes them in
+        for tag in [tag for tag in shard.pending if first <= tag <= last]:
+            payload, received_at, lag, crashes = shard.pending[tag]
+            if crashes + 1 < WORKER_MAX_DELIVERY_ATTEMPTS:
+                shard.pending[tag] = (payload, received_at, lag, crashes + 1)
+                continue
+            logger.error(
+                "Message crashed its shard too many times. Rejecting it.",
+                extra={"shard": shard.index, "userId": payload.get("userId"), "attempts": crashes + 1}
+            )
+            WORKER_MESSAGES.inc(result="rejected")
+            del shard.pending[tag]
+            channel.basic_nack(delivery_tag=tag, requeue=False)
+
+    def supervise(self, channel):
+        """Restarts shard processes that died."""
+        now = time.monotonic()
+        if now < self.next_supervise:
+            return
+        self.next_supervise = now + SUPERVISE_INTERVAL_SECONDS
+        for shard in self.shards:
+            if shard.process.is_alive() or now - shard.started_at < WORKER_RESTART_BACKOFF_SECONDS:
+                continue
+            logger.error(
+                "Shard process died. Restarting it.",
+                extra={"shard": shard.index, "exitCode": shard.process.exitcode, "pending": len(shard.pending)}
+            )
+            WORKER_SHARD_RESTARTS.inc(shard=shard.index)
+            shard.process.close()
+            self.count_crash(channel, shard)
+            self.start_shard(shard)
+
+    def dispatch(self, channel, method, properties, body):
+        """Routes one message to the shard that owns its user."""
+        lag = message_lag_seconds(properties.headers, properties.timestamp)
+        try:
+            payload = json.loads(body)
+        except json.JSONDecodeError:
+            payload = None
+        if not isinstance(payload, dict):
+            logger.warning("Received a message that is not a JSON object. Skipping.")
+            WORKER_MESSAGES.inc(result="invalid")
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+            return
+
+        # A message without a userId still goes to a shard, which counts it as invalid
+        shard = self.shards[self.ring.shard_for(str(payload.get("userId") or ""))]
+        shard.pending[method.delivery_tag] = (payload, time.monotonic(), lag, 0)
+        shard.inbox.put((method.delivery_tag, payload, 0))
+        shard.update_depth()
+
+    def collect_results(self, channel, timeout: float = 0.0):
+        """
+        Acknowledges the messages the shards have finished. Waits up to
+        'timeout' seconds for the first result, then takes whatever else is ready.
+        """
+        while True:
+            try:
+                index, tags, upserted = self.outbox.get(timeout=timeout) if timeout else self.outbox.get_nowait()
+            except queue.Empty:
+                return
+            timeout = 0.0
+            shard = self.shards[index]
+            # Let the API drop its cached recommendations for these users
+            publish_vector_updates(channel, upserted)
+            acked_at = time.monotonic()
+            for tag in tags:
+                # A restarted shard may report a message its predecessor already finished
+                entry = shard.pending.pop(tag, None)
+                if entry is None:
+                    continue
+                channel.basic_ack(delivery_tag=tag)
+                _, received_at, lag, _ = entry
+                record_ack(None if lag is None else lag + acked_at - received_at)
+            shard.update_depth()
+
+    def request_stop(self, signum, frame):
+        logger.info("Worker pool received a stop signal. Draining.", extra={"signal": signum})
+        self.stopping = True
+
+    def run(self, channel):
+        """
+        Starts the shards and consumes from the queue until a stop signal,
+        then drains. The caller owns the connection.
+        """
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        for shard in self.shards:
+            self.start_shard(shard)
+
+        channel.basic_qos(prefetch_count=WORKER_SHARD_PREFETCH * len(self.shards))
+        logger.info("Worker pool is waiting for messages. To exit press CTRL+C", extra={"processes": len(self.shards)})
+        # consume() yields (None, None, None) when idle, which is when the shards' results are collected
+        for method, properties, body in channel.consume(QUEUE_NAME, inactivity_timeout=POLL_INTERVAL_SECONDS):
+            if method is not None:
+                self.dispatch(channel, method, properties, body)
+            self.collect_results(channel)
+            self.supervise(channel)
+            if self.stopping:
+                # Stop deliveries; messages buffered but not yet dispatched go back to the queue
+                channel.cancel()
+                break
+        self.drain(channel)
+
+    def drain(self, channel):
+        """Waits for the shards to finish the messages they were given, up to WORKER_DRAIN_TIMEOUT_SECONDS."""
+        deadline = time.monotonic() + WORKER_DRAIN_TIMEOUT_SECONDS
+        while any(shard.pending for shard in self.shards) and time.monotonic() < deadline:
+            self.collect_results(channel, timeout=POLL_INTERVAL_SECONDS * 10)
+            self.supervise(channel)
+        left = sum(len(shard.pending) for shard in self.shards)
+        if left:
+            logger.warning("Drain timed out; unacknowledged messages will be redelivered.", extra={"messages": left})
+
+    def stop(self):
+        """Tells every shard to exit once its inbox is empty and waits for them."""
+        for shard in self.shards:
+            if shard.process is not None and shard.process.is_alive():
+                shard.inbox.put(None)
+        for shard in self.shards:
+            if shard.process is None:
+                continue
+            shard.process.join(WORKER_DRAIN_TIMEOUT_SECONDS)
+            if shard.process.is_alive():
+                logger.warning("Shard process did not exit. Terminating it.", extra={"shard": shard.index})
+                shard.process.terminate()
+                shard.process.join()
+        logger.info("Worker pool stopped.")
+
+
+def main():
+    """
+    Connects to RabbitMQ and runs the pool until it is stopped.
+    """
+    logger.info("Starting Recommendation Worker pool", extra={"processes": WORKER_PROCESSES})
+    pool = None
+    try:
+        pool = ShardedWorkerPool(WORKER_PROCESSES)
+        # Establish a connection to RabbitMQ
+        connection = pika.BlockingConnection(pika.URLParameters(RABBITMQ_URL))
+        channel = connection.channel()
+        declare_queue(channel)
+        pool.run(channel)
+        connection.close()
+
+    except pika.exceptions.AMQPConnectionError as e:
+        logger.error("Could not connect to RabbitMQ. Please ensure it is running and the URL is correct.", extra={"error": str(e)})
+    except Exception as e:
+        logger.exception("An unexpected error occurred", extra={"error": str(e)})
+    finally:
+        if pool is not None:
+            pool.stop()
+
+
+if __name__ == '__main__':
+    # Expose the supervisor's metrics (per-shard queue depth, restarts) for scraping
+    start_metrics_server()
+    main()